@@ -51,27 +51,28 @@ logo = """
 """
 
 
-# these will be used before we wipe out __main__
-import argparse
+# only cheap modules are imported here. pip, six and the other heavier
+# dependencies are imported where they are first needed, so that runs that
+# never install anything don't pay for them
 import atexit
-import fnmatch
-import code
 import imp
-import inspect
-import pip
-from pip.commands.search import SearchCommand
+import json
 import os
 import re
-import six
-import shutil
-import subprocess
 import sys
+import time
 
 
 __version__ = "0.1.3"
 
 
 VENV_ACTIVATED = False
+VENV_TEMPLATE_PENDING = ".pipless-template-pending"
+REQUIREMENTS_STAMP = ".pipless-requirements-stamp"
+CACHE_DIR = os.environ.get(
+    "PIPLESS_CACHE_DIR",
+    os.path.expanduser(os.path.join("~", ".cache", "pipless"))
+)
 
 
 class PiplessException(Exception): pass
@@ -80,12 +81,27 @@ class IgnoreMissingImport(PiplessException): pass
 
 class PipLessMapping(object):
     """A class that loads a pipless mapping file
+
+    If ``compiled_dir`` is set, every mapping file is compiled into a sorted,
+    memory-mapped table (see :mod:`pipless.index`) in that directory the first
+    time it is loaded, and again whenever the mapping file changes. Loading a
+    compiled mapping only maps the table, and lookups are binary searches, so
+    neither depend on the size of the mapping file.
     """
 
-    def __init__(self):
+    # a key that can't be an import name, it holds the path, mtime and size
+    # of the mapping file the table was compiled from
+    SOURCE_KEY = " source"
+
+    def __init__(self, compiled_dir=None):
         """
+        :param str compiled_dir: The directory to save compiled mappings in. Mapping
+            files are parsed into a dict on every load if this is ``None``.
         """
         self.mapping = {}
+        self.compiled_dir = compiled_dir
+        # dicts and compiled tables, in the order they were loaded
+        self._layers = [self.mapping]
 
     def load(self, path):
         """Load a pipless mapping file into this PipLessMapping instance.
@@ -112,6 +128,23 @@ class PipLessMapping(object):
         if not os.path.exists(path):
             return
 
+        if self.compiled_dir is not None:
+            table = self._load_compiled(path)
+            if table is not None:
+                self._layers.append(table)
+                return
+
+        layer = self.mapping if self._layers[-1] is self.mapping else {}
+        for package_name, distro_name in self._parse(path):
+            layer[package_name] = distro_name
+        if layer is not self.mapping:
+            self._layers.append(layer)
+
+    def _parse(self, path):
+        """Yield the ``(package_name, distro_name)`` pairs of the mapping file
+        at ``path``. ``distro_name`` is :class:`IgnoreMissingImport` for ignored
+        package names.
+        """
         with open(path, "rb") as f:
             data = f.read()
 
@@ -134,7 +167,48 @@ class PipLessMapping(object):
                 package_name = parts[0]
                 distro_name = parts[1]
 
-            self.mapping[package_name] = distro_name
+            yield package_name, distro_name
+
+    def _load_compiled(self, path):
+        """Return the compiled table of the mapping file at ``path``,
+        compiling it first if it is missing or out of date. ``None`` is
+        returned if it can't be compiled.
+        """
+        # not hashlib, it (and tempfile, which imports it) would be loaded on
+        # every startup. Two paths with the same crc only recompile each other
+        import binascii
+        from pipless.index import InvalidTableError, SortedTable, write_table
+
+        path = os.path.abspath(path)
+        key = "{:08x}".format(binascii.crc32(path.encode("utf-8")) & 0xffffffff)
+        compiled_path = os.path.join(self.compiled_dir, key + ".map")
+
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        source = "{}:{!r}:{}".format(path, stat.st_mtime, stat.st_size)
+
+        try:
+            table = SortedTable(compiled_path)
+            if table.get(self.SOURCE_KEY) == source:
+                return table
+            table.close()
+        except (IOError, OSError, InvalidTableError):
+            pass
+
+        # an ignored package name is stored with an empty distribution name
+        items = [(self.SOURCE_KEY, source)]
+        for package_name, distro_name in self._parse(path):
+            if distro_name is IgnoreMissingImport:
+                distro_name = ""
+            items.append((package_name, distro_name))
+
+        try:
+            write_table(compiled_path, items)
+            return SortedTable(compiled_path)
+        except (IOError, OSError, InvalidTableError):
+            return None
 
     def get(self, import_name):
         """Return the distribution name from the mapping for
@@ -142,12 +216,292 @@ class PipLessMapping(object):
 
         :param str import_name: The package name to look up the distribution name for
         """
-        res = self.mapping.get(import_name, None)
-        if res == IgnoreMissingImport:
+        res = None
+        # the mapping file loaded last wins
+        for layer in reversed(self._layers):
+            res = layer.get(import_name, None)
+            if res is not None:
+                break
+
+        if res == IgnoreMissingImport or res == "":
             raise IgnoreMissingImport()
         return res
 
 
+class PipLessLookupCache(object):
+    """An on-disk cache of import name -> distribution name lookups that
+    is shared between pipless processes.
+
+    Both positive results (the import name can be installed with a
+    distribution) and negative results (nothing on PyPI matches the import
+    name) are cached, each with their own time-to-live. The cache file is
+    rewritten atomically, so concurrent pipless processes never see a
+    partially-written cache.
+    """
+
+    def __init__(
+            self,
+            path,
+            ttl          = 7 * 24 * 60 * 60,
+            negative_ttl = 24 * 60 * 60,
+            max_entries  = 5000,
+        ):
+        """
+        :param str path: The path of the cache file
+        :param int ttl: The number of seconds a positive lookup is valid for
+        :param int negative_ttl: The number of seconds a negative lookup is valid for
+        :param int max_entries: The maximum number of entries kept in the cache. The
+            oldest entries are evicted first.
+        """
+        self.path         = path
+        self.ttl          = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries  = max_entries
+        self.entries      = self._read()
+
+        import threading
+        self._lock        = threading.Lock()
+
+    def _read(self):
+        """Read the cache file from disk. A missing or corrupt cache file
+        is treated as an empty cache.
+        """
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+        if not isinstance(data, dict):
+            return {}
+        return data
+
+    def _is_fresh(self, entry, now):
+        distro_name, stamp = entry
+        ttl = self.ttl if distro_name is not None else self.negative_ttl
+        return (now - stamp) < ttl
+
+    def get(self, import_name):
+        """Return a ``(hit, distro_name)`` tuple for ``import_name``. ``hit``
+        is ``False`` if no fresh entry exists in the cache. ``distro_name``
+        will be ``None`` for a cached negative lookup.
+
+        :param str import_name: The import name to look up
+        """
+        entry = self.entries.get(import_name, None)
+        if entry is None or not self._is_fresh(entry, time.time()):
+            return False, None
+        return True, entry[0]
+
+    def set(self, import_name, distro_name):
+        """Record the lookup result for ``import_name`` and save the cache.
+        Entries written by other processes since this cache was loaded
+        are merged in before saving.
+
+        :param str import_name: The import name that was looked up
+        :param str distro_name: The distribution name, or ``None`` if it is not on PyPI
+        """
+        import six
+
+        # lookups of different names may finish at the same time
+        with self._lock:
+            now = time.time()
+            entries = self._read()
+            entries[import_name] = [distro_name, now]
+
+            entries = dict(
+                (name, entry) for name, entry in six.iteritems(entries)
+                if self._is_fresh(entry, now)
+            )
+            if len(entries) > self.max_entries:
+                newest = sorted(
+                    six.iteritems(entries),
+                    key     = lambda item: item[1][1],
+                    reverse = True
+                )
+                entries = dict(newest[:self.max_entries])
+
+            self.entries = entries
+            self._write(entries)
+
+    def _write(self, entries):
+        """Atomically replace the cache file with ``entries``
+        """
+        import tempfile
+
+        cache_dir = os.path.dirname(self.path)
+        try:
+            if not os.path.exists(cache_dir):
+                os.makedirs(cache_dir)
+            fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix=".lookups-")
+            with os.fdopen(fd, "w") as f:
+                json.dump(entries, f)
+            os.rename(tmp_path, self.path)
+        except (IOError, OSError):
+            # the cache is only an optimization, never fail because of it
+            pass
+
+
+class PipLessPathCache(object):
+    """Caches the names of the top-level modules that can be found in each
+    ``sys.path`` directory, so that checking if a module is already
+    importable is a set lookup instead of several ``stat`` calls per
+    ``sys.path`` entry.
+
+    A directory's listing is revalidated against the directory's mtime, and
+    can be explicitly invalidated (e.g. after installing into it).
+    """
+
+    def __init__(self):
+        self._listings = {}
+        self._suffixes = sorted(
+            [suffix for suffix, _, _ in imp.get_suffixes()],
+            key     = len,
+            reverse = True
+        )
+
+    def _listing(self, path_entry):
+        """Return ``(module_names, package_candidates)`` for ``path_entry``, or
+        ``None`` if ``path_entry`` is not a plain directory (e.g. a zip file).
+        """
+        try:
+            mtime = os.stat(path_entry).st_mtime
+        except OSError:
+            # a missing sys.path entry can't contain anything
+            return set(), set()
+
+        cached = self._listings.get(path_entry, None)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        if not os.path.isdir(path_entry):
+            listing = None
+        else:
+            module_names = set()
+            package_candidates = set()
+            for filename in os.listdir(path_entry):
+                for suffix in self._suffixes:
+                    if filename.endswith(suffix):
+                        module_names.add(filename[:-len(suffix)])
+                        break
+                else:
+                    if "." not in filename:
+                        package_candidates.add(filename)
+            listing = (module_names, package_candidates)
+
+        self._listings[path_entry] = (mtime, listing)
+        return listing
+
+    def _is_package(self, path_entry, name):
+        pkg_dir = os.path.join(path_entry, name)
+        for suffix in self._suffixes:
+            if os.path.isfile(os.path.join(pkg_dir, "__init__" + suffix)):
+                return True
+        return False
+
+    def contains(self, name, path_entries=None):
+        """Check if the top-level module ``name`` can be found.
+
+        :param str name: The top-level module name
+        :param list path_entries: The path entries to search, defaults to ``sys.path``
+        :returns: ``True`` or ``False``, or ``None`` if a ``sys.path`` entry is not a
+            directory and the answer can't be determined from the cache.
+        """
+        if name in sys.builtin_module_names:
+            return True
+
+        if path_entries is None:
+            path_entries = sys.path
+
+        for path_entry in path_entries:
+            listing = self._listing(path_entry or os.curdir)
+            if listing is None:
+                return None
+
+            module_names, package_candidates = listing
+            if name in module_names:
+                return True
+            if name in package_candidates and self._is_package(path_entry or os.curdir, name):
+                return True
+
+        return False
+
+    def module_names(self, path_entry):
+        """Return the set of top-level module and package names that
+        can be found in the directory ``path_entry``
+
+        :param str path_entry: The ``sys.path`` entry to list
+        """
+        listing = self._listing(path_entry)
+        if listing is None:
+            return set()
+
+        module_names, package_candidates = listing
+        return module_names | set(
+            name for name in package_candidates
+            if self._is_package(path_entry, name)
+        )
+
+    def invalidate(self, path_entry=None):
+        """Forget the cached listing for ``path_entry``, or for all entries if
+        ``path_entry`` is ``None``.
+
+        :param str path_entry: The ``sys.path`` entry to invalidate
+        """
+        if path_entry is None:
+            self._listings.clear()
+            return
+
+        path_entry = os.path.abspath(path_entry)
+        for cached_entry in list(self._listings):
+            if os.path.abspath(cached_entry) == path_entry:
+                del self._listings[cached_entry]
+
+
+def _replace_file(tmp_path, path):
+    """Rename ``tmp_path`` over ``path``. Files made by ``tempfile.mkstemp``
+    are only readable by their owner, so the mode of the file being replaced
+    is kept, and a new file gets the mode that ``open`` would give it.
+    """
+    if os.path.exists(path):
+        import shutil
+        shutil.copymode(path, tmp_path)
+    else:
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp_path, 0o666 & ~umask)
+    os.rename(tmp_path, path)
+
+
+_STDLIB_MODULE_NAMES = None
+def _stdlib_module_names():
+    """Return a frozenset of the builtin and standard library top-level module
+    names of the running interpreter. The set is only computed once per process.
+    """
+    global _STDLIB_MODULE_NAMES
+    if _STDLIB_MODULE_NAMES is not None:
+        return _STDLIB_MODULE_NAMES
+
+    names = set(sys.builtin_module_names)
+    if hasattr(sys, "stdlib_module_names"):
+        names |= set(sys.stdlib_module_names)
+    else:
+        from distutils.sysconfig import get_python_lib
+
+        # virtualenv only links part of the standard library into the
+        # virtual environment, the rest lives in the original prefix
+        base_prefix = getattr(sys, "real_prefix", getattr(sys, "base_prefix", sys.prefix))
+        path_cache = PipLessPathCache()
+        for prefix in set([sys.prefix, base_prefix]):
+            stdlib_dir = get_python_lib(standard_lib=True, prefix=prefix)
+            for path_entry in [stdlib_dir, os.path.join(stdlib_dir, "lib-dynload")]:
+                names |= path_cache.module_names(path_entry)
+
+    names.discard("__init__")
+    _STDLIB_MODULE_NAMES = frozenset(names)
+    return _STDLIB_MODULE_NAMES
+
+
 class PipLess(object):
     """A class to automatically install missing python packages into
     a virtual environment.
@@ -165,6 +519,21 @@ class PipLess(object):
             python_opts  = None,
             color        = False,
             no_color     = False,
+            cache_opts   = None,
+            index_opts   = None,
+            prescan      = True,
+            install_jobs = None,
+            trace        = None,
+            profile_imports = None,
+            requirements_path = None,
+            package_store = True,
+            offline      = False,
+            in_process   = False,
+            mappings_path = None,
+            use_daemon   = True,
+            forkserver_opts = None,
+            prefetch     = True,
+            speculate    = True,
         ):
         """Initialize the package auto-installer and setup the
         virtual environment (if it doesn't already exist).
@@ -179,8 +548,36 @@ class PipLess(object):
         :param bool debug: print verbose debug output
         :param bool no_install: don't install anything, implies ``requirements=False``
         :param bool requirements: generate a requirements.txt on program exit
-        :param dict venv_opts: options for ``clear``, ``python``, and ``system_site_packages``
+        :param dict venv_opts: options for ``clear``, ``python``, ``system_site_packages``
+            ``templates`` (use the venv template cache) and ``without_pip``
         :param bool color_override: if ``True``, color will always be used in the output
+        :param dict cache_opts: options for the PyPI lookup cache: ``enabled``, ``ttl``,
+            ``negative_ttl`` and ``max_entries``
+        :param dict index_opts: options for the offline PyPI name index: ``enabled`` and ``path``
+        :param bool prescan: scan scripts for imports and install missing ones before running them
+        :param int install_jobs: the maximum number of distributions to download and build
+            at the same time. Defaults to the number of CPUs, ``1`` installs serially.
+        :param str trace: save a Chrome trace of each pipless phase into this file
+        :param str profile_imports: save an import-time profile into this file once
+            :meth:`start_import_profiler` is called
+        :param str requirements_path: the requirements file that will be installed into the venv
+        :param bool package_store: share installed distributions with other virtual environments
+            through the per-user package store
+        :param bool offline: only install wheels from the local wheelhouse, never
+            contact PyPI
+        :param bool in_process: activate the venv inside the running interpreter instead
+            of re-executing pipless with the venv's python, when the venv uses the
+            same interpreter
+        :param str mappings_path: a project-specific mappings file, loaded after (and
+            overriding) the global and user mappings
+        :param bool use_daemon: hand PyPI lookups and installs to the pipless daemon
+            if one is running
+        :param dict forkserver_opts: fork server options (only forwarded when re-executing
+            pipless): ``serve``, ``preload``, ``use``
+        :param bool prefetch: download the wheels of the dependencies of installed
+            distributions, and of the other imports of the importing file, in the background
+        :param bool speculate: install the modules that usually follow a missing module
+            in this project in the background, as learned from earlier runs
         """
         if venv_opts is None:
             venv_opts = {}
@@ -188,11 +585,30 @@ class PipLess(object):
         self.venv_clear = venv_opts.get("clear", False)
         self.venv_system_site_packages = venv_opts.get("system_site_packages", False)
         self.venv_python = venv_opts.get("python", None)
+        self.venv_templates = venv_opts.get("templates", True)
+        self.venv_without_pip = venv_opts.get("without_pip", False)
 
         if python_opts is None:
             python_opts = {}
         self.python_opts = python_opts
 
+        if forkserver_opts is None:
+            forkserver_opts = {}
+        self.forkserver_opts = forkserver_opts
+
+        if cache_opts is None:
+            cache_opts = {}
+        self.cache_opts = cache_opts
+        self.cache_enabled = cache_opts.get("enabled", True)
+
+        if index_opts is None:
+            index_opts = {}
+        self.index_opts = index_opts
+        self.index_enabled = index_opts.get("enabled", True)
+        self.index_path = index_opts.get("path", None)
+        if self.index_path is None:
+            self.index_path = os.path.join(CACHE_DIR, "pypi-names.idx")
+
         self.no_install          = no_install
         self.debug               = debug
         self.venv_home           = venv_path
@@ -203,30 +619,112 @@ class PipLess(object):
             self.venv_parent_dir = ""
         self.no_venv             = no_venv
         self.quiet               = quiet
-        self.no_requirements     = (not requirements)
+        self.no_requirements     = (not requirements) or no_install
         self.no_color            = no_color
         self.color               = color
+        self.prescan             = prescan
+        self.install_jobs        = install_jobs
+        self.trace               = trace
+        self.profile_imports     = profile_imports
+        self.requirements_path   = requirements_path
+        self.package_store       = package_store
+        self.offline             = offline
+        self.in_process          = in_process
+        self.use_daemon          = use_daemon
+        self.prefetch            = prefetch
+        self.speculate           = speculate
+        self._daemon             = None
+        self._prefetcher         = None
+        self._index_urls         = None
+        self._cooccurrence       = None
+        self._venv_lock          = None
+        self._lock_wait          = 0.0
+        self._import_profiler    = None
+        self._package_store      = None
+
+        # distribution versions before the first install, and everything
+        # that pipless installed (or upgraded) during this run
+        self._known_versions     = None
+        self._changed_distros    = {}
+
+        # distributions the script itself needed and the ones that were
+        # installed speculatively, see _unused_speculation
+        self._requested_distros  = set()
+        self._speculated_distros = set()
+        self._speculation_finished = False
+
+        # python 3.3+ only locks the module being imported, so the import
+        # hook may be entered from several threads at once. Names being
+        # resolved then map to an event that is set once they are decided.
+        # Python 2 holds the global import lock for the whole hook. pip's
+        # shared state and the output get their own locks, background
+        # threads use them too
+        import threading
+        self._threading          = threading
+        self._concurrent_imports = sys.version_info >= (3, 3)
+        self._state_lock         = threading.Lock()
+        self._in_flight          = {}
+        self._pip_lock           = threading.RLock()
+        self._output_lock        = threading.RLock()
+
+        if trace is not None:
+            from pipless.tracing import Tracer
+            self._tracer = Tracer(trace)
+            # registered before _on_exit so that it runs after it
+            atexit.register(self._tracer.flush)
+        else:
+            from pipless.tracing import NULL_TRACER
+            self._tracer = NULL_TRACER
 
-        if requirements:
+        if not self.no_requirements:
             atexit.register(self._on_exit)
 
         # keep a reference to these modules. We don't want to pollute
         # the global namespace by using normal imports. Plus this avoids
-        # recursive import problems
+        # recursive import problems. pip and its search command are loaded
+        # on first use, see the properties below
         self._imp            = imp
         self._os             = os
-        self._pip            = pip
         self._sys            = sys
-        self._search_command = SearchCommand
 
         # load the mapping files
-        self._mapping        = PipLessMapping()
+        self._mapping        = PipLessMapping(os.path.join(CACHE_DIR, "mappings"))
+        # learned from distribution metadata, see pipless.harvest. Loaded
+        # first so that every hand-written mapping overrides it
+        self._mapping.load(os.path.join(CACHE_DIR, "learned-mappings.txt"))
         self._mapping.load(
             os.path.join(os.path.dirname(__file__), "mappings.txt")
         )
         self._mapping.load(
             os.path.expanduser(os.path.join("~", ".config", "pipless", "mappings.txt"))
         )
+        if mappings_path is not None:
+            self._mapping.load(mappings_path)
+
+        self._path_cache = PipLessPathCache()
+
+        # names that never need to be looked up (again) by find_module. Listing
+        # the stdlib is skipped when nothing will ever be installed
+        self._decided_names = set(_stdlib_module_names()) if not no_install else set()
+
+        self._lookup_cache = None
+        if self.cache_enabled:
+            cache_kwargs = dict(
+                (k, v) for k, v in cache_opts.items()
+                if k in ("ttl", "negative_ttl", "max_entries") and v is not None
+            )
+            self._lookup_cache = PipLessLookupCache(
+                os.path.join(CACHE_DIR, "lookups.json"),
+                **cache_kwargs
+            )
+
+        self._pypi_index = None
+        if self.index_enabled and os.path.exists(self.index_path):
+            from pipless.index import PyPINameIndex, InvalidTableError
+            try:
+                self._pypi_index = PyPINameIndex(self.index_path)
+            except InvalidTableError:
+                self._info("ignoring invalid PyPI name index at {!r}".format(self.index_path))
 
         self._debug("created new PipLess")
         self._debug("    debug                       : {}".format(self.debug))
@@ -238,26 +736,246 @@ class PipLess(object):
         self._debug("    venv --python               : {}".format(self.venv_python))
         self._debug("    venv --system-site-packages : {}".format(self.venv_system_site_packages))
         self._debug("    python opts: {}".format(self.python_opts))
+        self._debug("    lookup cache opts: {}".format(self.cache_opts))
+        self._debug("    PyPI name index: {}".format(
+            self.index_path if self._pypi_index is not None else None
+        ))
 
         if not no_venv:
-            self._create_virtual_env()
+            with self._tracer.span("create_virtual_env", venv=self.venv_home):
+                self._create_virtual_env()
         else:
             self._debug("not creating virtual environment")
 
+    @property
+    def _pip(self):
+        if "pip" not in sys.modules:
+            with self._tracer.span("import_pip"):
+                import pip
+        return sys.modules["pip"]
+
+    @property
+    def _search_command(self):
+        from pip.commands.search import SearchCommand
+        return SearchCommand
+
+    def start_import_profiler(self):
+        """Start recording the time (and nesting) of every import into the
+        ``profile_imports`` file. Time spent installing missing packages is
+        recorded separately from time spent executing module bodies.
+        """
+        if self.profile_imports is None or self._import_profiler is not None:
+            return
+
+        from pipless.importprof import ImportProfiler
+        self._debug("profiling imports into {!r}".format(self.profile_imports))
+        self._import_profiler = ImportProfiler(self.profile_imports)
+        self._import_profiler.start()
+
     def _on_exit(self):
-        import pip
         import os
-        import sys
 
-        self._refresh_pip()
+        unneeded = set()
+        if self._cooccurrence is not None:
+            # speculative installs that were never imported, and whatever
+            # was installed only for them, don't belong in the requirements file
+            from pipless.index import normalize_name
+            unneeded = self._unused_speculation()
+            for name in list(self._changed_distros):
+                if normalize_name(name) in unneeded:
+                    del self._changed_distros[name]
 
         req_path = os.path.join(self.venv_parent_dir, "requirements.txt")
-        self._debug("saving requirements.txt to {!r}".format(req_path))
+        if len(self._changed_distros) == 0 and os.path.exists(req_path):
+            self._debug("nothing was installed, leaving {!r} alone".format(req_path))
+            return
+
+        with self._tracer.span("write_requirements", changed=len(self._changed_distros)):
+            if os.path.exists(req_path):
+                self._debug("updating {} distributions in {!r}".format(
+                    len(self._changed_distros), req_path
+                ))
+                self._update_requirements(req_path, self._changed_distros)
+            else:
+                self._debug("saving requirements.txt to {!r}".format(req_path))
+                self._freeze_requirements(req_path, exclude=unneeded)
 
-        with open(req_path, "wb") as f:
+    def _freeze_requirements(self, req_path, exclude=()):
+        """Write the output of ``pip freeze`` to ``req_path``
+
+        :param exclude: Normalized names of distributions to leave out
+        """
+        import pip
+        import sys
+        import tempfile
+        from pipless.index import normalize_name
+
+        self._refresh_pip()
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(req_path), prefix=".requirements-")
+        with os.fdopen(fd, "wb") as f:
             sys.stdout = f
-            pip.main(["freeze"])
-            sys.stdout = sys.__stdout__
+            try:
+                pip.main(["freeze"])
+            finally:
+                sys.stdout = sys.__stdout__
+
+        if len(exclude) > 0:
+            with open(tmp_path, "rb") as f:
+                lines = f.read().split("\n")
+            with open(tmp_path, "wb") as f:
+                f.write("\n".join(
+                    line for line in lines
+                    if normalize_name(re.split(r"[^A-Za-z0-9._-]", line, 1)[0]) not in exclude
+                ))
+        _replace_file(tmp_path, req_path)
+
+    def _unused_speculation(self):
+        """Return the normalized names of the distributions that are only
+        installed because of speculative installs that were never imported:
+        the unused speculative distributions and their dependencies, except
+        the ones that the distributions the script did use depend on.
+        """
+        from pipless.index import normalize_name
+
+        unused = self._cooccurrence.unused()
+        if len(unused) == 0:
+            return set()
+
+        unused_keys = set(normalize_name(name) for name in unused)
+        used = set(self._requested_distros)
+        used.update(
+            normalize_name(name) for name in self._speculated_distros
+            if normalize_name(name) not in unused_keys
+        )
+        return self._dependency_closure(unused_keys) - self._dependency_closure(used)
+
+    def _dependency_closure(self, distro_names):
+        """Return the normalized names of ``distro_names`` and of everything
+        they depend on, as far as it is installed
+        """
+        self._refresh_pip()
+        from pip._vendor import pkg_resources
+        from pipless.index import normalize_name
+
+        installed = dict(
+            (normalize_name(dist.project_name), dist)
+            for dist in pkg_resources.working_set
+        )
+        closure = set()
+        pending = [normalize_name(name) for name in distro_names]
+        while len(pending) > 0:
+            key = pending.pop()
+            if key in closure:
+                continue
+            closure.add(key)
+            if key not in installed:
+                continue
+            try:
+                requires = installed[key].requires()
+            except (pkg_resources.UnknownExtra, ValueError, IOError) as e:
+                self._debug("could not read the dependencies of {}: {}".format(key, e))
+                continue
+            pending.extend(normalize_name(req.project_name) for req in requires)
+        return closure
+
+    def _note_requested(self, reqs):
+        """Remember that the script itself needs the distributions of the
+        requirement specifiers ``reqs``
+        """
+        from pipless.index import normalize_name
+        for req in reqs:
+            match = re.match(r"^\s*([A-Za-z0-9][A-Za-z0-9._-]*)", req)
+            if match is not None:
+                self._requested_distros.add(normalize_name(match.group(1)))
+
+    def _update_requirements(self, req_path, versions):
+        """Pin the distributions in ``versions`` in the requirements file at
+        ``req_path``. Existing lines for those distributions are replaced, new
+        distributions are appended, and every other line is left untouched.
+        Environment markers and comments of replaced lines are kept. The new
+        file is written atomically, and not at all if nothing changed.
+
+        :param str req_path: The path of the requirements file to update
+        :param dict versions: A dict of distribution name -> version
+        """
+        import six
+        import tempfile
+        from pipless.index import normalize_name
+
+        with open(req_path, "rb") as f:
+            data = f.read()
+        lines = data.split("\n")
+
+        remaining = dict(
+            (normalize_name(name), (name, version))
+            for name, version in six.iteritems(versions)
+        )
+
+        new_lines = []
+        for line in lines:
+            # name, extras, version specifiers, then an optional environment
+            # marker and/or comment, which are kept as they are
+            match = re.match(
+                r'^(\s*)([A-Za-z0-9][A-Za-z0-9._-]*)(\s*\[[^\]]*\])?'
+                r'((?:\s*(?:===|==|>=|<=|~=|!=|<|>)\s*[^\s,;#]+(?:\s*,)?)*)'
+                r'(\s*(?:;.*|#.*)?)$',
+                line
+            )
+            if match is not None and normalize_name(match.group(2)) in remaining:
+                _, version = remaining.pop(normalize_name(match.group(2)))
+                rest = match.group(5)
+                if rest.startswith(("#", ";")):
+                    rest = " " + rest
+                new_lines.append("{}{}{}=={}{}".format(
+                    match.group(1), match.group(2), match.group(3) or "", version, rest
+                ))
+            else:
+                new_lines.append(line)
+
+        while len(new_lines) > 0 and new_lines[-1].strip() == "":
+            new_lines.pop()
+        for key in sorted(remaining):
+            new_lines.append("{}=={}".format(*remaining[key]))
+
+        new_data = "\n".join(new_lines) + "\n"
+        if new_data == data:
+            self._debug("requirements in {!r} are already pinned".format(req_path))
+            return
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(req_path), prefix=".requirements-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(new_data)
+        _replace_file(tmp_path, req_path)
+
+    def _installed_versions(self):
+        """Return a dict of distribution name -> version for everything that
+        is currently installed
+        """
+        self._refresh_pip()
+        from pip._vendor import pkg_resources
+        return dict(
+            (dist.project_name, dist.version)
+            for dist in pkg_resources.working_set
+        )
+
+    def _track_installs(self):
+        """Record which distributions were installed or changed versions
+        since the last time this was called
+
+        :returns: The names of the distributions that changed
+        """
+        import six
+
+        versions = self._installed_versions()
+        changed = []
+        for name, version in six.iteritems(versions):
+            if self._known_versions.get(name, None) != version:
+                self._debug("tracking install of {}=={}".format(name, version))
+                self._changed_distros[name] = version
+                changed.append(name)
+        self._known_versions = versions
+        return changed
 
     def _refresh_pip(self):
         self._debug("refreshing pip's module list")
@@ -274,8 +992,9 @@ class PipLess(object):
     def _info(self, msg):
         if self.quiet:
             return
-        print("\n".join("[PIPLESS]:INF {}".format(x) for x in msg.split("\n")))
-        self._sys.stdout.flush()
+        with self._output_lock:
+            print("\n".join("[PIPLESS]:INF {}".format(x) for x in msg.split("\n")))
+            self._sys.stdout.flush()
 
     def _should_color(self):
         return (sys.stdout.isatty() or self.color) and not self.no_color
@@ -293,12 +1012,13 @@ class PipLess(object):
             color_end = ""
 
         if self.debug:
-            print(
-                color_start + \
-                "\n".join("[PIPLESS]:DBG: {}".format(x) for x in msg.split("\n")) + \
-                color_end
-            )
-            self._sys.stdout.flush()
+            with self._output_lock:
+                print(
+                    color_start + \
+                    "\n".join("[PIPLESS]:DBG: {}".format(x) for x in msg.split("\n")) + \
+                    color_end
+                )
+                self._sys.stdout.flush()
 
     def activate(self):
         """Activate the virtual environment.
@@ -306,11 +1026,21 @@ class PipLess(object):
         This actually restarts the pipless script using `os.execve()` to
         replace itself with a subprocess that uses the correct python binary
         from the venv/bin directory with the correct environment variables.
+
+        If ``in_process`` was set and the venv was made from the running
+        interpreter, the venv is activated without restarting instead.
         """
         if self.no_venv:
             self._debug("no_venv was set, not activating")
             return
 
+        if self.in_process:
+            if self._venv_matches_interpreter():
+                with self._tracer.span("activate_in_process", venv=self.venv_home):
+                    self._activate_in_process()
+                return
+            self._debug("venv does not use the running interpreter, re-executing")
+
         new_environ = dict(os.environ)
         new_environ["PATH"] = os.path.join(self.venv_home, "bin") + ":" + new_environ["PATH"]
         new_environ["VIRTUAL_ENV"] = os.path.abspath(self.venv_home)
@@ -344,6 +1074,54 @@ class PipLess(object):
         if self.venv_python is not None:
             new_args.append("--python")
             new_args.append(self.venv_python)
+        if not self.venv_templates:
+            new_args.append("--no-venv-templates")
+        if self.venv_without_pip:
+            new_args.append("--without-pip")
+        if not self.cache_enabled:
+            new_args.append("--no-lookup-cache")
+        for opt_name, arg_name in [
+                ("ttl",          "--lookup-cache-ttl"),
+                ("negative_ttl", "--lookup-cache-negative-ttl"),
+                ("max_entries",  "--lookup-cache-size")]:
+            if self.cache_opts.get(opt_name, None) is not None:
+                new_args.append(arg_name)
+                new_args.append(str(self.cache_opts[opt_name]))
+        if not self.index_enabled:
+            new_args.append("--no-pypi-index")
+        if self.index_opts.get("path", None) is not None:
+            new_args.append("--pypi-index")
+            new_args.append(self.index_opts["path"])
+        if not self.prescan:
+            new_args.append("--no-prescan")
+        if self.install_jobs is not None:
+            new_args.append("--install-jobs")
+            new_args.append(str(self.install_jobs))
+        if not self.package_store:
+            new_args.append("--no-package-store")
+        if self.offline:
+            new_args.append("--offline")
+        if not self.use_daemon:
+            new_args.append("--no-daemon")
+        if not self.prefetch:
+            new_args.append("--no-prefetch")
+        if not self.speculate:
+            new_args.append("--no-speculate")
+        if self.forkserver_opts.get("serve", False):
+            new_args.append("--forkserver")
+        for module_name in self.forkserver_opts.get("preload", None) or []:
+            new_args.append("--preload")
+            new_args.append(module_name)
+        if not self.forkserver_opts.get("use", True):
+            new_args.append("--no-forkserver")
+        if self.profile_imports is not None:
+            new_args.append("--profile-imports")
+            new_args.append(self.profile_imports)
+        if self.trace is not None:
+            from pipless.tracing import APPEND_ENV_VAR
+            new_args.append("--trace")
+            new_args.append(self.trace)
+            new_environ[APPEND_ENV_VAR] = "1"
 
         if self.python_opts.get("module", None) is not None:
             new_args.append("-m")
@@ -352,12 +1130,156 @@ class PipLess(object):
             new_args.append("-c")
             new_args.append(self.python_opts.get("cmd"))
 
+        self._tracer.instant("activate", python=venv_python_path)
+        # atexit handlers don't run when the process is replaced
+        self._tracer.flush()
+
         os.execve(
             venv_python_path,
             new_args + sys.argv,
             new_environ
         )
 
+    def _venv_matches_interpreter(self):
+        """Check if the virtual environment was created from the running
+        interpreter, which is required to activate it in-process.
+        """
+        if self.venv_python is not None:
+            return False
+
+        site_packages = os.path.join(
+            self.venv_home, "lib",
+            "python{}.{}".format(*sys.version_info[:2]),
+            "site-packages"
+        )
+        if not os.path.isdir(site_packages):
+            return False
+
+        base_prefix = getattr(sys, "real_prefix", getattr(sys, "base_prefix", sys.prefix))
+
+        # python 3 venvs (and virtualenv >= 20)
+        pyvenv_cfg = os.path.join(self.venv_home, "pyvenv.cfg")
+        if os.path.exists(pyvenv_cfg):
+            cfg = {}
+            with open(pyvenv_cfg, "r") as f:
+                for line in f:
+                    key, sep, value = line.partition("=")
+                    if sep != "":
+                        cfg[key.strip()] = value.strip()
+
+            version = cfg.get("version", cfg.get("version_info", ""))
+            if not version.startswith("{}.{}.".format(*sys.version_info[:2])):
+                return False
+            home = os.path.realpath(cfg.get("home", ""))
+            return home in (
+                os.path.realpath(os.path.join(base_prefix, "bin")),
+                os.path.dirname(os.path.realpath(sys.executable)),
+            )
+
+        # legacy virtualenv
+        orig_prefix = os.path.join(os.path.dirname(site_packages), "orig-prefix.txt")
+        if os.path.exists(orig_prefix):
+            with open(orig_prefix, "r") as f:
+                return os.path.realpath(f.read().strip()) == os.path.realpath(base_prefix)
+
+        return False
+
+    def _system_site_dirs(self):
+        """Return the site-packages directories of the base interpreter
+        (and the user's site-packages) that are on ``sys.path``
+        """
+        import site
+        from distutils.sysconfig import get_python_lib
+
+        prefixes = set([sys.prefix, sys.exec_prefix])
+        for attr in ("real_prefix", "base_prefix", "base_exec_prefix"):
+            if hasattr(sys, attr):
+                prefixes.add(getattr(sys, attr))
+
+        site_dirs = set()
+        for prefix in prefixes:
+            for plat_specific in (False, True):
+                site_dirs.add(get_python_lib(plat_specific=plat_specific, prefix=prefix))
+        if hasattr(site, "getsitepackages"):
+            site_dirs.update(site.getsitepackages())
+        if getattr(site, "USER_SITE", None) is not None:
+            site_dirs.add(site.USER_SITE)
+        return set(os.path.normpath(site_dir) for site_dir in site_dirs)
+
+    def _activate_in_process(self):
+        """Make the running interpreter use the virtual environment, the
+        same way the venv's own python would: ``sys.prefix``, ``sys.path``
+        (through ``site.addsitedir`` so that ``.pth`` files are processed) and
+        the environment variables are all pointed at the venv.
+
+        Modules that were imported before activation (e.g. pip) keep being
+        used from where they were imported.
+        """
+        global VENV_ACTIVATED
+        import site
+
+        self._debug("activating venv at {!r} in-process".format(self.venv_home))
+        venv_bin = os.path.join(self.venv_home, "bin")
+        site_packages = os.path.join(
+            self.venv_home, "lib",
+            "python{}.{}".format(*sys.version_info[:2]),
+            "site-packages"
+        )
+
+        if not self.venv_system_site_packages:
+            system_site_dirs = self._system_site_dirs()
+            def is_system(path_entry):
+                path_entry = os.path.normpath(os.path.abspath(path_entry))
+                return any(
+                    path_entry == site_dir or path_entry.startswith(site_dir + os.sep)
+                    for site_dir in system_site_dirs
+                )
+            sys.path[:] = [entry for entry in sys.path if entry == "" or not is_system(entry)]
+
+        if not hasattr(sys, "real_prefix") and not hasattr(sys, "base_prefix"):
+            # python 2 virtualenvs tell pip that they are virtualenvs this way
+            sys.real_prefix = sys.prefix
+        sys.prefix = sys.exec_prefix = self.venv_home
+        sys.executable = os.path.join(venv_bin, "python")
+
+        # these cache the prefix they were first imported (or called) with
+        import distutils.sysconfig
+        distutils.sysconfig.PREFIX = distutils.sysconfig.EXEC_PREFIX = self.venv_home
+        distutils.sysconfig._config_vars = None
+        if "sysconfig" in sys.modules:
+            sys.modules["sysconfig"]._CONFIG_VARS = None
+
+        site.addsitedir(site_packages)
+
+        os.environ["PATH"] = venv_bin + os.pathsep + os.environ.get("PATH", "")
+        os.environ["VIRTUAL_ENV"] = os.path.abspath(self.venv_home)
+        os.environ["_"] = sys.executable
+
+        self._path_cache.invalidate()
+        self._refresh_pip()
+        VENV_ACTIVATED = True
+
+    def _get_venv_lock(self):
+        """Return the :class:`pipless.lock.VenvLock` that serializes changes to
+        the virtual environment across pipless processes
+        """
+        if self.venv_home is None:
+            from pipless.lock import NULL_LOCK
+            return NULL_LOCK
+
+        with self._state_lock:
+            if self._venv_lock is None:
+                from pipless.lock import VenvLock, lock_path_for
+                self._venv_lock = VenvLock(lock_path_for(self.venv_home), self._report_lock_wait)
+        return self._venv_lock
+
+    def _report_lock_wait(self, seconds):
+        self._lock_wait += seconds
+        self._tracer.instant("venv_lock_wait", seconds=seconds, total=self._lock_wait)
+        self._debug("waited {:.3f}s for another pipless process to release the venv lock ({:.3f}s in total)".format(
+            seconds, self._lock_wait
+        ))
+
     def _create_virtual_env(self):
         """Create the new virtual environment if it does not yet exist.
         
@@ -371,9 +1293,75 @@ class PipLess(object):
             ))
             return
 
+        venv_lock = self._get_venv_lock()
+        with venv_lock:
+            # another process may have created it while this one was waiting.
+            # With --clear, the venv it created is just as fresh
+            if os.path.exists(self.venv_home) and (self.venv_clear == False or venv_lock.last_wait > 0):
+                self._debug("virtualenv was created at '{}' by another pipless process".format(
+                    self.venv_home
+                ))
+                return
+
+            if self._materialize_venv_template():
+                return
+
+            self._debug("creating virtual environment at {}".format(self.venv_home))
+            if not self._create_virtual_env_in_process():
+                self._create_virtual_env_subprocess()
+
+            self._link_pipless_into_venv()
+
+            if self._venv_template_key() is not None:
+                # the re-exec'd pipless saves the venv as a template once the
+                # requirements have been installed into it
+                open(os.path.join(self.venv_home, VENV_TEMPLATE_PENDING), "wb").close()
+
+    def _create_virtual_env_in_process(self):
+        """Create the virtual environment without starting a new process,
+        using the stdlib ``venv`` module (python 3) or virtualenv's own API
+        (python 2). This is only possible when the venv uses the running
+        interpreter.
+
+        :returns: ``True`` if the virtual environment was created
+        """
+        if self.venv_python is not None:
+            return False
+
+        try:
+            import venv
+        except ImportError:
+            venv = None
+
+        if venv is not None:
+            self._debug("creating virtual environment with the venv module")
+            builder = venv.EnvBuilder(
+                system_site_packages = self.venv_system_site_packages,
+                clear                = self.venv_clear,
+                symlinks             = (os.name != "nt"),
+                with_pip             = not self.venv_without_pip,
+            )
+            builder.create(self.venv_home)
+            return True
+
         import virtualenv
-        self._debug("creating virtual environment at {}".format(self.venv_home))
+        if not hasattr(virtualenv, "create_environment"):
+            return False
+
+        self._debug("creating virtual environment with virtualenv.create_environment")
+        virtualenv.create_environment(
+            self.venv_home,
+            site_packages = self.venv_system_site_packages,
+            clear         = self.venv_clear,
+            no_pip        = self.venv_without_pip,
+            no_setuptools = self.venv_without_pip,
+            no_wheel      = self.venv_without_pip,
+        )
+        return True
 
+    def _create_virtual_env_subprocess(self):
+        """Create the virtual environment by running the virtualenv script
+        """
         venv_args = ["virtualenv"]
 
         if self.venv_clear:
@@ -383,48 +1371,143 @@ class PipLess(object):
         if self.venv_python:
             venv_args.append("--python")
             venv_args.append(self.venv_python)
+        if self.venv_without_pip:
+            venv_args.extend(["--no-pip", "--no-setuptools", "--no-wheel"])
 
         venv_args.append(self.venv_home)
 
+        import subprocess
         self._debug("executing virtualenv: {}".format(venv_args))
         proc = subprocess.Popen(venv_args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
         stdout,_ = proc.communicate()
         if proc.poll() != 0:
             raise Exception("Error creating the virtual environment!\n\n{}" + stdout)
 
-        site_packages_dirs = []
+    def _venv_site_packages(self):
+        """Return the site-packages directory of the virtual environment. The
+        well-known locations are checked before resorting to walking the venv.
+        """
+        if os.name == "nt":
+            candidates = [os.path.join(self.venv_home, "Lib", "site-packages")]
+        elif self.venv_python is None:
+            candidates = [os.path.join(
+                self.venv_home, "lib",
+                "python{}.{}".format(*sys.version_info[:2]),
+                "site-packages"
+            )]
+        else:
+            lib_dir = os.path.join(self.venv_home, "lib")
+            candidates = [
+                os.path.join(lib_dir, name, "site-packages")
+                for name in sorted(os.listdir(lib_dir)) if name.startswith("python")
+            ] if os.path.isdir(lib_dir) else []
+        # pypy
+        candidates.append(os.path.join(self.venv_home, "site-packages"))
+
+        for candidate in candidates:
+            if os.path.isdir(candidate):
+                return candidate
+
         for root, dirnames, filesnames in os.walk(self.venv_home):
             for dirname in dirnames:
                 if dirname == "site-packages":
-                    site_packages_dirs.append(os.path.join(root, dirname))
+                    return os.path.join(root, dirname)
 
-        self._debug("copying six module into virtual env")
-        six_file = six.__file__.replace(".pyc", ".py")
-        dest_six_file = os.path.join(site_packages_dirs[0], "six.py")
-        shutil.copy(six_file, dest_six_file)
+        raise PiplessException("Could not find site-packages in {!r}".format(self.venv_home))
 
-        self._debug("copying 'bin/pipless' into virtual env")
-        shutil.copy(self._which("pipless"), os.path.join(self.venv_home, "bin", "pipless"))
+    def _link_pipless_into_venv(self):
+        """Make six, the pipless script and the pipless package available in
+        the virtual environment, so that it uses the same version of pipless.
+        Symlinks are used when possible, otherwise the files are copied.
+        """
+        import shutil
+        import six
 
-        filenames = [
-            "__init__.py",
-            "__main__.py",
-            "mappings.txt"
+        site_packages_dir = self._venv_site_packages()
+        pipless_dir = os.path.dirname(os.path.abspath(__file__))
+        six_file = six.__file__.replace(".pyc", ".py")
+        pipless_script = self._which("pipless")
+
+        links = [
+            (six_file, os.path.join(site_packages_dir, "six.py")),
+            (pipless_dir, os.path.join(site_packages_dir, "pipless")),
         ]
+        if pipless_script is not None:
+            links.append((pipless_script, os.path.join(self.venv_home, "bin", "pipless")))
+
+        for src, dest in links:
+            self._debug("linking {} into virtual env at '{}'".format(src, dest))
+            if os.path.islink(dest) or os.path.isfile(dest):
+                os.remove(dest)
+            elif os.path.isdir(dest):
+                shutil.rmtree(dest)
+
+            try:
+                os.symlink(src, dest)
+                continue
+            except (AttributeError, NotImplementedError, OSError):
+                # no symlinks on this platform/filesystem
+                pass
 
-        for filename in filenames:
-            file_to_copy = os.path.join(os.path.dirname(__file__), filename)
+            if os.path.isdir(src):
+                shutil.copytree(src, dest, ignore=shutil.ignore_patterns("*.pyc"))
+            else:
+                shutil.copy(src, dest)
+
+    def _venv_template_key(self):
+        """Return the venv template cache key for the virtual environment, or
+        ``None`` if venv templates can't be used
+        """
+        if not self.venv_templates or self.requirements_path is None:
+            return None
 
-            site_packages_dir = site_packages_dirs[0]
-            new_file = os.path.join(site_packages_dir, "pipless", filename)
-            if not os.path.exists(os.path.dirname(new_file)):
-                os.makedirs(os.path.dirname(new_file))
+        from pipless.venv_cache import interpreter_fingerprint, template_key
 
-            self._debug("copying {} into virtual env at '{}'".format(
-                file_to_copy,
-                new_file
-            ))
-            shutil.copy(file_to_copy, new_file)
+        # the re-exec'd process runs in the venv itself, fingerprinting
+        # the running interpreter gives the venv's base interpreter
+        python = self.venv_python if not self.no_venv else None
+        return template_key(
+            interpreter_fingerprint(python),
+            self.requirements_path,
+            self.venv_system_site_packages
+        )
+
+    def _materialize_venv_template(self):
+        """Create the virtual environment from a cached template
+
+        :returns: ``True`` if a template existed and the venv was created from it
+        """
+        key = self._venv_template_key()
+        if key is None:
+            return False
+
+        from pipless.venv_cache import VenvTemplateCache
+        templates = VenvTemplateCache(os.path.join(CACHE_DIR, "venv-templates"), log=self._debug)
+        if not templates.materialize(key, self.venv_home):
+            return False
+
+        # the template may have been made by a different version of pipless
+        self._link_pipless_into_venv()
+        return True
+
+    def save_venv_template(self):
+        """Save the virtual environment as a template for future virtual
+        environments with the same requirements, if pipless created it in
+        this run and it was not yet saved.
+        """
+        pending = os.path.join(self.venv_home or "", VENV_TEMPLATE_PENDING)
+        if self.venv_home is None or not os.path.exists(pending):
+            return
+
+        key = self._venv_template_key()
+        os.remove(pending)
+        if key is None:
+            return
+
+        from pipless.venv_cache import VenvTemplateCache
+        templates = VenvTemplateCache(os.path.join(CACHE_DIR, "venv-templates"), log=self._debug)
+        with self._tracer.span("save_venv_template", key=key):
+            templates.save(key, self.venv_home)
 
     def _which(self, program):
         """Simple function to determine the path of an executable.
@@ -469,74 +1552,800 @@ class PipLess(object):
         :param str fullname: The fullname of the module being imported
         :param str path: Not used by pipless - see PEP 302
         """
-        if "." in fullname:
+        if "." in fullname or fullname in self._decided_names:
             return None
 
-        self._debug("finding module {}".format(fullname))
+        # only names that haven't been decided on yet make it this far
+        if not self._concurrent_imports:
+            # only the thread resolving the name can import it again (e.g.
+            # from pip itself), the others wait for the import lock
+            if fullname in self._in_flight:
+                return None
+            in_flight = None
+            with self._state_lock:
+                self._in_flight[fullname] = in_flight
+        else:
+            with self._state_lock:
+                if fullname in self._decided_names:
+                    return None
+                in_flight = self._in_flight.get(fullname, None)
+                if in_flight is None:
+                    in_flight = (self._threading.Event(), self._threading.current_thread())
+                    self._in_flight[fullname] = in_flight
+                    owner = True
+                else:
+                    owner = False
+
+            if not owner:
+                event, thread = in_flight
+                # the thread resolving the name is importing it again (e.g.
+                # from pip itself), waiting on it would never return
+                if thread is not self._threading.current_thread():
+                    with self._tracer.span("find_module_wait", module=fullname):
+                        event.wait()
+                return None
 
         try:
-            mod_info = self._imp.find_module(fullname)
-            self._debug("found module {} at {}".format(fullname, mod_info[1]))
-        except ImportError as e:
-            pass
-        else:
+            with self._tracer.span("find_module", module=fullname) as span:
+                span.set("decision", self._install_if_missing(fullname))
+        finally:
+            with self._state_lock:
+                self._decided_names.add(fullname)
+                del self._in_flight[fullname]
+            if in_flight is not None:
+                in_flight[0].set()
+
+        # we've made it accessible to the normal import procedures
+        # now, (should be on sys.path), so we'll return None which
+        # will make Python attempt a normal import
+        return None
+
+    def _install_if_missing(self, fullname):
+        """Install the distribution for the top-level module ``fullname`` if
+        it is not importable but is available on PyPI
+
+        :param str fullname: The top-level module name
+        :returns: a short description of the decision that was made
+        """
+        if self.debug:
+            self._debug("finding module {}".format(fullname))
+
+        cooccurrence = self._get_cooccurrence()
+        if cooccurrence is not None:
+            self._track_speculative_installs()
+            if cooccurrence.record_hit(fullname):
+                self._debug("module {} was installed speculatively".format(fullname))
+                self._speculate(cooccurrence, fullname)
+
+        if self._is_importable(fullname):
             # it's already accessible, we don't need to do anything
-            return None
+            if self.debug:
+                self._debug("found module {}".format(fullname))
+            if len(self._speculated_distros) > 0:
+                # it may have come with a speculative install, but the script
+                # uses it, it must stay in the requirements
+                try:
+                    self._note_requested([self._package_pypi_mapping_defined(fullname) or fullname])
+                except IgnoreMissingImport:
+                    pass
+            return "present"
 
         try:
             distro_name = self._get_pypi_distro_name(fullname)
         except IgnoreMissingImport:
             self._debug("told to ignore '{}' import, ignoring".format(fullname))
-            return None
+            return "ignored"
+
+        if distro_name is None:
+            return "not on pypi"
 
-        if distro_name is not None:
-            stack = inspect.stack()
-            last_frame = stack[1]
+        if self.debug:
+            import linecache
+            # the frame of whatever is importing fullname
+            frame = self._sys._getframe(2)
+            filename, lineno = frame.f_code.co_filename, frame.f_lineno
             self._debug("import from {}:{} ({!r})".format(
-                last_frame[1], last_frame[2], last_frame[4]
+                filename, lineno, linecache.getline(filename, lineno).strip()
             ))
-            self._debug("module {} exists in pypi, installing".format(fullname))
-            self._pip_main("install", fullname)
+        self._debug("module {} exists in pypi, installing".format(fullname))
+        self._start_prefetch(distro_name, self._sys._getframe(1))
+        if cooccurrence is not None:
+            cooccurrence.observe(fullname, distro_name)
+
+        with self._get_venv_lock():
+            # another pipless process (or a speculative install) may have
+            # installed it in the meantime
+            for site_packages_dir in self._site_packages_dirs():
+                self._path_cache.invalidate(site_packages_dir)
+            if self._is_importable(fullname):
+                self._debug("module {} was installed by another pipless process".format(fullname))
+                decision = "installed by another process"
+            elif self._install_from_store([distro_name]):
+                decision = "installed from store"
+            else:
+                self._install_many([distro_name], distro_name)
+                decision = "installed"
+
+        if cooccurrence is not None:
+            self._speculate(cooccurrence, fullname)
+        return decision
+
+    def _get_cooccurrence(self):
+        """Return the :class:`pipless.cooccurrence.CooccurrenceModel` of this
+        project, or ``None`` if speculative installs are disabled
+        """
+        if not self.speculate or self.no_install or self.venv_home is None:
+            return None
+
+        with self._state_lock:
+            if self._cooccurrence is None:
+                from pipless.cooccurrence import CooccurrenceModel, model_path_for
+                self._cooccurrence = CooccurrenceModel(model_path_for(CACHE_DIR, self.venv_parent_dir))
+                atexit.register(self._save_cooccurrence)
+        return self._cooccurrence
+
+    def _save_cooccurrence(self):
+        stats = self._cooccurrence.stats()
+        self._tracer.instant("speculation", **stats)
+        if stats["speculated"] > 0:
+            self._debug("speculative installs: {} of {} were imported ({:.0%})".format(
+                stats["hits"], stats["speculated"], stats["hit_rate"]
+            ))
+        self._cooccurrence.save()
+
+    def _speculate(self, cooccurrence, fullname):
+        """Install the modules that usually follow ``fullname`` in the
+        background, through the wheelhouse like :meth:`_install_many`. The pip
+        processes are started from a background thread and take the venv
+        lock themselves, so that the thread never holds the venv lock while
+        it waits for the import lock (see :mod:`pipless.lock`). What they
+        installed is recorded by :meth:`_track_speculative_installs`.
+        """
+        followers = [
+            (import_name, distro_name) for import_name, distro_name in cooccurrence.followers(fullname)
+            if import_name not in self._decided_names and import_name not in self._in_flight
+            and not self._is_importable(import_name)
+        ]
+        if len(followers) == 0:
+            return
+        cooccurrence.speculate(followers)
+
+        distro_names = sorted(set(distro_name for _, distro_name in followers))
+        self._debug("speculatively installing {} after {}".format(", ".join(distro_names), fullname))
+        self._tracer.instant("speculate", after=fullname, distros=distro_names)
+
+        import shutil
+        import subprocess
+        import tempfile
+        from pipless.installer import Wheelhouse
+        from pipless.lock import lock_path_for
+
+        with self._pip_lock:
+            # what the speculative install changes is found by comparing
+            # against the versions from before it
+            if self._known_versions is None:
+                self._known_versions = self._installed_versions()
+            if len(self._speculated_distros) == 0:
+                atexit.register(self._track_speculative_installs)
+            self._speculated_distros.update(distro_names)
+
+        wheelhouse = Wheelhouse(os.path.join(CACHE_DIR, "wheelhouse"))
+        wheelhouse.ensure_exists()
+
+        build = None
+        missing = wheelhouse.missing(distro_names) if not self.offline else []
+        if len(missing) > 0:
+            if self._prefetcher is not None:
+                self._prefetcher.take(missing, wait_for_starting=False, timeout=0)
+            # built into a private directory, like ParallelInstaller does
+            build_dir = tempfile.mkdtemp(prefix="pipless-build-")
+            build = (
+                [
+                    sys.executable, "-m", "pip", "wheel", "--quiet",
+                    "--wheel-dir", build_dir, "--find-links", wheelhouse.path
+                ] + missing,
+                build_dir,
+                wheelhouse.path
+            )
+
+        install_cmd = [
+            sys.executable, "-m", "pipless.lock", lock_path_for(self.venv_home),
+            sys.executable, "-m", "pip", "install", "--quiet"
+        ]
+        install_cmds = [install_cmd + ["--no-index", "--find-links", wheelhouse.path] + distro_names]
+        if not self.offline:
+            install_cmds.append(install_cmd + ["--find-links", wheelhouse.path] + distro_names)
+
+        # everything the thread needs is looked up now, it must not import
+        # anything. It is abandoned if the script exits first
+        thread = self._threading.Thread(
+            target = self._speculative_install,
+            args   = (build, install_cmds, list(self._site_packages_dirs()), subprocess, shutil)
+        )
+        thread.daemon = True
+        thread.start()
+
+    def _speculative_install(self, build, install_cmds, site_packages_dirs, subprocess, shutil):
+        if build is not None:
+            build_cmd, build_dir, wheel_dir = build
+            proc = subprocess.Popen(build_cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            output, _ = proc.communicate()
+            if proc.returncode != 0:
+                self._debug("speculative wheel build failed:\n{}".format(output))
+            for filename in os.listdir(build_dir):
+                dest = os.path.join(wheel_dir, filename)
+                if not os.path.exists(dest):
+                    shutil.move(os.path.join(build_dir, filename), dest)
+            shutil.rmtree(build_dir, ignore_errors=True)
+
+        # from the wheelhouse alone first, then with the package index
+        for cmd in install_cmds:
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            output, _ = proc.communicate()
+            if proc.returncode == 0:
+                break
+        else:
+            self._debug("speculative install failed:\n{}".format(output))
+
+        for site_packages_dir in site_packages_dirs:
+            self._path_cache.invalidate(site_packages_dir)
+        with self._state_lock:
+            self._speculation_finished = True
+
+    def _track_speculative_installs(self):
+        """Track, store and learn the mappings of what finished speculative
+        installs installed, like :meth:`_pip_main` does after installs. The
+        speculating thread can't, it must not use pip or import anything.
+        Called before the hook resolves a name, and at exit.
+        """
+        with self._state_lock:
+            finished = self._speculation_finished
+            self._speculation_finished = False
+        if not finished:
+            return
+
+        with self._pip_lock:
+            changed = self._track_installs()
+        self._add_to_store(changed)
+        self._learn_mappings(changed)
+
+    def _get_prefetcher(self):
+        """Return the :class:`pipless.prefetch.Prefetcher` that fills the
+        wheelhouse in the background, or ``None`` if prefetching is disabled
+        """
+        if not self.prefetch or self.offline or self.no_install:
+            return None
+
+        with self._state_lock:
+            if self._prefetcher is None:
+                from pipless.installer import Wheelhouse, default_jobs
+                from pipless.prefetch import Prefetcher
+                self._prefetcher = Prefetcher(
+                    Wheelhouse(os.path.join(CACHE_DIR, "wheelhouse")),
+                    jobs = self.install_jobs if self.install_jobs is not None else default_jobs(),
+                    log  = self._debug
+                )
+                # the script is done, its prefetches don't matter anymore
+                atexit.register(self._prefetcher.abandon)
+        return self._prefetcher
+
+    def _start_prefetch(self, distro_name, frame):
+        """Start prefetching the wheels of the dependencies of ``distro_name``
+        and of the other imports of the file that is importing it
+
+        :param str distro_name: The distribution that is about to be installed
+        :param frame: The frame that is running the import of ``distro_name``
+        """
+        prefetcher = self._get_prefetcher()
+        if prefetcher is None:
+            return
+
+        from pipless.prefetch import importer_file, pypi_dependencies, pypi_json_url
+        from pipless.scan import file_imports
+
+        with self._pip_lock:
+            if self._index_urls is None:
+                self._index_urls = self._configured_index_urls()
+        json_url = pypi_json_url(self._index_urls)
+        if json_url is not None:
+            prefetcher.prefetch(lambda: pypi_dependencies(distro_name, json_url=json_url))
+        else:
+            self._debug("not prefetching dependencies, pip uses an index other than PyPI")
+
+        importer = importer_file(frame)
+        if importer is None:
+            return
+
+        # resolved here, pip and the lookup cache aren't safe to use from the
+        # prefetch thread. Names that would need a PyPI search are skipped
+        sibling_distros = []
+        for import_name in sorted(file_imports(importer)):
+            with self._state_lock:
+                if import_name in self._decided_names or import_name in self._in_flight:
+                    continue
+            if self._is_importable(import_name):
+                continue
+            try:
+                sibling = self._get_pypi_distro_name(import_name, search=False)
+            except IgnoreMissingImport:
+                continue
+            if sibling is not None and sibling != distro_name:
+                sibling_distros.append(sibling)
+
+        if len(sibling_distros) > 0:
+            prefetcher.prefetch(lambda: sibling_distros)
+
+    def _configured_index_urls(self):
+        """Return the index URLs that pip installs from, as configured by
+        pip.conf, ``PIP_INDEX_URL`` / ``PIP_EXTRA_INDEX_URL`` and the
+        options in the requirements file. If they can't be read, a
+        placeholder is returned that no index matches.
+        """
+        from pipless.installer import requirements_options
+
+        try:
+            from pip.commands.install import InstallCommand
+            options, _ = InstallCommand().parse_args([])
+            urls = [options.index_url] + list(options.extra_index_urls or [])
+        except Exception as e:
+            self._debug("could not read pip's index configuration: {!r}".format(e))
+            return ["<unknown>"]
+
+        if self.requirements_path is not None and os.path.exists(self.requirements_path):
+            for option in requirements_options(self.requirements_path):
+                match = re.match(r"^(-i|--index-url|--extra-index-url)(?:\s*=\s*|\s+)(\S+)", option)
+                if match is None:
+                    continue
+                if match.group(1) == "--extra-index-url":
+                    urls.append(match.group(2))
+                else:
+                    urls[0] = match.group(2)
+        return urls
 
-        # we've made it accessible to the normal import procedures
-        # now, (should be on sys.path), so we'll return None which
-        # will make Python attempt a normal import
-        return None
-    
     def install_requirements(self, requirements_path):
-        """Install the requirements file at ``requirements_path`` into the current environment
+        """Install the requirements file at ``requirements_path`` into the current environment.
+
+        Nothing is done if the requirements file and the installed
+        distributions are unchanged since the last time the requirements were
+        satisfied, according to the stamp saved in the virtual environment.
 
         :param str requirements_path: The path to the requirements file to install
+        :returns: The list of requirements that could not be installed
+        """
+        from pipless.installer import read_requirements, requirements_options, requirements_stamp
+
+        stamp_path = None
+        if self.venv_home is not None and os.path.isdir(self.venv_home):
+            stamp_path = os.path.join(self.venv_home, REQUIREMENTS_STAMP)
+            if self._requirements_stamp_matches(requirements_path, stamp_path):
+                return []
+
+        with self._get_venv_lock() as venv_lock:
+            # the process that held the lock may have installed them already
+            if stamp_path is not None and venv_lock.last_wait > 0 \
+                    and self._requirements_stamp_matches(requirements_path, stamp_path):
+                return []
+
+            self._debug("installing requirements file at {}".format(requirements_path))
+            reqs = read_requirements(requirements_path)
+            with self._tracer.span("install_requirements", path=requirements_path):
+                # pip must see options such as --index-url or -e lines itself
+                if len(requirements_options(requirements_path)) == 0 and self._install_from_store(reqs):
+                    unsatisfied = []
+                else:
+                    unsatisfied = self._install_many(reqs, "-r", requirements_path)
+
+            if stamp_path is not None and len(unsatisfied) == 0:
+                self._write_requirements_stamp(
+                    stamp_path,
+                    requirements_stamp(requirements_path, self._site_packages_dirs())
+                )
+
+        return unsatisfied
+
+    def _requirements_stamp_matches(self, requirements_path, stamp_path):
+        """Check if the stamp saved at ``stamp_path`` matches the current
+        requirements file and installed distributions
         """
-        self._debug("installing requirements file at {}".format(requirements_path))
-        self._pip_main("install", "-r", requirements_path)
+        from pipless.installer import requirements_stamp
 
-    def _pip_main(self, *args):
-        """Run pip.main with the specified ``args``
+        stamp = requirements_stamp(requirements_path, self._site_packages_dirs())
+        try:
+            with open(stamp_path, "r") as f:
+                if f.read().strip() == stamp:
+                    self._debug("requirements at {} are already satisfied".format(requirements_path))
+                    return True
+        except (IOError, OSError):
+            pass
+        return False
+
+    def _write_requirements_stamp(self, stamp_path, stamp):
+        import tempfile
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(stamp_path), prefix=".stamp-")
+            with os.fdopen(fd, "w") as f:
+                f.write(stamp + "\n")
+            _replace_file(tmp_path, stamp_path)
+        except (IOError, OSError) as e:
+            self._debug("could not save the requirements stamp: {}".format(e))
+
+    def install_missing(self, import_names):
+        """Install the distributions for every name in ``import_names`` that
+        cannot currently be imported, using a single pip invocation.
+
+        :param import_names: An iterable of top-level import names
+        :returns: The list of distribution names that were installed
         """
-        if self.quiet:
-            import logging
-            pip_log = logging.getLogger("pip")
-            _level = pip_log.level
-            pip_log.setLevel(logging.CRITICAL)
-        elif self._should_color():
-            self._sys.stdout.write("\x1b[36m")
+        missing = []
+        for import_name in sorted(import_names):
+            if import_name in self._decided_names or self._is_importable(import_name):
+                continue
+
+            try:
+                distro_name = self._get_pypi_distro_name(import_name)
+            except IgnoreMissingImport:
+                self._debug("told to ignore '{}' import, ignoring".format(import_name))
+                continue
 
+            if distro_name is not None:
+                missing.append((import_name, distro_name))
+
+        if len(missing) == 0:
+            return []
+
+        with self._get_venv_lock():
+            # skip whatever another pipless process installed in the meantime
+            for site_packages_dir in self._site_packages_dirs():
+                self._path_cache.invalidate(site_packages_dir)
+            missing = [
+                (import_name, distro_name) for import_name, distro_name in missing
+                if not self._is_importable(import_name)
+            ]
+
+            distro_names = []
+            for _, distro_name in missing:
+                if distro_name not in distro_names:
+                    distro_names.append(distro_name)
+
+            if len(distro_names) > 0:
+                self._debug("installing {} missing distributions: {}".format(
+                    len(distro_names),
+                    ", ".join(distro_names)
+                ))
+                if not self._install_from_store(distro_names):
+                    self._install_many(distro_names, *distro_names)
+
+        return distro_names
+
+    def _install_many(self, reqs, *install_args):
+        """Run ``pip install`` with ``install_args``, preferring the wheels
+        in the local wheelhouse over the package index.
+
+        When there are several requirements in ``reqs``, wheels for the ones
+        that are not in the wheelhouse yet are downloaded (or built) into it
+        first, concurrently when parallel installs are enabled, so that pip
+        only has to unpack them. A single requirement is installed with one
+        ``pip install`` that uses the wheelhouse as an extra source. In
+        offline mode only the wheelhouse is used.
+
+        :param list reqs: The requirement specifiers that ``install_args`` will install
+        :param install_args: The arguments to pass to ``pip install``
+        :returns: The requirements in ``reqs`` that are not satisfied afterwards
+        """
+        from pipless.installer import ParallelInstaller, Wheelhouse, default_jobs, requirements_options
+
+        self._note_requested(reqs)
+        wheelhouse = Wheelhouse(os.path.join(CACHE_DIR, "wheelhouse"))
+        if self.offline:
+            self._pip_main("install", "--no-index", "--find-links", wheelhouse.path, *install_args)
+            return self._check_installed(reqs)
+
+        jobs = self.install_jobs
+        if jobs is None:
+            jobs = default_jobs()
+
+        # wheels that a prefetch is building are waited for instead of being
+        # built again. Python 2 holds the import lock during installs from the
+        # hook, a prefetch that has yet to start pip may be waiting for it
+        if self._prefetcher is not None:
+            self._prefetcher.take(reqs, wait_for_starting=not self._imp.lock_held())
+
+        if len(reqs) < 2:
+            # building the wheel first only pays off when builds can overlap
+            find_links = ["--find-links", wheelhouse.path] if os.path.isdir(wheelhouse.path) else []
+            self._pip_main("install", *(find_links + list(install_args)))
+            return self._check_installed(reqs)
+
+        missing = wheelhouse.missing(reqs)
+        failed = []
+        if len(missing) > 0:
+            wheelhouse.ensure_exists()
+            with self._tracer.span("build_wheels", reqs=missing):
+                installer = ParallelInstaller(jobs=jobs, log=self._debug)
+                failed = installer.build(missing, wheelhouse.path)
+
+        # options in a requirements file (e.g. --index-url) are left to pip
+        plain = all(not arg.startswith("-") for arg in install_args) or (
+            install_args[0] == "-r" and len(install_args) == 2 and
+            len(requirements_options(install_args[1])) == 0
+        )
+        if len(failed) == 0 and plain:
+            if self._pip_main("install", "--no-index", "--find-links", wheelhouse.path, *install_args) == 0:
+                return self._check_installed(reqs)
+            self._debug("could not install from the wheelhouse alone, using the package index")
+
+        self._pip_main("install", "--find-links", wheelhouse.path, *install_args)
+        return self._check_installed(reqs)
+
+    def _check_installed(self, reqs, report=True):
+        """Verify that every requirement in ``reqs`` (and its dependencies)
+        is satisfied by the current environment. Unsatisfied requirements
+        are reported, not raised.
+
+        :param list reqs: The requirement specifiers to check
+        :param bool report: Print the requirements that are not satisfied
+        :returns: The list of requirements that are not satisfied
+        """
+        self._refresh_pip()
+        from pip._vendor import pkg_resources
+
+        unsatisfied = []
+        for req in reqs:
+            try:
+                pkg_resources.require(req)
+            except (pkg_resources.DistributionNotFound, pkg_resources.VersionConflict) as e:
+                if report:
+                    self._info("requirement {!r} is not satisfied: {}".format(req, e))
+                unsatisfied.append(req)
+            except ValueError:
+                # not a plain requirement specifier (e.g. a url), leave it to pip
+                pass
+        return unsatisfied
+
+    def _get_package_store(self):
+        """Return the :class:`pipless.store.PackageStore` for the current
+        environment, or ``None`` if the package store is disabled
+        """
+        if not self.package_store:
+            return None
+
+        if self._package_store is None:
+            from distutils.sysconfig import get_python_lib
+            from pipless.store import PackageStore
+            self._package_store = PackageStore(
+                os.path.join(CACHE_DIR, "store"),
+                get_python_lib(),
+                os.path.dirname(sys.executable),
+                log = self._debug
+            )
+        return self._package_store
+
+    def _install_from_store(self, reqs):
+        """Hardlink the distributions in ``reqs`` (and their dependencies)
+        into site-packages from the package store, if it has matching versions.
+
+        :param list reqs: The requirement specifiers to install
+        :returns: ``True`` if every requirement is satisfied afterwards, so that
+            pip does not need to run at all
+        """
+        store = self._get_package_store()
+        if store is None or len(reqs) == 0:
+            return False
+
+        self._note_requested(reqs)
+        from pip._vendor import pkg_resources
         try:
-            self._pip.main(list(args))
-        finally:
+            requirements = [pkg_resources.Requirement.parse(req) for req in reqs]
+        except ValueError:
+            # not a plain requirement specifier (e.g. a url), leave it to pip
+            return False
+
+        # shares the installed versions and site-packages with _pip_main
+        with self._pip_lock:
+            if self._known_versions is None:
+                self._known_versions = self._installed_versions()
+            installed = set(
+                pkg_resources.safe_name(name).lower()
+                for name in self._known_versions
+            )
+            def is_installed(name):
+                return pkg_resources.safe_name(name).lower() in installed
+
+            materialized = []
+            seen = set()
+            with self._tracer.span("package_store", reqs=list(reqs)) as span:
+                for requirement in requirements:
+                    try:
+                        materialized.extend(store.materialize(requirement, is_installed, seen))
+                    except (IOError, OSError) as e:
+                        self._debug("could not materialize {} from the package store: {}".format(requirement, e))
+                span.set("materialized", materialized)
+
+            if len(materialized) > 0:
+                self._info("installed from the package store: {}".format(", ".join(materialized)))
+                for site_packages_dir in self._site_packages_dirs():
+                    self._path_cache.invalidate(site_packages_dir)
+                self._learn_mappings(self._track_installs())
+
+            return len(self._check_installed(reqs, report=False)) == 0
+
+    def _add_to_store(self, distro_names):
+        """Capture the installed distributions ``distro_names`` into the
+        package store so that other virtual environments can share them
+        """
+        store = self._get_package_store()
+        if store is None or len(distro_names) == 0:
+            return
+
+        from pip._vendor import pkg_resources
+        with self._tracer.span("package_store_add", distros=list(distro_names)):
+            for distro_name in distro_names:
+                try:
+                    store.capture(pkg_resources.get_distribution(distro_name))
+                except (pkg_resources.DistributionNotFound, IOError, OSError) as e:
+                    self._debug("could not add {} to the package store: {}".format(distro_name, e))
+
+    def _learn_mappings(self, distro_names):
+        """Save the import names that the installed distributions
+        ``distro_names`` provide into the learned mappings file
+        """
+        if len(distro_names) == 0:
+            return
+
+        from pip._vendor import pkg_resources
+        from pipless.harvest import LearnedMappings, top_level_names
+
+        def metadata(dist, name):
+            if not dist.has_metadata(name):
+                return None
+            return dist.get_metadata(name)
+
+        pairs = []
+        for distro_name in distro_names:
+            try:
+                dist = pkg_resources.get_distribution(distro_name)
+                names = top_level_names(metadata(dist, "top_level.txt"), metadata(dist, "RECORD"))
+            except (pkg_resources.DistributionNotFound, IOError, OSError) as e:
+                self._debug("could not read the metadata of {}: {}".format(distro_name, e))
+                continue
+            pairs.extend((name, dist.project_name) for name in names)
+
+        learned = LearnedMappings(os.path.join(CACHE_DIR, "learned-mappings.txt"))
+        added = learned.add(pairs)
+        if added > 0:
+            self._debug("learned {} new import name mappings".format(added))
+            try:
+                learned.save()
+            except (IOError, OSError) as e:
+                self._debug("could not save the learned mappings: {}".format(e))
+
+    def _is_importable(self, fullname):
+        """Check if the top-level module ``fullname`` can already be imported.
+        The ``sys.path`` listing cache is used when possible, falling back to
+        ``imp.find_module``.
+
+        :param str fullname: The top-level module name
+        """
+        found = self._path_cache.contains(fullname)
+        if found is not None:
+            return found
+
+        try:
+            self._imp.find_module(fullname)
+        except ImportError:
+            return False
+        return True
+
+    def _site_packages_dirs(self):
+        """Return the site-packages directories that pip installs into
+        """
+        from distutils.sysconfig import get_python_lib
+        return set([
+            get_python_lib(),
+            get_python_lib(plat_specific=True)
+        ])
+
+    def _pip_main(self, *args):
+        """Run pip.main with the specified ``args``
+
+        :returns: pip's exit status
+        """
+        from pipless.lock import NULL_LOCK
+
+        is_install = len(args) > 0 and args[0] == "install"
+        # installs into the venv are serialized across processes. pip's
+        # logging, the color codes written around its output and the install
+        # bookkeeping are shared by all importing threads
+        venv_lock = self._get_venv_lock() if is_install else NULL_LOCK
+        with venv_lock, self._pip_lock:
             if self.quiet:
-                pip_log.setLevel(_level)
+                import logging
+                pip_log = logging.getLogger("pip")
+                _level = pip_log.level
+                pip_log.setLevel(logging.CRITICAL)
             elif self._should_color():
-                self._sys.stdout.write("\x1b[0m")
-                self._sys.stdout.flush()
+                self._sys.stdout.write("\x1b[36m")
+
+            if is_install and self._known_versions is None:
+                self._known_versions = self._installed_versions()
+
+            start = time.time()
+            try:
+                with self._tracer.span("pip", args=list(args)) as span:
+                    status = self._pip_via_daemon(args) if is_install else None
+                    span.set("daemon", status is not None)
+                    if status is None:
+                        status = self._pip.main(list(args))
+                    span.set("status", status)
+                return status
+            finally:
+                if self._import_profiler is not None and is_install:
+                    # only keep the requirements, not options or paths
+                    self._import_profiler.record_install(
+                        " ".join(
+                            arg for arg in args[1:]
+                            if not arg.startswith("-") and os.sep not in arg
+                        ),
+                        time.time() - start
+                    )
+
+                if is_install:
+                    for site_packages_dir in self._site_packages_dirs():
+                        self._path_cache.invalidate(site_packages_dir)
+                    changed = self._track_installs()
+                    self._add_to_store(changed)
+                    self._learn_mappings(changed)
+
+                if self.quiet:
+                    pip_log.setLevel(_level)
+                elif self._should_color():
+                    self._sys.stdout.write("\x1b[0m")
+                    self._sys.stdout.flush()
+
+    def _get_daemon(self):
+        """Return a :class:`pipless.daemon.DaemonClient` if the pipless daemon
+        is running and should be used, else ``None``
+        """
+        if not self.use_daemon:
+            return None
 
-    def _get_pypi_distro_name(self, fullname):
+        with self._state_lock:
+            if self._daemon is None:
+                from pipless.daemon import DaemonClient
+                self._daemon = DaemonClient()
+        if not self._daemon.available:
+            return None
+        return self._daemon
+
+    def _pip_via_daemon(self, args):
+        """Have the pipless daemon run pip with ``args`` for this environment
+
+        :returns: pip's exit status, or ``None`` if the daemon is not available
+        """
+        daemon = self._get_daemon()
+        if daemon is None:
+            return None
+
+        response = daemon.pip(sys.executable, os.getcwd(), args)
+        if response is None:
+            self._debug("the pipless daemon is not available, running pip in-process")
+            return None
+
+        if not self.quiet:
+            self._sys.stdout.write(response["output"])
+            self._sys.stdout.flush()
+        return response["status"]
+
+    def _get_pypi_distro_name(self, fullname, search=True):
         """Lookup a mapping for the import name ``fullname`` in the
         mapping files. If a mapping of the package name to the distribution name
-        does not exist, check if an exact match exists in PyPI.
+        does not exist, check the offline PyPI name index if one exists.
+        Otherwise check the lookup cache and then check if an exact
+        match exists in PyPI.
 
         :param str fullname: the fullname of the package
+        :param bool search: ask the daemon and search PyPI if needed. If ``False``,
+            only the local mappings, index, cache and wheelhouse are used
         :returns: returns None if the distribution name is unknown, else
         the distribution (install) name
         """
@@ -544,6 +2353,50 @@ class PipLess(object):
         if mapped_name is not None:
             return mapped_name
 
+        # project mappings were checked above, the daemon only knows the global ones
+        daemon = self._get_daemon() if not self.offline and search else None
+        if daemon is not None:
+            response = daemon.lookup(fullname)
+            if response is not None:
+                if response.get("ignore", False):
+                    raise IgnoreMissingImport(fullname)
+                self._debug("daemon lookup: {} <-> {}".format(fullname, response["distro"]))
+                return response["distro"]
+
+        if self._pypi_index is not None:
+            distro_name = self._pypi_index.get(fullname)
+            self._debug("PyPI name index lookup: {} <-> {}".format(fullname, distro_name))
+            return distro_name
+
+        if self._lookup_cache is not None:
+            hit, distro_name = self._lookup_cache.get(fullname)
+            if hit:
+                self._debug("found cached lookup! {} <-> {}".format(fullname, distro_name))
+                return distro_name
+
+        if self.offline:
+            from pipless.installer import Wheelhouse
+            wheelhouse = Wheelhouse(os.path.join(CACHE_DIR, "wheelhouse"))
+            distro_name = wheelhouse.find_project(fullname)
+            self._debug("offline wheelhouse lookup: {} <-> {}".format(fullname, distro_name))
+            return distro_name
+
+        if not search:
+            return None
+
+        with self._tracer.span("pypi_search", module=fullname) as span:
+            distro_name = self._search_pypi(fullname)
+            span.set("distro_name", distro_name)
+        if self._lookup_cache is not None:
+            self._lookup_cache.set(fullname, distro_name)
+        return distro_name
+
+    def _search_pypi(self, fullname):
+        """Search PyPI for a distribution whose name exactly matches ``fullname``
+
+        :param str fullname: the fullname of the package
+        :returns: ``fullname`` if an exact match exists, else None
+        """
         # TODO maybe use xmlrpclib directly instead of going through pip? - see
         # https://wiki.python.org/moin/PyPIXmlRpc for a good example.
         searcher = self._search_command()
@@ -664,12 +2517,40 @@ def _run_python_module(module_name):
         return
 
 
+def _prescan_imports(script_file=None, python_module=None):
+    """Statically collect the top-level imports of the script that is about
+    to be run (see :func:`pipless.scan.scan_imports`). When a module is being
+    run with ``-m``, the module's own top-level package is included as well.
+
+    :param str script_file: The path of the script that will be run
+    :param str python_module: The name of the module that will be run
+    :returns: A set of top-level import names
+    """
+    from pipless.scan import scan_imports
+
+    if python_module is not None:
+        try:
+            mod_path = _find_module_path(python_module)
+        except ImportError:
+            return set([python_module.split(".")[0]])
+
+        if os.path.isdir(mod_path):
+            mod_path = os.path.join(mod_path, "__main__.py")
+        script_file = mod_path
+
+    if script_file is None or not os.path.isfile(script_file):
+        return set()
+
+    imports, _ = scan_imports(script_file, [os.path.dirname(os.path.abspath(script_file))])
+    return imports
+
+
 def _run_interactive_shell():
     """Run an interactive shell as if it were the first thing being
     run.
     """
+    import code as code_
     builtins = __builtins__
-    code_ = code
 
     import __main__
     __main__.__dict__.clear()
@@ -685,25 +2566,78 @@ def _run_interactive_shell():
     code_.interact()
 
 
-def _find_file(file_name, start_dir):
-    """Recursively search upwards in the directory tree until a
-    venv folder is located. If not found, None is returned
+def _find_project_files(start_dir):
+    """Find the nearest ``venv``, ``requirements.txt`` and ``pipless-mappings.txt``
+    above ``start_dir`` in a single upward scan that stops at the project
+    root, cached between runs.
+
+    :param str start_dir: The directory from which to search upwards
+    :returns: A dict of file name -> path for the files that were found
+    """
+    from pipless.project import ProjectFinder
+    return ProjectFinder(os.path.join(CACHE_DIR, "project-roots.json")).find(start_dir)
+
+
+def serve_daemon(socket_path=None, debug=False):
+    """Run the pipless daemon in the foreground until interrupted. Other
+    pipless processes send it their PyPI lookups and installs.
 
-    :param str start_dir: The start directory from which to search upwards for a venv folder
+    :param str socket_path: The Unix socket to listen on (default ``~/.cache/pipless/daemon.sock``)
+    :param bool debug: Print every request
     """
-    venv_path = None
-    curr_path = os.path.abspath(start_dir)
-    while True:
-        test_path = os.path.join(curr_path, file_name)
-        if os.path.exists(test_path):
-            venv_path = test_path
-            break
-        new_path = os.path.abspath(os.path.join(curr_path, ".."))
-        if new_path == curr_path:
-            break
-        curr_path = new_path
+    from pipless.daemon import PiplessDaemon
+    PiplessDaemon(socket_path, debug=debug).serve_forever()
+
+
+def rebuild_pypi_index(source=None, path=None):
+    """Rebuild the offline PyPI name index. Once the index exists, pipless
+    will use it instead of searching PyPI to determine if a missing import
+    can be installed.
+
+    :param str source: The URL of a simple index, the path to a saved simple index
+        page, the path to a local mirror's ``simple`` directory, or a text file of
+        project names. Defaults to https://pypi.org/simple/
+    :param str path: Where to save the index. Defaults to ``~/.cache/pipless/pypi-names.idx``
+    :returns: The number of project names in the new index
+    """
+    from pipless.index import build_pypi_index, DEFAULT_SIMPLE_INDEX
+
+    if source is None:
+        source = DEFAULT_SIMPLE_INDEX
+    if path is None:
+        path = os.path.join(CACHE_DIR, "pypi-names.idx")
+
+    return build_pypi_index(path, source)
 
-    return venv_path
+
+def harvest_mappings(paths=None):
+    """Learn import name -> distribution name mappings from the metadata of the
+    distributions at ``paths`` and save them into the learned mappings file,
+    which pipless checks before looking anything up on PyPI.
+
+    :param list paths: Virtual environments, site-packages directories, directories of
+        wheels or wheel files. Defaults to the pipless wheelhouse and the site-packages
+        directories of the running interpreter.
+    :returns: ``(found, added)``, the number of mappings found and how many of them were new
+    """
+    from distutils.sysconfig import get_python_lib
+    from pipless.harvest import LearnedMappings, harvest_path
+
+    if not paths:
+        paths = [
+            os.path.join(CACHE_DIR, "wheelhouse"),
+            get_python_lib(),
+            get_python_lib(plat_specific=True),
+        ]
+
+    pairs = []
+    for path in sorted(set(paths)):
+        pairs.extend(harvest_path(path))
+
+    learned = LearnedMappings(os.path.join(CACHE_DIR, "learned-mappings.txt"))
+    added = learned.add(pairs)
+    learned.save()
+    return len(pairs), added
 
 
 def init(
@@ -712,7 +2646,10 @@ def init(
         quiet                = False,
         clear                = False,
         system_site_packages = False,
-        python               = None
+        python               = None,
+        lookup_cache         = True,
+        trace                = None,
+        profile_imports      = None,
     ):
     """Init pipless to work in the currently-running python script.
 
@@ -734,7 +2671,11 @@ def init(
     :param bool clear: if virtualenv should be run with --clear
     :param bool system_site_packages: if virtualenv should be run with --system-site-packages
     :param str python: the path to the python executable to use in the virtual environment.
+    :param bool lookup_cache: if PyPI lookups should be cached on disk
+    :param str trace: the path of a Chrome trace file to record pipless's activity into
+    :param str profile_imports: the path of a file to save an import-time profile into
     """
+    import inspect
     currframe = inspect.currentframe()
     calling_frame_info = inspect.getouterframes(currframe, 2)[1]
     calling_frame,calling_file,_,_,_,_ = calling_frame_info
@@ -749,9 +2690,15 @@ def init(
             system_site_packages = system_site_packages,
             python               = python
         ),
+        cache_opts   = dict(
+            enabled = lookup_cache
+        ),
+        trace           = trace,
+        profile_imports = profile_imports,
     )
     # NOTE: do not activate it!
     sys.meta_path.append(pipless_import_hook)
+    pipless_import_hook.start_import_profiler()
 
 
 # TODO it might be time to pull all of these options out into
@@ -773,11 +2720,33 @@ def main(
         venv_clear                = False,
         venv_python               = None,
         venv_system_site_packages = False,
+        lookup_cache              = True,
+        lookup_cache_ttl          = None,
+        lookup_cache_negative_ttl = None,
+        lookup_cache_size         = None,
+        pypi_index                = None,
+        no_pypi_index             = False,
+        prescan                   = True,
+        install_jobs              = None,
+        trace                     = None,
+        profile_imports           = None,
+        venv_templates            = True,
+        venv_without_pip          = False,
+        package_store             = True,
+        offline                   = False,
+        in_process                = False,
+        use_daemon                = True,
+        forkserver                = False,
+        preload                   = None,
+        use_forkserver            = True,
+        prefetch                  = True,
+        speculate                 = True,
     ):
     """Find or create a virtual environment, setup the automatic
     importer, and run an interactive shell or a script at the provided path.
 
-    Note that if no ``venv_path`` is specified, all parent directories will be
+    Note that if no ``venv_path`` is specified, all parent directories up to
+    the first one with a ``venv`` folder or a ``requirements.txt`` file will be
     searched for a ``venv`` folder.
 
     E.g., if pipless is run in the directory ``/tmp/test/a/b/c``, and ``venv_path`` is
@@ -811,6 +2780,40 @@ def main(
     :param bool venv_clear: Clear out the virtual environment and start over (virtualenv --clear)
     :param str venv_python: The python executable to use (virtualenv --python)
     :param bool venv_system_site_packages: Use system site packages when create the virtual environment (virtualenv --system-site-packages)
+    :param bool lookup_cache: Cache PyPI lookups on disk between runs
+    :param int lookup_cache_ttl: Seconds that a found distribution stays cached
+    :param int lookup_cache_negative_ttl: Seconds that a "not on PyPI" result stays cached
+    :param int lookup_cache_size: The maximum number of cached lookups
+    :param str pypi_index: The path to the offline PyPI name index (see :func:`rebuild_pypi_index`)
+    :param bool no_pypi_index: Never use the offline PyPI name index, even if it exists
+    :param bool prescan: Statically scan the script (or module) for imports and install
+        all missing distributions at once before it is run
+    :param int install_jobs: The maximum number of distributions to download and build
+        concurrently (defaults to the number of CPUs)
+    :param str trace: Save a Chrome trace (``chrome://tracing``) of every pipless phase to this file
+    :param str profile_imports: Save the time taken by every import to this file, as folded
+        stacks (flamegraph compatible), or as a JSON tree if the file name ends with ``.json``
+    :param bool venv_templates: Create new virtual environments from (and save them to) the
+        cache of virtual environments with identical requirements
+    :param bool venv_without_pip: Don't install pip, setuptools or wheel into a new virtual
+        environment (only useful with ``no_install``)
+    :param bool package_store: Hardlink distributions from (and save them to) the per-user
+        store shared by all virtual environments, instead of installing them again
+    :param bool offline: Install only from the local wheelhouse of previously downloaded
+        and built wheels, never contacting PyPI
+    :param bool in_process: Activate the virtual environment without re-executing pipless with
+        the venv's python, if the venv was created from the running interpreter
+    :param bool use_daemon: Hand PyPI lookups and installs to the pipless daemon (see
+        :func:`serve_daemon`) if one is running
+    :param bool forkserver: Instead of running anything, activate the venv, import the
+        ``preload`` modules and serve forked copies of this process to ``pipless script.py``
+        runs in the same venv
+    :param list preload: The modules the fork server imports before serving
+    :param bool use_forkserver: Run ``script_file`` in the venv's fork server if one is running
+    :param bool prefetch: When a distribution is installed, download the wheels of its
+        dependencies and of the other imports of the importing file in the background
+    :param bool speculate: When a module is missing, install the modules that followed it
+        in earlier runs of the same project in the background
     """
     script_dir = os.getcwd()
     if script_file is not None:
@@ -818,16 +2821,31 @@ def main(
         script_dir = os.path.dirname(script_file)
         sys.path[0] = script_dir
 
+    # the venv, requirements.txt and project mappings are all found in one
+    # scan up the directory tree
+    project_files = _find_project_files(script_dir)
+
+    if script_file is not None:
         if venv_path is None:
             # if we're running a script file through pipless, search from the script's
             # directory, not the cwd
-            venv_path = _find_file("venv", script_dir)
+            venv_path = project_files.get("venv", None)
             if venv_path is None:
                 venv_path = os.path.join(os.path.dirname(script_file), "venv")
 
     elif venv_path is None:
         venv_path = os.path.join(os.getcwd(), "venv")
 
+    if script_file is not None and use_forkserver and not forkserver:
+        from pipless.forkserver import run_script, socket_path_for
+        status = run_script(socket_path_for(venv_path), sys.argv)
+        if status is not None:
+            sys.exit(status)
+
+    requirements_path = None
+    if not no_auto_requirements:
+        requirements_path = project_files.get("requirements.txt", None)
+
     pipless_import_hook = PipLess(
         venv_path    = venv_path,
         no_venv      = no_venv,
@@ -840,26 +2858,79 @@ def main(
         venv_opts    = dict(
             clear                = venv_clear,
             python               = venv_python,
-            system_site_packages = venv_system_site_packages
+            system_site_packages = venv_system_site_packages,
+            templates            = venv_templates,
+            without_pip          = venv_without_pip
         ),
         python_opts = dict(
             module = python_module,
             cmd    = python_cmd
-        )
+        ),
+        cache_opts  = dict(
+            enabled      = lookup_cache,
+            ttl          = lookup_cache_ttl,
+            negative_ttl = lookup_cache_negative_ttl,
+            max_entries  = lookup_cache_size
+        ),
+        index_opts  = dict(
+            enabled = not no_pypi_index,
+            path    = pypi_index
+        ),
+        prescan           = prescan,
+        install_jobs      = install_jobs,
+        trace             = trace,
+        profile_imports   = profile_imports,
+        requirements_path = requirements_path,
+        package_store     = package_store,
+        offline           = offline,
+        in_process        = in_process,
+        mappings_path     = project_files.get("pipless-mappings.txt", None),
+        use_daemon        = use_daemon,
+        forkserver_opts   = dict(
+            serve   = forkserver,
+            preload = preload,
+            use     = use_forkserver
+        ),
+        prefetch          = prefetch,
+        speculate         = speculate,
     )
     pipless_import_hook.activate()
 
-    if not no_auto_requirements:
-        requirements_path = _find_file("requirements.txt", script_dir)
-        if requirements_path is not None:
-            # at this point we should be in the virtual environment, so
-            # go ahead and install
-            pipless_import_hook.install_requirements(requirements_path)
+    if requirements_path is not None:
+        # at this point we should be in the virtual environment, so
+        # go ahead and install
+        unsatisfied = pipless_import_hook.install_requirements(requirements_path)
+        # a venv that is missing requirements must not become a template,
+        # a later run that satisfies them will save it instead
+        if len(unsatisfied) == 0:
+            pipless_import_hook.save_venv_template()
+
+    tracer = pipless_import_hook._tracer
+    pipless_import_hook.start_import_profiler()
+
+    if not no_install and prescan and not forkserver:
+        # install everything the script is known to need in one go. The
+        # import hook below still catches any dynamic imports
+        with tracer.span("prescan"):
+            pipless_import_hook.install_missing(
+                _prescan_imports(script_file, python_module)
+            )
 
     if not no_install:
         # setup the automatic imports using the venv_path
         sys.meta_path.append(pipless_import_hook)
 
+    if forkserver:
+        from pipless.forkserver import ForkServer, socket_path_for
+        ForkServer(
+            socket_path_for(venv_path),
+            preload = preload,
+            log     = pipless_import_hook._info
+        ).serve_forever()
+        return
+
+    tracer.instant("run")
+
     if script_file is not None:
         _run_script(script_file)
 
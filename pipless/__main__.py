@@ -100,6 +100,30 @@ if __name__ == "__main__":
         action  = "store_true",
         default = False
     )
+    parser.add_argument("--no-prescan",
+        help    = "Don't scan the script for imports and install missing packages before running it",
+        action  = "store_false",
+        default = True,
+        dest    = "prescan"
+    )
+    parser.add_argument("-j", "--install-jobs",
+        help    = "The maximum number of packages to download and build at once (default: number of CPUs)",
+        metavar = "N",
+        type    = int,
+        default = None
+    )
+    parser.add_argument("--trace",
+        help    = "Save a Chrome trace (chrome://tracing) of each pipless phase into FILE",
+        metavar = "FILE",
+        default = None
+    )
+    parser.add_argument("--profile-imports",
+        help    = """Save the time taken by every import into FILE as folded
+stacks (flamegraph.pl/speedscope), or as a JSON tree
+sorted by total time if FILE ends with .json""",
+        metavar = "FILE",
+        default = None
+    )
     parser.add_argument("remainder",
         help  = "script-specific arguments (not pipless arguments)",
         nargs = argparse.REMAINDER
@@ -142,8 +166,181 @@ site-packages.""",
         dest    = "venv_system_site_packages"
     )
 
+    cache_group = parser.add_argument_group("PyPI lookup cache options")
+    cache_group.add_argument("--no-lookup-cache",
+        help    = "Don't cache PyPI lookups between runs",
+        action  = "store_false",
+        default = True,
+        dest    = "lookup_cache"
+    )
+    cache_group.add_argument("--lookup-cache-ttl",
+        help    = "Seconds that a found distribution name stays cached (default one week)",
+        metavar = "SECONDS",
+        type    = int,
+        default = None
+    )
+    cache_group.add_argument("--lookup-cache-negative-ttl",
+        help    = "Seconds that a 'not on PyPI' result stays cached (default one day)",
+        metavar = "SECONDS",
+        type    = int,
+        default = None
+    )
+    cache_group.add_argument("--lookup-cache-size",
+        help    = "The maximum number of cached lookups (default 5000)",
+        metavar = "N",
+        type    = int,
+        default = None
+    )
+
+    index_group = parser.add_argument_group("Offline PyPI name index options")
+    index_group.add_argument("--pypi-index",
+        help    = "The path to the offline PyPI name index (default ~/.cache/pipless/pypi-names.idx)",
+        metavar = "PATH",
+        default = None
+    )
+    index_group.add_argument("--no-pypi-index",
+        help    = "Don't use the offline PyPI name index, even if it exists",
+        action  = "store_true",
+        default = False
+    )
+    index_group.add_argument("--rebuild-pypi-index",
+        help    = """Rebuild the offline PyPI name index and exit. SOURCE may be
+the URL of a simple index, a saved simple index page,
+a local mirror's simple directory, or a file of
+project names (default https://pypi.org/simple/)""",
+        metavar = "SOURCE",
+        nargs   = "?",
+        const   = "",
+        default = None
+    )
+
+    mappings_group = parser.add_argument_group("Learned mappings options")
+    mappings_group.add_argument("--harvest-mappings",
+        help    = """Learn import name -> distribution name mappings from the
+metadata of the distributions in each PATH (virtual
+environments, site-packages directories, directories of
+wheels or wheel files) and exit. Defaults to the wheelhouse
+and this interpreter's site-packages""",
+        metavar = "PATH",
+        nargs   = "*",
+        default = None
+    )
+
+    venv_group.add_argument("--no-venv-templates",
+        help    = """Don't create the virtual environment from (or save it to) the
+cache of virtual environments with identical requirements""",
+        action  = "store_false",
+        default = True,
+        dest    = "venv_templates"
+    )
+
+    venv_group.add_argument("--without-pip",
+        help    = """Don't install pip, setuptools or wheel into a new virtual
+environment. Only useful with --no-install.""",
+        action  = "store_true",
+        default = False,
+        dest    = "venv_without_pip"
+    )
+
+    venv_group.add_argument("--in-process",
+        help    = """Activate the virtual environment inside the running
+interpreter instead of restarting pipless with the venv's
+python. Only used if the venv was created from the same
+interpreter.""",
+        action  = "store_true",
+        default = False,
+        dest    = "in_process"
+    )
+
+    parser.add_argument("--no-package-store",
+        help    = """Don't share installed distributions with other virtual
+environments through the per-user package store
+(~/.cache/pipless/store)""",
+        action  = "store_false",
+        default = True,
+        dest    = "package_store"
+    )
+    parser.add_argument("--no-prefetch",
+        help    = """Don't download the wheels of the dependencies of installed
+distributions (and of the other imports of the importing
+file) into the wheelhouse in the background""",
+        action  = "store_false",
+        default = True,
+        dest    = "prefetch"
+    )
+    parser.add_argument("--no-speculate",
+        help    = """Don't install the modules that usually follow a missing
+module in this project (learned from earlier runs) in the
+background""",
+        action  = "store_false",
+        default = True,
+        dest    = "speculate"
+    )
+    parser.add_argument("--offline",
+        help    = """Never contact PyPI, only install wheels from the local
+wheelhouse of everything pipless has downloaded or built
+before (~/.cache/pipless/wheelhouse)""",
+        action  = "store_true",
+        default = False
+    )
+
+    daemon_group = parser.add_argument_group("Daemon options")
+    daemon_group.add_argument("--serve-daemon",
+        help    = """Run the pipless daemon in the foreground. Other pipless
+processes hand their PyPI lookups and installs to it over
+a Unix socket (~/.cache/pipless/daemon.sock)""",
+        action  = "store_true",
+        default = False
+    )
+    daemon_group.add_argument("--no-daemon",
+        help    = "Don't use the pipless daemon, even if it is running",
+        action  = "store_false",
+        default = True,
+        dest    = "use_daemon"
+    )
+
+    forkserver_group = parser.add_argument_group("Fork server options")
+    forkserver_group.add_argument("--forkserver",
+        help    = """Activate the virtual environment, import the --preload
+modules and wait for 'pipless script.py' runs in the
+same venv, which then run in a fork of this process""",
+        action  = "store_true",
+        default = False
+    )
+    forkserver_group.add_argument("--preload",
+        help    = "A module for the fork server to import before serving (may be repeated)",
+        metavar = "MODULE",
+        action  = "append",
+        default = None
+    )
+    forkserver_group.add_argument("--no-forkserver",
+        help    = "Don't run the script in the venv's fork server, even if one is running",
+        action  = "store_false",
+        default = True,
+        dest    = "use_forkserver"
+    )
+
     opts, remainder = _do_arg_parse(parser)
 
+    if opts.serve_daemon:
+        pipless.serve_daemon(debug=opts.debug)
+        sys.exit(0)
+
+    if opts.rebuild_pypi_index is not None:
+        count = pipless.rebuild_pypi_index(
+            source = opts.rebuild_pypi_index or None,
+            path   = opts.pypi_index
+        )
+        if not opts.quiet:
+            print("Indexed {} project names".format(count))
+        sys.exit(0)
+
+    if opts.harvest_mappings is not None:
+        found, added = pipless.harvest_mappings(opts.harvest_mappings)
+        if not opts.quiet:
+            print("Found {} mappings, {} of them new".format(found, added))
+        sys.exit(0)
+
     script_file = None
     
     # this should mean that we're directly running a script
@@ -166,6 +363,18 @@ site-packages.""",
         no_install       = opts.no_install,
         color            = opts.color,
         no_color         = opts.no_color,
+        prescan          = opts.prescan,
+        install_jobs     = opts.install_jobs,
+        trace            = opts.trace,
+        profile_imports  = opts.profile_imports,
+        package_store    = opts.package_store,
+        offline          = opts.offline,
+        use_daemon       = opts.use_daemon,
+        forkserver       = opts.forkserver,
+        preload          = opts.preload,
+        use_forkserver   = opts.use_forkserver,
+        prefetch         = opts.prefetch,
+        speculate        = opts.speculate,
 
         # python-specific arguments
         python_module    = opts.python_module,
@@ -175,4 +384,17 @@ site-packages.""",
         venv_clear                = opts.venv_clear,
         venv_python               = opts.venv_python,
         venv_system_site_packages = opts.venv_system_site_packages,
+        venv_templates            = opts.venv_templates,
+        venv_without_pip          = opts.venv_without_pip,
+        in_process                = opts.in_process,
+
+        # lookup cache arguments
+        lookup_cache              = opts.lookup_cache,
+        lookup_cache_ttl          = opts.lookup_cache_ttl,
+        lookup_cache_negative_ttl = opts.lookup_cache_negative_ttl,
+        lookup_cache_size         = opts.lookup_cache_size,
+
+        # offline PyPI name index arguments
+        pypi_index                = opts.pypi_index,
+        no_pypi_index             = opts.no_pypi_index,
     )
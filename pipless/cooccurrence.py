@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Created by James "d0c_s4vage" Johnson
+# https://github.com/d0c-s4vage/pipless
+# MIT License
+
+
+"""
+Learn which missing imports of a project tend to follow each other, so
+that the likely followers can be installed before they are imported.
+
+Every run records the order in which the import hook had to install
+modules. Across runs the model counts, for every module ``a``, in how many
+runs it was missing and how often each other module ``b`` was missing
+later in the same run. When ``a`` is missing again (e.g. in a new, empty
+virtual environment) the modules that followed it in at least
+``threshold`` of those runs are installed in the background.
+
+The model also counts how many speculative installs were made and how
+many of them were imported afterwards (hits), so that it can be judged
+whether speculating pays off.
+
+Models are saved per project in ``~/.cache/pipless/cooccurrence/``.
+"""
+
+
+import hashlib
+import json
+import os
+
+
+def model_path_for(cache_dir, project_dir):
+    """Return the path of the model of the project in ``project_dir``
+    """
+    key = hashlib.sha256(os.path.abspath(project_dir).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache_dir, "cooccurrence", key + ".json")
+
+
+def _empty_model():
+    return dict(runs={}, pairs={}, distros={}, speculated=0, hits=0)
+
+
+class CooccurrenceModel(object):
+    """The co-occurrence counts of one project, plus what happened during
+    the current run
+    """
+
+    def __init__(self, path, threshold=0.5, min_runs=1, max_followers=5):
+        """
+        :param str path: The path of the model file
+        :param float threshold: The minimum fraction of runs in which a module must
+            have followed another one to be installed speculatively
+        :param int min_runs: The minimum number of runs a module must have been
+            missing in before its followers are predicted
+        :param int max_followers: The maximum number of modules installed
+            speculatively after a single one
+        """
+        self.path          = path
+        self.threshold     = threshold
+        self.min_runs      = min_runs
+        self.max_followers = max_followers
+        self.model         = self._read()
+
+        # this run
+        self.observed   = []
+        self.distros    = {}
+        self.speculated = {}
+        self.hits       = set()
+
+    def _read(self):
+        try:
+            with open(self.path, "r") as f:
+                model = json.load(f)
+        except (IOError, OSError, ValueError):
+            return _empty_model()
+        if not isinstance(model, dict):
+            return _empty_model()
+
+        empty = _empty_model()
+        for key, value in empty.items():
+            if not isinstance(model.get(key, None), type(value)):
+                model[key] = value
+        return model
+
+    def observe(self, import_name, distro_name):
+        """Record that ``import_name`` was missing and installed as ``distro_name``
+        """
+        if import_name not in self.distros:
+            self.observed.append(import_name)
+        self.distros[import_name] = distro_name
+
+    def followers(self, import_name):
+        """Return the ``(import_name, distro_name)`` pairs that are likely to
+        be missing next, most likely first. Modules that were already missing
+        or speculated on during this run are left out.
+        """
+        runs = self.model["runs"].get(import_name, 0)
+        if runs < max(1, self.min_runs):
+            return []
+
+        candidates = []
+        for name, count in self.model["pairs"].get(import_name, {}).items():
+            if name in self.distros or name in self.speculated:
+                continue
+            if name not in self.model["distros"]:
+                continue
+            probability = float(count) / runs
+            if probability >= self.threshold:
+                candidates.append((probability, name))
+
+        candidates.sort(key=lambda item: (-item[0], item[1]))
+        return [
+            (name, self.model["distros"][name])
+            for _, name in candidates[:self.max_followers]
+        ]
+
+    def speculate(self, followers):
+        """Record that the ``(import_name, distro_name)`` pairs in
+        ``followers`` are being installed speculatively
+        """
+        for import_name, distro_name in followers:
+            self.speculated[import_name] = distro_name
+
+    def record_hit(self, import_name):
+        """Record that ``import_name`` is being imported. Returns ``True`` if
+        it was installed speculatively, i.e. the speculation was a hit.
+        """
+        if import_name not in self.speculated or import_name in self.hits:
+            return False
+        self.hits.add(import_name)
+        self.observe(import_name, self.speculated[import_name])
+        return True
+
+    def unused(self):
+        """Return the distribution names that were installed speculatively
+        during this run but none of whose import names were imported
+        """
+        used = set(self.speculated[import_name] for import_name in self.hits)
+        return sorted(set(
+            distro_name for distro_name in self.speculated.values()
+            if distro_name not in used
+        ))
+
+    def stats(self):
+        """Return the number of speculative installs, the number of hits and
+        the hit rate, over all saved runs and this one
+        """
+        speculated = self.model["speculated"] + len(self.speculated)
+        hits = self.model["hits"] + len(self.hits)
+        return dict(
+            speculated = speculated,
+            hits       = hits,
+            hit_rate   = (float(hits) / speculated) if speculated > 0 else None,
+        )
+
+    def save(self):
+        """Merge this run into the model file, once at the end of the run.
+        Runs saved by other processes since the model was loaded are kept.
+        """
+        import tempfile
+
+        if len(self.observed) == 0 and len(self.speculated) == 0:
+            return
+
+        model = self._read()
+        for idx, import_name in enumerate(self.observed):
+            model["runs"][import_name] = model["runs"].get(import_name, 0) + 1
+            model["distros"][import_name] = self.distros[import_name]
+            pairs = model["pairs"].setdefault(import_name, {})
+            for follower in self.observed[idx + 1:]:
+                pairs[follower] = pairs.get(follower, 0) + 1
+        model["speculated"] += len(self.speculated)
+        model["hits"] += len(self.hits)
+
+        model_dir = os.path.dirname(self.path)
+        try:
+            if not os.path.exists(model_dir):
+                os.makedirs(model_dir)
+            fd, tmp_path = tempfile.mkstemp(dir=model_dir, prefix=".cooccurrence-")
+            with os.fdopen(fd, "w") as f:
+                json.dump(model, f)
+            os.rename(tmp_path, self.path)
+        except (IOError, OSError):
+            pass
@@ -0,0 +1,412 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Created by James "d0c_s4vage" Johnson
+# https://github.com/d0c-s4vage/pipless
+# MIT License
+
+
+"""
+A long-lived pipless process that other pipless processes can hand their
+PyPI lookups and installs to over a Unix domain socket.
+
+The daemon keeps pip imported and the mapping tables, lookup cache and
+PyPI name index loaded, so lookups are answered without any of the
+startup work. pip also runs inside the daemon, with the client's virtual
+environment activated for the duration of the run, when that venv was
+made from the daemon's interpreter; other venvs get a ``python -m pip``
+subprocess. Installs into the same virtual environment (identified by its
+python executable) are serialized, and so are all in-process pip runs.
+
+Requests and responses are JSON objects, one per line:
+
+.. code-block:: text
+
+    {"op": "ping"}                                    -> {"ok": true}
+    {"op": "lookup", "name": "yaml"}                  -> {"ok": true, "distro": "PyYAML"}
+    {"op": "pip", "python": ..., "cwd": ..., "args": [...]}
+                                                      -> {"ok": true, "status": 0, "output": "..."}
+
+Start it with ``pipless --serve-daemon``. When no daemon is running, or it
+does not answer in time, pipless does everything itself.
+"""
+
+
+import distutils.sysconfig
+import json
+import os
+import sys
+import threading
+
+import pipless
+
+
+# seconds a client waits for a lookup (which may search PyPI) or any other
+# short request, and for a pip run
+DEFAULT_TIMEOUT = 60
+DEFAULT_PIP_TIMEOUT = 15 * 60
+
+
+def default_socket_path():
+    """Return the path of the daemon's socket
+    """
+    return os.environ.get(
+        "PIPLESS_DAEMON_SOCKET",
+        os.path.join(pipless.CACHE_DIR, "daemon.sock")
+    )
+
+
+def _make_server(socket_path, pipless_daemon):
+    """Create the threaded Unix socket server. socketserver is only
+    imported here, clients never need it.
+    """
+    from six.moves import socketserver
+
+    class RequestHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    break
+
+                try:
+                    request = json.loads(line.decode("utf-8"))
+                    response = pipless_daemon.handle(request)
+                except Exception as e:
+                    response = dict(ok=False, error=repr(e))
+
+                try:
+                    self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+                    self.wfile.flush()
+                except (IOError, OSError):
+                    # the client gave up waiting and closed the connection
+                    break
+
+        def finish(self):
+            try:
+                socketserver.StreamRequestHandler.finish(self)
+            except (IOError, OSError):
+                pass
+
+    class UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+    return UnixServer(socket_path, RequestHandler)
+
+
+def _exit_status(exc):
+    """Return the process exit status that the ``SystemExit`` ``exc`` stands for
+    """
+    if exc.code is None:
+        return 0
+    if isinstance(exc.code, int):
+        return exc.code
+    sys.stderr.write("{}\n".format(exc.code))
+    return 1
+
+
+def _venv_system_site_packages(venv_home):
+    """Check if the virtual environment at ``venv_home`` can see the global
+    site-packages
+    """
+    pyvenv_cfg = os.path.join(venv_home, "pyvenv.cfg")
+    if os.path.exists(pyvenv_cfg):
+        with open(pyvenv_cfg, "r") as f:
+            for line in f:
+                key, sep, value = line.partition("=")
+                if sep != "" and key.strip() == "include-system-site-packages":
+                    return value.strip().lower() == "true"
+        return False
+
+    # legacy virtualenv
+    lib_dir = os.path.join(venv_home, "lib", "python{}.{}".format(*sys.version_info[:2]))
+    return not os.path.exists(os.path.join(lib_dir, "no-global-site-packages.txt"))
+
+
+class PiplessDaemon(object):
+    """Answers lookup and install requests from pipless clients
+    """
+
+    def __init__(self, socket_path=None, debug=False):
+        """
+        :param str socket_path: The path of the Unix socket to listen on
+        :param bool debug: Print every request
+        """
+        if socket_path is None:
+            socket_path = default_socket_path()
+
+        self.socket_path = socket_path
+        self.debug       = debug
+
+        # a hook that never creates a venv or writes a requirements file, only
+        # used for its warm mappings, caches and pip
+        self.hook = pipless.PipLess(
+            no_venv      = True,
+            requirements = False,
+            quiet        = not debug,
+            debug        = debug,
+            use_daemon   = False,
+        )
+        # import pip now instead of during the first request
+        self.hook._pip
+
+        self._server      = None
+        self._lookup_lock = threading.Lock()
+        self._venv_locks  = {}
+        self._venv_locks_lock = threading.Lock()
+
+    def _venv_lock(self, python):
+        key = os.path.realpath(os.path.dirname(os.path.dirname(python)))
+        with self._venv_locks_lock:
+            if key not in self._venv_locks:
+                self._venv_locks[key] = threading.Lock()
+            return self._venv_locks[key]
+
+    def lookup(self, name):
+        """Return the distribution name of the import name ``name``
+        """
+        # pip's search command and the lookup cache are not thread-safe
+        with self._lookup_lock:
+            try:
+                distro_name = self.hook._get_pypi_distro_name(name)
+            except pipless.IgnoreMissingImport:
+                return dict(ok=True, ignore=True)
+        return dict(ok=True, distro=distro_name)
+
+    def pip(self, python, cwd, args):
+        """Run pip with ``args`` in ``cwd`` for the environment of ``python``,
+        one at a time per venv. pip runs in-process if the venv was made
+        from the daemon's interpreter, else ``python -m pip`` is run.
+        """
+        venv_home = os.path.dirname(os.path.dirname(os.path.abspath(python)))
+        with self._venv_lock(python):
+            if self._uses_daemon_interpreter(venv_home):
+                status, output = self._pip_in_process(venv_home, cwd, args)
+            else:
+                status, output = self._pip_subprocess(python, cwd, args)
+        return dict(ok=True, status=status, output=output)
+
+    def _uses_daemon_interpreter(self, venv_home):
+        # _venv_matches_interpreter only looks at venv_home, which is
+        # only read or changed with the pip lock held
+        with self.hook._pip_lock:
+            orig_venv_home = self.hook.venv_home
+            self.hook.venv_home = venv_home
+            try:
+                return self.hook._venv_matches_interpreter()
+            finally:
+                self.hook.venv_home = orig_venv_home
+
+    def _pip_subprocess(self, python, cwd, args):
+        import subprocess
+
+        proc = subprocess.Popen(
+            [python, "-m", "pip"] + list(args),
+            cwd    = cwd,
+            stdout = subprocess.PIPE,
+            stderr = subprocess.STDOUT
+        )
+        output, _ = proc.communicate()
+        return proc.returncode, output.decode("utf-8", "replace")
+
+    def _pip_in_process(self, venv_home, cwd, args):
+        """Run ``pip.main(args)`` in ``cwd`` with the venv at ``venv_home``
+        activated in the daemon, then restore the daemon's own environment.
+        sys.prefix, sys.path, the environment, the working directory and
+        pip's working set are process-wide, so in-process runs are
+        serialized by the hook's pip lock.
+
+        :returns: A tuple of pip's exit status and its output
+        """
+        from six import StringIO
+
+        hook = self.hook
+        with hook._pip_lock:
+            saved_sys = dict(
+                (attr, getattr(sys, attr))
+                for attr in ("prefix", "exec_prefix", "executable", "real_prefix", "stdout", "stderr")
+                if hasattr(sys, attr)
+            )
+            saved_path = list(sys.path)
+            saved_environ = dict(os.environ)
+            saved_cwd = os.getcwd()
+            saved_distutils = (
+                distutils.sysconfig.PREFIX,
+                distutils.sysconfig.EXEC_PREFIX,
+                distutils.sysconfig._config_vars,
+            )
+            saved_sysconfig = getattr(sys.modules.get("sysconfig"), "_CONFIG_VARS", None)
+            saved_hook = (hook.venv_home, hook.venv_system_site_packages, pipless.VENV_ACTIVATED)
+
+            output = StringIO()
+            try:
+                hook.venv_home = venv_home
+                hook.venv_system_site_packages = _venv_system_site_packages(venv_home)
+                hook._activate_in_process()
+                os.chdir(cwd)
+
+                sys.stdout = sys.stderr = output
+                try:
+                    status = hook._pip.main(list(args))
+                except SystemExit as e:
+                    # pip exits for --version, --help and option errors
+                    status = _exit_status(e)
+            finally:
+                for attr in ("prefix", "exec_prefix", "executable", "real_prefix", "stdout", "stderr"):
+                    if attr in saved_sys:
+                        setattr(sys, attr, saved_sys[attr])
+                    elif hasattr(sys, attr):
+                        delattr(sys, attr)
+                sys.path[:] = saved_path
+                os.environ.clear()
+                os.environ.update(saved_environ)
+                os.chdir(saved_cwd)
+                (
+                    distutils.sysconfig.PREFIX,
+                    distutils.sysconfig.EXEC_PREFIX,
+                    distutils.sysconfig._config_vars,
+                ) = saved_distutils
+                if "sysconfig" in sys.modules:
+                    sys.modules["sysconfig"]._CONFIG_VARS = saved_sysconfig
+                hook.venv_home, hook.venv_system_site_packages, pipless.VENV_ACTIVATED = saved_hook
+
+                hook._path_cache.invalidate()
+                hook._refresh_pip()
+
+        output = output.getvalue()
+        if isinstance(output, bytes):
+            output = output.decode("utf-8", "replace")
+        return status, output
+
+    def handle(self, request):
+        """Dispatch a single request
+
+        :param dict request: The decoded request
+        :returns: The response to send back
+        """
+        if self.debug:
+            print("[PIPLESSD]: {}".format(request))
+
+        op = request.get("op")
+        if op == "ping":
+            return dict(ok=True)
+        elif op == "lookup":
+            return self.lookup(request["name"])
+        elif op == "pip":
+            return self.pip(request["python"], request["cwd"], request["args"])
+        return dict(ok=False, error="unknown op {!r}".format(op))
+
+    def serve_forever(self):
+        """Listen on the socket until interrupted
+        """
+        socket_dir = os.path.dirname(self.socket_path)
+        if not os.path.exists(socket_dir):
+            os.makedirs(socket_dir)
+        if os.path.exists(self.socket_path):
+            # left over from a daemon that did not shut down cleanly
+            os.remove(self.socket_path)
+
+        old_umask = os.umask(0o077)
+        try:
+            self._server = _make_server(self.socket_path, self)
+        finally:
+            os.umask(old_umask)
+
+        try:
+            self._server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._server.server_close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+    def shutdown(self):
+        """Stop :meth:`serve_forever` (called from another thread)
+        """
+        if self._server is not None:
+            self._server.shutdown()
+
+
+class DaemonClient(object):
+    """Sends requests to a running :class:`PiplessDaemon`. Every method
+    returns ``None`` if the daemon cannot be reached or does not answer in
+    time, and the client stops trying after the first failure.
+    """
+
+    def __init__(self, socket_path=None, timeout=DEFAULT_TIMEOUT, pip_timeout=DEFAULT_PIP_TIMEOUT):
+        """
+        :param str socket_path: The path of the daemon's Unix socket
+        :param float timeout: Seconds to wait for a response
+        :param float pip_timeout: Seconds to wait for a pip run to finish
+        """
+        if socket_path is None:
+            socket_path = default_socket_path()
+
+        self.socket_path = socket_path
+        self.timeout     = timeout
+        self.pip_timeout = pip_timeout
+        self.available   = os.path.exists(socket_path)
+        self._sock       = None
+        self._file       = None
+        # requests share one connection, responses must not be interleaved
+        self._lock       = threading.Lock()
+
+    def _connect(self):
+        import socket
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self._sock = sock
+        self._file = sock.makefile("rb")
+
+    def _request(self, timeout, **request):
+        if not self.available:
+            return None
+
+        with self._lock:
+            try:
+                if self._sock is None:
+                    self._connect()
+                # socket.timeout is an IOError too
+                self._sock.settimeout(timeout)
+                self._sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+                line = self._file.readline()
+                if not line:
+                    raise IOError("the daemon closed the connection")
+                response = json.loads(line.decode("utf-8"))
+            except (IOError, OSError, ValueError):
+                self.close()
+                self.available = False
+                return None
+
+        if not response.get("ok", False):
+            return None
+        return response
+
+    def ping(self):
+        return self._request(self.timeout, op="ping") is not None
+
+    def lookup(self, name):
+        """Ask the daemon for the distribution name of ``name``
+
+        :returns: The response dict (with ``distro`` or ``ignore``), or ``None``
+        """
+        return self._request(self.timeout, op="lookup", name=name)
+
+    def pip(self, python, cwd, args):
+        """Have the daemon run pip with ``python``
+
+        :returns: The response dict (with ``status`` and ``output``), or ``None``
+        """
+        return self._request(self.pip_timeout, op="pip", python=python, cwd=cwd, args=list(args))
+
+    def close(self):
+        if self._sock is not None:
+            try:
+                self._file.close()
+                self._sock.close()
+            except (IOError, OSError):
+                pass
+        self._sock = None
+        self._file = None
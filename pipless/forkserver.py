@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Created by James "d0c_s4vage" Johnson
+# https://github.com/d0c-s4vage/pipless
+# MIT License
+
+
+"""
+Run scripts in forks of a warm pipless process.
+
+``pipless --forkserver`` starts a process that activates the virtual
+environment, installs the requirements, imports the modules given with
+``--preload`` and then waits on a Unix socket. ``pipless script.py`` in the
+same project connects to it and passes along its stdin, stdout and stderr
+file descriptors, argv, working directory and environment. The server
+forks, and the child runs the script as if it had been started directly.
+The exit status of the child is sent back and becomes the exit status of
+the client. Signals that the client receives are forwarded to the child.
+
+If no fork server is running for the virtual environment, pipless runs the
+script itself.
+"""
+
+
+import hashlib
+import json
+import os
+import signal
+import socket
+import sys
+import threading
+import traceback
+
+import pipless
+
+
+_FORWARDED_SIGNALS = ("SIGINT", "SIGTERM", "SIGHUP", "SIGQUIT")
+
+
+def socket_path_for(venv_path):
+    """Return the path of the fork server's socket for the venv at ``venv_path``.
+    The socket lives in the cache directory, venv paths may be too long for
+    a Unix socket path.
+    """
+    key = hashlib.sha256(os.path.abspath(venv_path).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(pipless.CACHE_DIR, "forkservers", key + ".sock")
+
+
+def _send_fds(sock, fds):
+    try:
+        from multiprocessing.reduction import sendfds
+    except ImportError:
+        # python 2
+        import _multiprocessing
+        for fd in fds:
+            _multiprocessing.sendfd(sock.fileno(), fd)
+        return
+    sendfds(sock, fds)
+
+
+def _recv_fds(sock, count):
+    try:
+        from multiprocessing.reduction import recvfds
+    except ImportError:
+        # python 2
+        import _multiprocessing
+        return [_multiprocessing.recvfd(sock.fileno()) for _ in range(count)]
+    return recvfds(sock, count)
+
+
+def _exit_status(wait_status):
+    if os.WIFSIGNALED(wait_status):
+        return 128 + os.WTERMSIG(wait_status)
+    return os.WEXITSTATUS(wait_status)
+
+
+def _send(sock, message):
+    sock.sendall(json.dumps(message).encode("utf-8") + b"\n")
+
+
+class ForkServer(object):
+    """Forks a child per request that runs the requested script
+    """
+
+    def __init__(self, socket_path, preload=None, log=None):
+        """
+        :param str socket_path: The path of the Unix socket to listen on
+        :param list preload: Module names to import before serving
+        :param log: A callable that accepts informational messages
+        """
+        self.socket_path = socket_path
+        self.preload     = list(preload or [])
+        self.log         = log or (lambda msg: None)
+        self._listener   = None
+
+    def preload_modules(self):
+        """Import the modules to preload. The pipless import hook should
+        already be installed, so that missing ones are installed now.
+        """
+        for module_name in self.preload:
+            try:
+                __import__(module_name)
+            except Exception as e:
+                self.log("could not preload {}: {}".format(module_name, e))
+
+    def serve_forever(self):
+        """Preload the modules and handle requests until interrupted
+        """
+        self.preload_modules()
+
+        socket_dir = os.path.dirname(self.socket_path)
+        if not os.path.exists(socket_dir):
+            os.makedirs(socket_dir)
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o077)
+        try:
+            self._listener.bind(self.socket_path)
+        finally:
+            os.umask(old_umask)
+        self._listener.listen(64)
+        self.log("fork server listening on {}".format(self.socket_path))
+
+        try:
+            while True:
+                conn, _ = self._listener.accept()
+                try:
+                    self._handle(conn)
+                except (IOError, OSError, ValueError) as e:
+                    self.log("could not handle fork server request: {}".format(e))
+                    conn.close()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._listener.close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+    def _handle(self, conn):
+        fds = _recv_fds(conn, 3)
+        request = json.loads(conn.makefile("rb").readline().decode("utf-8"))
+
+        # anything still buffered would be written by the child as well
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+        pid = os.fork()
+        if pid == 0:
+            self._listener.close()
+            conn.close()
+            self._run_child(request, fds)
+            # not reached
+
+        for fd in fds:
+            os.close(fd)
+        _send(conn, dict(pid=pid))
+
+        waiter = threading.Thread(target=self._wait_for_child, args=(conn, pid))
+        waiter.daemon = True
+        waiter.start()
+
+    def _wait_for_child(self, conn, pid):
+        _, wait_status = os.waitpid(pid, 0)
+        try:
+            _send(conn, dict(status=_exit_status(wait_status)))
+        except (IOError, OSError):
+            # the client went away
+            pass
+        finally:
+            conn.close()
+
+    def _run_child(self, request, fds):
+        """Become the requested script run. Never returns.
+        """
+        status = 0
+        try:
+            for target_fd, fd in enumerate(fds):
+                os.dup2(fd, target_fd)
+                os.close(fd)
+
+            for sig_name in _FORWARDED_SIGNALS:
+                signal.signal(getattr(signal, sig_name), signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+
+            os.chdir(request["cwd"])
+            os.environ.clear()
+            os.environ.update(request["env"])
+
+            script_file = request["argv"][0]
+            sys.argv[:] = request["argv"]
+            sys.path[0] = os.path.dirname(script_file)
+
+            pipless._run_script(script_file)
+        except SystemExit as e:
+            if e.code is None:
+                status = 0
+            elif isinstance(e.code, int):
+                status = e.code
+            else:
+                sys.stderr.write("{}\n".format(e.code))
+                status = 1
+        except KeyboardInterrupt:
+            status = 128 + signal.SIGINT
+        except:
+            traceback.print_exc()
+            status = 1
+
+        # the normal interpreter shutdown would also run the server's cleanup
+        # code, so run the exit handlers (e.g. updating requirements.txt) and
+        # leave right away
+        try:
+            import atexit
+            atexit._run_exitfuncs()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(status)
+
+
+def run_script(socket_path, argv, cwd=None, env=None):
+    """Run a script in the fork server listening on ``socket_path``
+
+    :param list argv: The script path followed by its arguments
+    :param str cwd: The working directory of the script, defaults to the current one
+    :param dict env: The environment of the script, defaults to the current one
+    :returns: The exit status of the script, or ``None`` if no fork server is running
+    """
+    if not os.path.exists(socket_path):
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except socket.error:
+        sock.close()
+        return None
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    try:
+        _send_fds(sock, [0, 1, 2])
+        _send(sock, dict(
+            argv = list(argv),
+            cwd  = cwd if cwd is not None else os.getcwd(),
+            env  = dict(env if env is not None else os.environ),
+        ))
+
+        responses = sock.makefile("rb")
+        line = responses.readline()
+        if not line:
+            return None
+        pid = json.loads(line.decode("utf-8"))["pid"]
+
+        def forward(signum, frame):
+            try:
+                os.kill(pid, signum)
+            except OSError:
+                pass
+        for sig_name in _FORWARDED_SIGNALS:
+            signal.signal(getattr(signal, sig_name), forward)
+
+        line = responses.readline()
+        if not line:
+            # the fork server died while the script was running
+            return 1
+        return json.loads(line.decode("utf-8"))["status"]
+    finally:
+        sock.close()
@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Created by James "d0c_s4vage" Johnson
+# https://github.com/d0c-s4vage/pipless
+# MIT License
+
+
+"""
+Learn import name -> distribution name mappings from the metadata of
+distributions that are already on this machine.
+
+Installed distributions and wheels list the top-level modules they provide
+in ``top_level.txt``, or at least every file they contain in ``RECORD``.
+Pairing those with the distribution's name gives mappings such as
+``cv2 -> opencv-python`` or ``dateutil -> python-dateutil`` that an
+exact-name PyPI search can't find.
+
+The learned mappings are saved as a normal mappings file,
+``~/.cache/pipless/learned-mappings.txt``, which pipless loads before its
+own mappings, the user's and the project's, so that all of them override it.
+It is filled from
+everything pipless installs, and by ``pipless --harvest-mappings``.
+"""
+
+
+import glob
+import os
+import re
+import zipfile
+
+
+_METADATA_SUFFIXES = (".dist-info", ".egg-info")
+
+# top-level names that many distributions ship, they don't identify one
+_IGNORED_NAMES = set(["test", "tests", "testing", "doc", "docs", "example", "examples", "benchmarks"])
+
+_VALID_NAME = re.compile(r"^[A-Za-z][A-Za-z0-9_]*$")
+
+
+def _project_name(metadata):
+    """Return the value of the ``Name`` header of PKG-INFO/METADATA contents
+    """
+    for line in metadata.splitlines():
+        if line.strip() == "":
+            # end of the headers
+            break
+        if line.lower().startswith("name:"):
+            return line.split(":", 1)[1].strip()
+    return None
+
+
+def _names_from_record(lines):
+    """Return the top-level module names of the file paths in RECORD lines
+    """
+    names = set()
+    for line in lines:
+        path = line.split(",", 1)[0].strip()
+        if "/" in path:
+            top = path.split("/", 1)[0]
+        elif path.endswith((".py", ".so", ".pyd")):
+            top = path.split(".", 1)[0]
+        else:
+            continue
+        if top.endswith(_METADATA_SUFFIXES) or top.endswith(".data") or top == "..":
+            continue
+        names.add(top)
+    return names
+
+
+def top_level_names(top_level=None, record=None):
+    """Return the importable top-level names a distribution provides
+
+    :param str top_level: The contents of ``top_level.txt``, if it exists
+    :param str record: The contents of ``RECORD``, used if there is no ``top_level.txt``
+    """
+    if top_level is not None:
+        names = set(line.strip().replace("/", ".").split(".")[0] for line in top_level.splitlines())
+    elif record is not None:
+        names = _names_from_record(record.splitlines())
+    else:
+        names = set()
+
+    return sorted(
+        name for name in names
+        if _VALID_NAME.match(name) and not name.startswith("_")
+        and name.lower() not in _IGNORED_NAMES
+    )
+
+
+def _read(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read().decode("utf-8", "replace")
+    except (IOError, OSError):
+        return None
+
+
+def harvest_metadata_dir(metadata_dir):
+    """Return the ``(import_name, distro_name)`` pairs of an installed
+    distribution's ``.dist-info`` or ``.egg-info`` directory
+    """
+    metadata = _read(os.path.join(metadata_dir, "METADATA")) or \
+        _read(os.path.join(metadata_dir, "PKG-INFO"))
+    distro_name = _project_name(metadata) if metadata is not None else None
+    if distro_name is None:
+        return []
+
+    names = top_level_names(
+        top_level = _read(os.path.join(metadata_dir, "top_level.txt")),
+        record    = _read(os.path.join(metadata_dir, "RECORD")),
+    )
+    return [(name, distro_name) for name in names]
+
+
+def harvest_site_packages(site_packages_dir):
+    """Return the ``(import_name, distro_name)`` pairs of every distribution
+    installed in ``site_packages_dir``
+    """
+    pairs = []
+    try:
+        entries = sorted(os.listdir(site_packages_dir))
+    except OSError:
+        return pairs
+
+    for entry in entries:
+        path = os.path.join(site_packages_dir, entry)
+        if entry.endswith(_METADATA_SUFFIXES) and os.path.isdir(path):
+            pairs.extend(harvest_metadata_dir(path))
+    return pairs
+
+
+def harvest_wheel(wheel_path):
+    """Return the ``(import_name, distro_name)`` pairs of a wheel file
+    """
+    try:
+        with zipfile.ZipFile(wheel_path) as wheel:
+            members = dict(
+                (name.split("/", 1)[1], name) for name in wheel.namelist()
+                if name.count("/") == 1 and name.split("/", 1)[0].endswith(".dist-info")
+            )
+
+            def read(member):
+                if member not in members:
+                    return None
+                return wheel.read(members[member]).decode("utf-8", "replace")
+
+            metadata = read("METADATA")
+            top_level = read("top_level.txt")
+            record = read("RECORD") if top_level is None else None
+    except (IOError, OSError, zipfile.BadZipfile):
+        return []
+
+    distro_name = _project_name(metadata) if metadata is not None else None
+    if distro_name is None:
+        return []
+    return [(name, distro_name) for name in top_level_names(top_level, record)]
+
+
+def harvest_path(path):
+    """Return the ``(import_name, distro_name)`` pairs found at ``path``,
+    which may be a virtual environment, a site-packages directory, a
+    directory of wheels (such as the pipless wheelhouse) or a single wheel
+    """
+    if os.path.isfile(path):
+        return harvest_wheel(path) if path.endswith(".whl") else []
+
+    pairs = []
+    site_packages_dirs = \
+        glob.glob(os.path.join(path, "lib", "python*", "site-packages")) + \
+        glob.glob(os.path.join(path, "Lib", "site-packages"))
+    for site_packages_dir in site_packages_dirs:
+        pairs.extend(harvest_site_packages(site_packages_dir))
+
+    if len(site_packages_dirs) == 0:
+        pairs.extend(harvest_site_packages(path))
+        for wheel_path in sorted(glob.glob(os.path.join(path, "*.whl")) + glob.glob(os.path.join(path, "*", "*.whl"))):
+            pairs.extend(harvest_wheel(wheel_path))
+    return pairs
+
+
+class LearnedMappings(object):
+    """The learned mappings file. The first distribution seen for an import
+    name is kept, mappings are never overwritten.
+    """
+
+    def __init__(self, path):
+        """
+        :param str path: The path of the learned mappings file
+        """
+        self.path     = path
+        self.mappings = self._read()
+        self._added   = 0
+
+    def _read(self):
+        mappings = {}
+        data = _read(self.path)
+        if data is None:
+            return mappings
+
+        for line in data.splitlines():
+            parts = re.sub(r"#.*", "", line).split()
+            if len(parts) >= 2:
+                mappings[parts[0]] = parts[1]
+        return mappings
+
+    def add(self, pairs):
+        """Add the ``(import_name, distro_name)`` pairs that are not known yet
+
+        :returns: The number of new mappings
+        """
+        added = 0
+        for import_name, distro_name in pairs:
+            if import_name not in self.mappings:
+                self.mappings[import_name] = distro_name
+                added += 1
+        self._added += added
+        return added
+
+    def save(self):
+        """Atomically rewrite the mappings file if mappings were added. Mappings
+        saved by other processes since this file was read are kept.
+        """
+        import tempfile
+
+        if self._added == 0:
+            return
+
+        mappings = self._read()
+        for import_name, distro_name in self.mappings.items():
+            mappings.setdefault(import_name, distro_name)
+        self.mappings = mappings
+
+        mappings_dir = os.path.dirname(self.path)
+        if not os.path.exists(mappings_dir):
+            os.makedirs(mappings_dir)
+
+        lines = ["# learned by pipless from installed distributions and wheels, see pipless --harvest-mappings"]
+        lines.extend("{} {}".format(*item) for item in sorted(mappings.items()))
+
+        fd, tmp_path = tempfile.mkstemp(dir=mappings_dir, prefix=".learned-mappings-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(("\n".join(lines) + "\n").encode("utf-8"))
+        os.rename(tmp_path, self.path)
+        self._added = 0
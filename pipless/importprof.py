@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Created by James "d0c_s4vage" Johnson
+# https://github.com/d0c-s4vage/pipless
+# MIT License
+
+
+"""
+Measure how long every import takes, including the imports it triggers
+itself, and how much of that time pipless spent installing packages.
+
+The results are saved either as folded stacks (one ``a;b;c <usec>`` line
+per import, the input format of ``flamegraph.pl`` and speedscope) or, if
+the output file ends in ``.json``, as a tree sorted by total time.
+"""
+
+
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+
+from six.moves import builtins
+
+
+class _ImportNode(object):
+    __slots__ = ("name", "importer", "total", "children")
+
+    def __init__(self, name, importer):
+        self.name     = name
+        self.importer = importer
+        self.total    = 0.0
+        self.children = []
+
+    @property
+    def self_time(self):
+        return self.total - sum(child.total for child in self.children)
+
+    @property
+    def install_time(self):
+        if self.name.startswith("[install "):
+            return self.total
+        return sum(child.install_time for child in self.children)
+
+    def to_dict(self):
+        return dict(
+            name       = self.name,
+            importer   = self.importer,
+            total_us   = int(self.total * 1000000),
+            self_us    = int(self.self_time * 1000000),
+            install_us = int(self.install_time * 1000000),
+            children   = [
+                child.to_dict() for child in
+                sorted(self.children, key=lambda c: c.total, reverse=True)
+            ]
+        )
+
+
+class ImportProfiler(object):
+    """Wraps ``__import__`` to build a tree of timed imports
+    """
+
+    def __init__(self, path):
+        """
+        :param str path: Where the profile will be saved when the process exits
+        """
+        self.path         = os.path.abspath(path)
+        self.roots        = []
+        self._local       = threading.local()
+        self._orig_import = None
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _push(self, name, importer):
+        node = _ImportNode(name, importer)
+        stack = self._stack()
+        if len(stack) > 0:
+            stack[-1].children.append(node)
+        else:
+            self.roots.append(node)
+        stack.append(node)
+        return node
+
+    def _import(self, name, globals=None, locals=None, fromlist=None, *args, **kwargs):
+        # imports of modules that are already loaded are just a dict lookup,
+        # don't clutter the profile with them
+        if name in sys.modules and not fromlist:
+            return self._orig_import(name, globals, locals, fromlist, *args, **kwargs)
+
+        frame = sys._getframe(1)
+        node = self._push(name, "{}:{}".format(frame.f_code.co_filename, frame.f_lineno))
+        start = time.time()
+        try:
+            return self._orig_import(name, globals, locals, fromlist, *args, **kwargs)
+        finally:
+            node.total = time.time() - start
+            self._stack().pop()
+
+    def record_install(self, distro_name, seconds):
+        """Record that installing ``distro_name`` took ``seconds`` during
+        the import that is currently being profiled.
+
+        :param str distro_name: The distribution that was installed
+        :param float seconds: How long the install took
+        """
+        stack = self._stack()
+        node = _ImportNode("[install {}]".format(distro_name), None)
+        node.total = seconds
+        if len(stack) > 0:
+            stack[-1].children.append(node)
+        else:
+            self.roots.append(node)
+
+    def start(self):
+        """Start profiling imports, and save the profile at process exit
+        """
+        if self._orig_import is not None:
+            return
+        self._orig_import = builtins.__import__
+        builtins.__import__ = self._import
+        atexit.register(self.save)
+
+    def stop(self):
+        """Stop profiling imports
+        """
+        if self._orig_import is None:
+            return
+        builtins.__import__ = self._orig_import
+        self._orig_import = None
+
+    def _folded_lines(self, node, prefix):
+        path = node.name if prefix is None else prefix + ";" + node.name
+        lines = ["{} {}".format(path, int(node.self_time * 1000000))]
+        for child in node.children:
+            lines.extend(self._folded_lines(child, path))
+        return lines
+
+    def save(self):
+        """Save the collected profile to ``path``
+        """
+        self.stop()
+
+        if self.path.endswith(".json"):
+            roots = sorted(self.roots, key=lambda node: node.total, reverse=True)
+            with open(self.path, "w") as f:
+                json.dump([root.to_dict() for root in roots], f, indent=2)
+            return
+
+        lines = []
+        for root in self.roots:
+            lines.extend(self._folded_lines(root, None))
+        with open(self.path, "w") as f:
+            f.write("\n".join(lines) + "\n")
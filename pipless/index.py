@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Created by James "d0c_s4vage" Johnson
+# https://github.com/d0c-s4vage/pipless
+# MIT License
+
+
+"""
+Compact, memory-mapped lookup tables used by pipless to answer questions
+like "is this name installable from PyPI?" without touching the network.
+
+A table file is a sorted list of ``key -> value`` records:
+
+.. code-block:: text
+
+    magic   (8 bytes)       "PIPLESS1"
+    count   (uint32, LE)    number of records
+    offsets (uint32, LE)    count + 1 offsets into the data section
+    data                    "key\\0value" records, sorted by key
+
+Lookups binary search the offsets, so they are ``O(log n)`` and only touch
+the pages of the file that are needed.
+"""
+
+
+import mmap
+import os
+import re
+import struct
+
+
+MAGIC                = b"PIPLESS1"
+HEADER               = struct.Struct("<8sI")
+OFFSET               = struct.Struct("<I")
+DEFAULT_SIMPLE_INDEX = "https://pypi.org/simple/"
+
+
+class InvalidTableError(Exception): pass
+
+
+def normalize_name(name):
+    """Normalize a project name the same way PyPI does (PEP 503)
+
+    :param str name: The project name to normalize
+    """
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def _to_bytes(value):
+    if not isinstance(value, bytes):
+        return value.encode("utf-8")
+    return value
+
+
+def write_table(path, items):
+    """Write a sorted table of ``items`` to ``path``. The file is written
+    to a temporary file first and atomically renamed into place.
+
+    :param str path: The path of the table file
+    :param items: An iterable of ``(key, value)`` pairs. Duplicate keys keep the last value.
+    """
+    import tempfile
+
+    records = {}
+    for key, value in items:
+        records[_to_bytes(key)] = _to_bytes(value)
+
+    data = []
+    offsets = [0]
+    for key in sorted(records):
+        record = key + b"\0" + records[key]
+        data.append(record)
+        offsets.append(offsets[-1] + len(record))
+
+    table_dir = os.path.dirname(os.path.abspath(path))
+    if not os.path.exists(table_dir):
+        os.makedirs(table_dir)
+
+    fd, tmp_path = tempfile.mkstemp(dir=table_dir, prefix=".table-")
+    with os.fdopen(fd, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(data)))
+        f.write(b"".join(OFFSET.pack(offset) for offset in offsets))
+        f.write(b"".join(data))
+    os.rename(tmp_path, path)
+
+
+class SortedTable(object):
+    """A read-only, memory-mapped view of a table written by :func:`write_table`
+    """
+
+    def __init__(self, path):
+        """
+        :param str path: The path of the table file
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < HEADER.size:
+                raise InvalidTableError(path)
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise InvalidTableError(path)
+        self._data_start = HEADER.size + (self.count + 1) * OFFSET.size
+
+    def __len__(self):
+        return self.count
+
+    def _record(self, idx):
+        start_offset = HEADER.size + idx * OFFSET.size
+        start, = OFFSET.unpack_from(self._map, start_offset)
+        end, = OFFSET.unpack_from(self._map, start_offset + OFFSET.size)
+        record = self._map[self._data_start + start:self._data_start + end]
+        key, _, value = record.partition(b"\0")
+        return key, value
+
+    def get(self, key, default=None):
+        """Return the value stored for ``key``, or ``default``
+
+        :param str key: The key to look up
+        """
+        key = _to_bytes(key)
+        low, high = 0, self.count
+        while low < high:
+            mid = (low + high) // 2
+            mid_key, value = self._record(mid)
+            if mid_key < key:
+                low = mid + 1
+            elif mid_key > key:
+                high = mid
+            else:
+                return value.decode("utf-8")
+        return default
+
+    def close(self):
+        self._map.close()
+
+
+class PyPINameIndex(object):
+    """An offline index of all project names that exist on PyPI (or on a
+    local mirror of it).
+    """
+
+    def __init__(self, path):
+        """
+        :param str path: The path of a compiled index (see :func:`build_pypi_index`)
+        """
+        self._table = SortedTable(path)
+
+    def __len__(self):
+        return len(self._table)
+
+    def get(self, name):
+        """Return the project name as it is listed on the index, or
+        ``None`` if ``name`` is not on the index.
+
+        :param str name: The (unnormalized) name to look up
+        """
+        return self._table.get(normalize_name(name))
+
+
+def _names_from_simple_html(html):
+    """Yield the project names from a PEP 503 simple index page
+    """
+    if isinstance(html, bytes):
+        html = html.decode("utf-8", "replace")
+    for match in re.finditer(r"<a\s[^>]*>([^<]+)</a>", html, re.IGNORECASE):
+        yield match.group(1).strip()
+
+
+def _read_names(source):
+    """Yield the project names found at ``source``, which may be:
+
+    * the URL of a PEP 503 simple index (e.g. https://pypi.org/simple/)
+    * the path to a saved simple index page
+    * the path to a local mirror's ``simple`` directory
+    * the path to a text file with one project name per line
+    """
+    if re.match(r"^https?://", source):
+        # the network modules are only needed here, looking names up in a
+        # table must not import them
+        from six.moves.urllib.request import urlopen
+
+        resp = urlopen(source)
+        try:
+            data = resp.read()
+        finally:
+            resp.close()
+        return _names_from_simple_html(data)
+
+    if os.path.isdir(source):
+        return (
+            name for name in os.listdir(source)
+            if os.path.isdir(os.path.join(source, name))
+        )
+
+    with open(source, "rb") as f:
+        data = f.read().decode("utf-8", "replace")
+
+    if re.search(r"<a\s", data, re.IGNORECASE):
+        return _names_from_simple_html(data)
+
+    return (
+        line.strip() for line in data.split("\n")
+        if line.strip() != "" and not line.strip().startswith("#")
+    )
+
+
+def build_pypi_index(dest, source=DEFAULT_SIMPLE_INDEX):
+    """(Re)build the offline PyPI name index at ``dest`` from ``source``.
+    See :func:`_read_names` for the supported source types.
+
+    :param str dest: The path where the compiled index will be saved
+    :param str source: Where the project names should be read from
+    :returns: The number of project names in the new index
+    """
+    names = _read_names(source)
+    write_table(dest, ((normalize_name(name), name) for name in names))
+
+    table = SortedTable(dest)
+    count = len(table)
+    table.close()
+    return count
@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Created by James "d0c_s4vage" Johnson
+# https://github.com/d0c-s4vage/pipless
+# MIT License
+
+
+"""
+Download and build several distributions at the same time.
+
+pip itself resolves, downloads and builds one distribution after another.
+When several independent distributions need to be installed, the
+:class:`ParallelInstaller` runs one ``pip wheel`` subprocess per
+distribution across a bounded pool of workers. The resulting wheels are
+then installed with a single (fast) ``pip install --find-links`` call.
+
+Every wheel that is downloaded or built is kept in a :class:`Wheelhouse`
+shared by all virtual environments that use the same interpreter ABI, so
+that distributions only available as sdists are built once.
+"""
+
+
+import hashlib
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from pipless.index import normalize_name
+
+
+def default_jobs():
+    """Return the default number of concurrent build jobs
+    """
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+
+# like pip, a "#" only starts a comment at the start of a line or after
+# whitespace, so that urls keep their #egg= and #sha256= fragments
+_COMMENT = re.compile(r"(^|\s+)#.*$")
+
+
+def read_requirements(requirements_path):
+    """Return the individual requirement specifiers in a requirements file.
+    Lines with pip options (``-r``, ``-e``, ``--index-url``, etc.) are not
+    returned, pip will handle those during the final install.
+
+    :param str requirements_path: The path to the requirements file
+    """
+    with open(requirements_path, "rb") as f:
+        lines = f.read().split("\n")
+
+    reqs = []
+    for line in lines:
+        line = _COMMENT.sub("", line).strip()
+        if line == "" or line.startswith("-"):
+            continue
+        reqs.append(line)
+    return reqs
+
+
+def requirements_options(requirements_path):
+    """Return the lines of a requirements file that hold pip options
+    instead of requirement specifiers (the ones :func:`read_requirements`
+    skips).
+
+    :param str requirements_path: The path to the requirements file
+    """
+    with open(requirements_path, "rb") as f:
+        lines = f.read().split("\n")
+
+    options = []
+    for line in lines:
+        line = _COMMENT.sub("", line).strip()
+        if line.startswith("-"):
+            options.append(line)
+    return options
+
+
+_METADATA_SUFFIXES = (".dist-info", ".egg-info", ".egg-link", ".egg", ".pth")
+
+
+def requirements_stamp(requirements_path, site_packages_dirs):
+    """Return a string that changes whenever the requirements file or the
+    set of installed distributions (and their versions) changes. Only the
+    names of the metadata entries in site-packages are used, which include
+    the versions of the distributions, so this costs one ``listdir`` per
+    directory.
+
+    :param str requirements_path: The path to the requirements file
+    :param site_packages_dirs: The site-packages directories to fingerprint
+    """
+    hasher = hashlib.sha256()
+    with open(requirements_path, "rb") as f:
+        hasher.update(f.read())
+
+    for site_packages_dir in sorted(site_packages_dirs):
+        hasher.update(b"\0" + site_packages_dir.encode("utf-8"))
+        if not os.path.isdir(site_packages_dir):
+            continue
+        for name in sorted(os.listdir(site_packages_dir)):
+            if name.endswith(_METADATA_SUFFIXES):
+                hasher.update(b"\0" + name.encode("utf-8"))
+
+    return hasher.hexdigest()
+
+
+class ParallelInstaller(object):
+    """Builds wheels for many distributions concurrently
+    """
+
+    def __init__(self, jobs=None, python=None, log=None, tracker=None):
+        """
+        :param int jobs: The maximum number of concurrent ``pip wheel`` processes
+        :param str python: The python executable whose pip should be used
+        :param log: A callable that accepts debug messages
+        :param tracker: An object with ``claim(req)``, ``started(req)`` and
+            ``finished(req)`` methods that is told about every build, such as
+            the :class:`pipless.prefetch.Prefetcher`. Requirements it doesn't
+            ``claim`` are skipped.
+        """
+        if jobs is None:
+            jobs = default_jobs()
+        if python is None:
+            python = sys.executable
+
+        self.jobs   = max(1, jobs)
+        self.python = python
+        self.log    = log or (lambda msg: None)
+        self.tracker = tracker
+
+    def _build_one(self, args):
+        """Build the wheel (and dependency wheels) for a single requirement
+        into a private directory, then move the wheels into ``wheel_dir``.
+        Building into a private directory keeps two workers that build the
+        same dependency from clobbering each other's files.
+        """
+        req, wheel_dir = args
+        if self.tracker is not None and not self.tracker.claim(req):
+            # someone else builds it
+            return req, True, ""
+
+        job_dir = tempfile.mkdtemp(prefix="pipless-build-")
+        try:
+            cmd = [
+                self.python, "-m", "pip", "wheel",
+                "--quiet",
+                "--wheel-dir", job_dir,
+                "--find-links", wheel_dir,
+                req
+            ]
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            if self.tracker is not None:
+                self.tracker.started(req)
+            output, _ = proc.communicate()
+            if proc.returncode != 0:
+                return req, False, output
+
+            for filename in os.listdir(job_dir):
+                dest = os.path.join(wheel_dir, filename)
+                if not os.path.exists(dest):
+                    shutil.move(os.path.join(job_dir, filename), dest)
+            return req, True, output
+        finally:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            if self.tracker is not None:
+                self.tracker.finished(req)
+
+    def build(self, reqs, wheel_dir):
+        """Build wheels for all of ``reqs`` into ``wheel_dir``, running at
+        most ``jobs`` builds at once.
+
+        :param list reqs: Requirement specifiers (e.g. ``"tabulate"``, ``"six==1.10.0"``)
+        :param str wheel_dir: The directory the built wheels will be saved into
+        :returns: The list of requirements that could not be built
+        """
+        reqs = list(reqs)
+        if len(reqs) == 0:
+            return []
+
+        self.log("building {} distributions with {} workers".format(
+            len(reqs), min(self.jobs, len(reqs))
+        ))
+
+        pool = ThreadPool(min(self.jobs, len(reqs)))
+        try:
+            results = pool.map(self._build_one, [(req, wheel_dir) for req in reqs])
+        finally:
+            pool.close()
+            pool.join()
+
+        failed = []
+        for req, success, output in results:
+            if not success:
+                self.log("could not build a wheel for {}:\n{}".format(req, output))
+                failed.append(req)
+        return failed
+
+
+def wheel_name_version(filename):
+    """Return the ``(name, version)`` of a wheel file name, or ``None`` if
+    ``filename`` is not a wheel
+
+    :param str filename: e.g. ``"six-1.10.0-py2.py3-none-any.whl"``
+    """
+    if not filename.endswith(".whl"):
+        return None
+    parts = filename[:-len(".whl")].split("-")
+    # name-version[-build]-python-abi-platform
+    if len(parts) not in (5, 6):
+        return None
+    return parts[0], parts[1]
+
+
+class Wheelhouse(object):
+    """A directory of every wheel pipless has downloaded or built for one
+    interpreter ABI
+    """
+
+    def __init__(self, root):
+        """
+        :param str root: The directory that holds the wheelhouses of all ABIs
+        """
+        from pipless.store import abi_tag
+        self.path = os.path.join(root, abi_tag())
+
+    def ensure_exists(self):
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+
+    def _wheels(self):
+        if not os.path.isdir(self.path):
+            return []
+        wheels = []
+        for filename in os.listdir(self.path):
+            name_version = wheel_name_version(filename)
+            if name_version is not None:
+                wheels.append(name_version)
+        return wheels
+
+    def find(self, req):
+        """Return the highest version of a wheel in the wheelhouse that
+        satisfies ``req``, or ``None``
+
+        :param str req: A requirement specifier (e.g. ``"six>=1.10"``)
+        """
+        from pip._vendor import pkg_resources
+        try:
+            requirement = pkg_resources.Requirement.parse(req)
+        except ValueError:
+            return None
+
+        key = normalize_name(requirement.project_name)
+        versions = [
+            version for name, version in self._wheels()
+            if normalize_name(name) == key and version in requirement
+        ]
+        if len(versions) == 0:
+            return None
+        return max(versions, key=pkg_resources.parse_version)
+
+    def find_project(self, name):
+        """Return the project name of the wheels for ``name`` (compared
+        after normalization), or ``None`` if there are none
+        """
+        key = normalize_name(name)
+        for wheel_name, version in self._wheels():
+            if normalize_name(wheel_name) == key:
+                return wheel_name.replace("_", "-")
+        return None
+
+    def missing(self, reqs):
+        """Return the requirements in ``reqs`` that no wheel satisfies
+
+        :param list reqs: Requirement specifiers
+        """
+        return [req for req in reqs if self.find(req) is None]
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Created by James "d0c_s4vage" Johnson
+# https://github.com/d0c-s4vage/pipless
+# MIT License
+
+
+"""
+An advisory lock that serializes changes to a virtual environment across
+processes.
+
+Several pipless processes started in the same project at once (parallel
+test shards, cron jobs, pre-forked workers) would otherwise each create the
+virtual environment and install the same requirements into it. The lock is
+an ``fcntl.flock`` on a file in the cache directory, named after a hash of
+the virtual environment's path. It is not kept inside the venv, so that
+creating or clearing the venv does not remove the lock file, nor in the
+project, which may be read-only or under version control.
+
+Only changes take the lock. Checks such as "is this module importable" are
+done without it, and redone after it has been acquired, so that a process
+that waited reuses whatever the process holding the lock installed.
+
+On platforms without ``fcntl`` the lock only serializes threads of the
+same process.
+
+``python -m pipless.lock LOCK_PATH COMMAND...`` runs a command while holding
+the lock. A pipless process uses it to change the venv from a background
+thread: on python 2, starting a process needs the import lock, which the
+import hook may hold while it waits for the venv lock.
+"""
+
+
+import errno
+import hashlib
+import os
+import sys
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+import pipless
+
+
+def lock_path_for(venv_path):
+    """Return the path of the lock file of the venv at ``venv_path``
+    """
+    key = hashlib.sha256(os.path.abspath(venv_path).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(pipless.CACHE_DIR, "locks", key + ".lock")
+
+
+class VenvLock(object):
+    """A reentrant, cross-process lock. Threads of the same process
+    are serialized as well.
+    """
+
+    def __init__(self, path, on_wait=None):
+        """
+        :param str path: The path of the lock file, created (with its directory) if it does not exist
+        :param on_wait: A callable that is given the number of seconds spent
+            waiting whenever the lock was held by another process
+        """
+        self.path      = path
+        self.on_wait   = on_wait
+        self.last_wait = 0.0
+        self._rlock    = threading.RLock()
+        self._depth    = 0
+        self._fd       = None
+
+    def acquire(self):
+        """Acquire the lock, blocking until it is available
+
+        :returns: The number of seconds spent waiting on another process
+        """
+        self._rlock.acquire()
+        self._depth += 1
+        if self._depth > 1:
+            return 0.0
+
+        try:
+            self.last_wait = self._lock_file()
+        except:
+            self._depth -= 1
+            self._rlock.release()
+            raise
+
+        if self.last_wait > 0 and self.on_wait is not None:
+            self.on_wait(self.last_wait)
+        return self.last_wait
+
+    def _lock_file(self):
+        if fcntl is None:
+            return 0.0
+
+        lock_dir = os.path.dirname(self.path)
+        if not os.path.isdir(lock_dir):
+            try:
+                os.makedirs(lock_dir)
+            except OSError as e:
+                # another process created it first
+                if e.errno != errno.EEXIST:
+                    raise
+
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return 0.0
+        except (IOError, OSError) as e:
+            if e.errno not in (errno.EAGAIN, errno.EACCES):
+                os.close(self._fd)
+                self._fd = None
+                raise
+
+        start = time.time()
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return time.time() - start
+
+    def release(self):
+        """Release the lock once for every :meth:`acquire`
+        """
+        self._depth -= 1
+        try:
+            if self._depth == 0 and self._fd is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+                os.close(self._fd)
+                self._fd = None
+        finally:
+            self._rlock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+        return False
+
+
+class NullLock(object):
+    """A lock that does nothing, used when there is no virtual environment
+    """
+
+    last_wait = 0.0
+
+    def acquire(self):
+        return 0.0
+
+    def release(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NULL_LOCK = NullLock()
+
+
+def run_locked(lock_path, cmd):
+    """Run ``cmd`` while holding the lock at ``lock_path``
+
+    :returns: The exit status of ``cmd``
+    """
+    import subprocess
+
+    with VenvLock(lock_path):
+        return subprocess.call(cmd)
+
+
+if __name__ == "__main__":
+    sys.exit(run_locked(sys.argv[1], sys.argv[2:]))
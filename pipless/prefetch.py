@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Created by James "d0c_s4vage" Johnson
+# https://github.com/d0c-s4vage/pipless
+# MIT License
+
+
+"""
+Download the wheels that a script is likely to need next, in the background.
+
+When the import hook installs a distribution, the script usually goes on to
+import that distribution's dependencies, and the other modules imported by
+the same file. The wheels for those are fetched into the wheelhouse on a
+background thread while the distribution itself is being installed, so that
+their installs later only have to unpack them.
+
+Prefetching never installs anything, it only fills the wheelhouse. The
+prefetch threads are daemon threads, prefetches that are still running
+when the script exits are abandoned.
+
+Python 2 holds a global import lock while the import hook installs a
+distribution, and a background thread cannot import anything (or start a
+process) until it is released. Prefetches there overlap with running the
+script, not with the install itself.
+"""
+
+
+import json
+import os
+import threading
+import time
+
+from pipless.index import normalize_name
+
+
+PYPI_JSON_URL = "https://pypi.org/pypi/{}/json"
+PYPI_SIMPLE_URLS = (
+    "https://pypi.org/simple",
+    "https://pypi.python.org/simple",
+)
+
+# the states of a requirement the prefetcher knows about. DONE also covers
+# requirements that a foreground install took over before they were started
+QUEUED   = "queued"
+STARTING = "starting"
+BUILDING = "building"
+DONE     = "done"
+
+
+def pypi_json_url(index_urls):
+    """Return the URL of PyPI's JSON API to read dependencies from, or
+    ``None`` if pip installs from any index other than PyPI. Other indexes
+    may not have the JSON API, and the names of distributions from a
+    private index must not be sent to PyPI.
+
+    :param list index_urls: The index URLs pip is configured with
+    """
+    for url in index_urls:
+        if url.rstrip("/") not in PYPI_SIMPLE_URLS:
+            return None
+    return PYPI_JSON_URL
+
+
+def pypi_dependencies(distro_name, json_url=PYPI_JSON_URL, timeout=10):
+    """Return the names of the distributions that the latest release of
+    ``distro_name`` on PyPI always depends on. Dependencies of extras and
+    dependencies whose environment markers don't match this interpreter are
+    left out.
+
+    :param str distro_name: The distribution name
+    :param str json_url: The JSON API URL, with ``{}`` for the distribution name
+    :param float timeout: Seconds to wait for PyPI
+    :returns: A list of distribution names, empty if PyPI could not be reached
+    """
+    from six.moves.urllib.request import urlopen
+    from pip._vendor import pkg_resources
+
+    try:
+        response = urlopen(json_url.format(distro_name), timeout=timeout)
+        try:
+            info = json.loads(response.read().decode("utf-8"))["info"]
+        finally:
+            response.close()
+    except (IOError, OSError, ValueError, KeyError):
+        return []
+
+    names = []
+    for spec in info.get("requires_dist", None) or []:
+        try:
+            requirement = pkg_resources.Requirement.parse(spec)
+        except ValueError:
+            continue
+
+        marker = getattr(requirement, "marker", None)
+        if marker is not None:
+            try:
+                if not marker.evaluate({"extra": ""}):
+                    continue
+            except Exception:
+                continue
+
+        if requirement.project_name not in names:
+            names.append(requirement.project_name)
+    return names
+
+
+def importer_file(frame):
+    """Return the path of the python file that is executing the import
+    statement of ``frame`` or one of its callers, skipping the frames of the
+    import machinery itself. ``None`` is returned if there is none.
+    """
+    pipless_dir = os.path.dirname(os.path.abspath(__file__))
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if not filename.startswith("<") and "importlib" not in filename \
+                and os.path.dirname(os.path.abspath(filename)) != pipless_dir:
+            return filename
+        frame = frame.f_back
+    return None
+
+
+class Prefetcher(object):
+    """Builds wheels into the wheelhouse on background threads. Every
+    requirement is only prefetched once per process, and never while a
+    foreground install is building it.
+    """
+
+    def __init__(self, wheelhouse, jobs=None, log=None):
+        """
+        :param wheelhouse: The :class:`pipless.installer.Wheelhouse` to fill
+        :param int jobs: The maximum number of concurrent builds per prefetch
+        :param log: A callable that accepts debug messages
+        """
+        # imported now, a background thread importing while the hook holds
+        # the import lock would have to wait for the install to finish
+        from pipless.installer import ParallelInstaller
+        from six.moves.urllib.request import urlopen
+        from pip._vendor import pkg_resources
+        import multiprocessing.dummy
+
+        self.wheelhouse = wheelhouse
+        self.log        = log or (lambda msg: None)
+        self._pkg_resources = pkg_resources
+        self._installer = ParallelInstaller(jobs=jobs, log=self.log, tracker=self)
+        self._cond      = threading.Condition(threading.Lock())
+        self._states    = {}
+        self._threads   = []
+        self._abandoned = False
+
+    def prefetch(self, resolve):
+        """Call ``resolve`` on a background thread and build wheels for the
+        requirements it returns that are neither in the wheelhouse nor already
+        known to the prefetcher. ``resolve`` must not touch pip's state, the
+        foreground may be using pip at the same time.
+
+        :param resolve: A callable that returns a list of requirement specifiers
+        """
+        thread = threading.Thread(target=self._run, args=(resolve,))
+        thread.daemon = True
+        with self._cond:
+            if self._abandoned:
+                return
+            self._threads = [t for t in self._threads if t.is_alive()]
+            self._threads.append(thread)
+        thread.start()
+
+    def _run(self, resolve):
+        try:
+            reqs = resolve()
+        except Exception as e:
+            self.log("could not resolve what to prefetch: {!r}".format(e))
+            return
+
+        queued = []
+        with self._cond:
+            for req in reqs:
+                key = self._key(req)
+                if key not in self._states:
+                    self._states[key] = QUEUED
+                    queued.append(req)
+
+        try:
+            missing = self.wheelhouse.missing(queued)
+            for req in queued:
+                if req not in missing:
+                    self.finished(req)
+            if len(missing) > 0:
+                self.log("prefetching wheels for {}".format(", ".join(sorted(missing))))
+                self.wheelhouse.ensure_exists()
+                self._installer.build(missing, self.wheelhouse.path)
+        except Exception as e:
+            self.log("could not prefetch wheels: {!r}".format(e))
+        finally:
+            # a failed prefetch is not retried
+            for req in queued:
+                self.finished(req)
+
+    def _key(self, req):
+        """Return the normalized project name of the requirement specifier
+        ``req``, so that e.g. ``six`` and ``six==1.10.0`` share a state
+        """
+        try:
+            return normalize_name(self._pkg_resources.Requirement.parse(req).project_name)
+        except ValueError:
+            return normalize_name(req)
+
+    # called by the ParallelInstaller for every requirement it builds
+
+    def claim(self, req):
+        """Mark ``req`` as being started, unless it was taken over by a
+        foreground install or the prefetcher was abandoned
+
+        :returns: ``True`` if ``req`` should be built
+        """
+        key = self._key(req)
+        with self._cond:
+            if self._abandoned or self._states.get(key) != QUEUED:
+                return False
+            self._states[key] = STARTING
+            return True
+
+    def started(self, req):
+        """Mark ``req`` as being built, its ``pip wheel`` process is running
+        """
+        key = self._key(req)
+        with self._cond:
+            if self._states.get(key) == STARTING:
+                self._states[key] = BUILDING
+
+    def finished(self, req):
+        """Mark ``req`` as done, whether its wheel could be built or not
+        """
+        key = self._key(req)
+        with self._cond:
+            if self._states.get(key) != DONE:
+                self._states[key] = DONE
+                self._cond.notify_all()
+
+    def take(self, reqs, wait_for_starting=True, timeout=None):
+        """Take ``reqs`` over for a foreground install: prefetches that have
+        not started them yet won't, and the ones that are being built are
+        waited for instead of building the same wheels twice.
+
+        Builds that are still starting their ``pip wheel`` process are only
+        waited for if ``wait_for_starting`` is set. On python 2 starting a
+        process needs the import lock, which the import hook holds during
+        installs.
+
+        :param list reqs: Requirement specifiers
+        :param bool wait_for_starting: Also wait for builds that are starting
+        :param float timeout: The maximum number of seconds to wait
+        """
+        wait_states = (BUILDING, STARTING) if wait_for_starting else (BUILDING,)
+        with self._cond:
+            waiting = []
+            for req in reqs:
+                key = self._key(req)
+                state = self._states.get(key)
+                if state is None or state == QUEUED:
+                    self._states[key] = DONE
+                elif state in wait_states:
+                    waiting.append(key)
+
+            deadline = None if timeout is None else time.time() + timeout
+            while any(self._states[key] in wait_states for key in waiting):
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+    def abandon(self):
+        """Stop starting new builds, the running ones are left to finish on
+        their own or be killed with the process. Called at exit.
+        """
+        with self._cond:
+            self._abandoned = True
+
+    def wait(self, timeout=None):
+        """Wait for every prefetch that has been started
+        """
+        with self._cond:
+            threads = list(self._threads)
+        for thread in threads:
+            thread.join(timeout)
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Created by James "d0c_s4vage" Johnson
+# https://github.com/d0c-s4vage/pipless
+# MIT License
+
+
+"""
+Find the files that belong to a project (its virtual environment, its
+requirements file and its mappings file) in a single scan up the directory
+tree.
+
+Each directory is listed once, instead of being stat-ed once per file that
+is searched for. The scan stops at the project root, the nearest directory
+with a virtual environment or a requirements file, so files that don't
+exist (usually ``pipless-mappings.txt``) aren't searched for all the way up
+to ``/``. The result is cached per starting directory, and is only reused
+as long as none of the scanned directories has changed (an entry being
+added, removed or renamed in a directory changes its mtime).
+"""
+
+
+import json
+import os
+import time
+
+
+# the files and directories that are searched for, nearest one wins
+PROJECT_MARKERS = ("venv", "requirements.txt", "pipless-mappings.txt")
+
+# the markers of a project's root directory, nothing above it is scanned
+ROOT_MARKERS = ("venv", "requirements.txt")
+
+
+def _scan(start_dir, markers, root_markers=ROOT_MARKERS):
+    """Walk up from ``start_dir`` until all ``markers`` are found, a directory
+    with any of ``root_markers`` or the root directory has been scanned.
+
+    :returns: ``(found, mtimes)``, the paths of the markers that were found and
+        the mtime of every directory that was scanned
+    """
+    found = {}
+    mtimes = {}
+    curr_dir = start_dir
+    while True:
+        # stat before listing, a change in between invalidates the next lookup
+        try:
+            mtimes[curr_dir] = os.stat(curr_dir).st_mtime
+            names = set(os.listdir(curr_dir))
+        except OSError:
+            mtimes[curr_dir] = None
+            names = set()
+
+        for marker in markers:
+            if marker not in found and marker in names:
+                found[marker] = os.path.join(curr_dir, marker)
+        if len(found) == len(markers) or any(marker in names for marker in root_markers):
+            break
+
+        parent_dir = os.path.dirname(curr_dir)
+        if parent_dir == curr_dir:
+            break
+        curr_dir = parent_dir
+
+    return found, mtimes
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+class ProjectFinder(object):
+    """Finds (and caches) the nearest project files above a directory
+    """
+
+    def __init__(self, cache_path, markers=PROJECT_MARKERS, root_markers=ROOT_MARKERS, max_entries=1000):
+        """
+        :param str cache_path: The path of the JSON cache file, ``None`` disables caching
+        :param tuple markers: The file names to search for
+        :param tuple root_markers: The file names that end the search
+        :param int max_entries: The maximum number of starting directories to cache
+        """
+        self.cache_path   = cache_path
+        self.markers      = tuple(markers)
+        self.root_markers = tuple(root_markers)
+        self.max_entries  = max_entries
+
+    def _read(self):
+        if self.cache_path is None:
+            return {}
+        try:
+            with open(self.cache_path, "r") as f:
+                entries = json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+        if not isinstance(entries, dict):
+            return {}
+        return entries
+
+    def _write(self, entries):
+        import tempfile
+
+        cache_dir = os.path.dirname(self.cache_path)
+        try:
+            if not os.path.exists(cache_dir):
+                os.makedirs(cache_dir)
+            fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix=".project-roots-")
+            with os.fdopen(fd, "w") as f:
+                json.dump(entries, f)
+            os.rename(tmp_path, self.cache_path)
+        except (IOError, OSError):
+            # the cache is only an optimization
+            pass
+
+    def _is_valid(self, entry):
+        if entry.get("markers") != list(self.markers) \
+                or entry.get("root_markers") != list(self.root_markers):
+            return False
+        for scanned_dir, mtime in entry["mtimes"].items():
+            if _mtime(scanned_dir) != mtime:
+                return False
+        return True
+
+    def find(self, start_dir):
+        """Return a dict of marker name -> path of the nearest project files
+        above (or in) ``start_dir``, up to the project root. Markers that were
+        not found are left out.
+
+        :param str start_dir: The directory to start searching from
+        """
+        start_dir = os.path.abspath(start_dir)
+
+        entries = self._read()
+        entry = entries.get(start_dir)
+        if entry is not None and self._is_valid(entry):
+            return entry["found"]
+
+        found, mtimes = _scan(start_dir, self.markers, self.root_markers)
+
+        if self.cache_path is not None:
+            entries[start_dir] = dict(
+                markers      = list(self.markers),
+                root_markers = list(self.root_markers),
+                found        = found,
+                mtimes       = mtimes,
+                time         = time.time(),
+            )
+            if len(entries) > self.max_entries:
+                newest = sorted(
+                    entries.items(),
+                    key     = lambda item: item[1].get("time", 0),
+                    reverse = True
+                )
+                entries = dict(newest[:self.max_entries])
+            self._write(entries)
+
+        return found
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Created by James "d0c_s4vage" Johnson
+# https://github.com/d0c-s4vage/pipless
+# MIT License
+
+
+"""
+Statically find the imports of a script (and of the local modules that
+it imports) so that missing distributions can be installed before the
+script starts running.
+"""
+
+
+import ast
+import os
+
+
+def _read_source(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _module_level_imports(tree):
+    """Yield the ``ast.Import`` and ``ast.ImportFrom`` nodes that will be
+    executed when the module is imported. Imports inside of function bodies
+    are skipped, since they may never run - the import hook will still catch
+    them if they do.
+    """
+    to_visit = list(ast.iter_child_nodes(tree))
+    while len(to_visit) > 0:
+        node = to_visit.pop()
+        if isinstance(node, (ast.FunctionDef, ast.Lambda)):
+            continue
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            yield node
+            continue
+        to_visit.extend(ast.iter_child_nodes(node))
+
+
+def file_imports(path):
+    """Return the set of top-level names imported by the python file
+    at ``path``. Relative imports are not included. An empty set is returned
+    if the file cannot be parsed.
+
+    :param str path: The path of the python file to scan
+    """
+    try:
+        tree = ast.parse(_read_source(path), path)
+    except (SyntaxError, TypeError, IOError, OSError):
+        return set()
+
+    names = set()
+    for node in _module_level_imports(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                names.add(alias.name.split(".")[0])
+        elif node.level == 0 and node.module is not None:
+            names.add(node.module.split(".")[0])
+    return names
+
+
+def _local_module_files(name, search_dirs):
+    """Return the python files that make up the local module ``name``, or
+    ``None`` if ``name`` is not a local module.
+    """
+    for search_dir in search_dirs:
+        mod_file = os.path.join(search_dir, name + ".py")
+        if os.path.isfile(mod_file):
+            return [mod_file]
+
+        pkg_dir = os.path.join(search_dir, name)
+        if os.path.isfile(os.path.join(pkg_dir, "__init__.py")):
+            files = []
+            for root, dirnames, filenames in os.walk(pkg_dir):
+                files.extend(
+                    os.path.join(root, filename) for filename in filenames
+                    if filename.endswith(".py")
+                )
+            return files
+
+    return None
+
+
+def scan_imports(script_file, search_dirs=None):
+    """Find the top-level names imported by ``script_file``, following
+    imports of local modules (modules that live in one of ``search_dirs``).
+
+    :param str script_file: The path of the script to scan
+    :param list search_dirs: Directories that contain local modules. Defaults to
+        the directory of ``script_file``
+    :returns: A ``(imports, local_names)`` tuple of sets. ``imports`` does not
+        include the names of local modules.
+    """
+    if search_dirs is None:
+        search_dirs = [os.path.dirname(os.path.abspath(script_file))]
+
+    imports = set()
+    local_names = set()
+    scanned = set()
+    to_scan = [os.path.abspath(script_file)]
+
+    while len(to_scan) > 0:
+        path = to_scan.pop()
+        if path in scanned:
+            continue
+        scanned.add(path)
+
+        for name in file_imports(path):
+            if name in imports or name in local_names:
+                continue
+
+            local_files = _local_module_files(name, search_dirs)
+            if local_files is None:
+                imports.add(name)
+            else:
+                local_names.add(name)
+                to_scan.extend(os.path.abspath(f) for f in local_files)
+
+    return imports, local_names
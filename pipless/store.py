@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Created by James "d0c_s4vage" Johnson
+# https://github.com/d0c-s4vage/pipless
+# MIT License
+
+
+"""
+A per-user store of unpacked distributions shared by all pipless virtual
+environments.
+
+Every distribution pipless installs is captured into the store, keyed by
+the interpreter ABI, the distribution name and its version. Its files in
+site-packages are then replaced with hardlinks into the store. When the
+same version is needed by another virtual environment, it is materialized
+from the store with hardlinks instead of being downloaded and installed
+again. Files are copied instead when the store and the virtual
+environment are on different filesystems.
+
+Files in the store are shared, they must never be modified in place.
+"""
+
+
+import distutils.util
+import json
+import os
+import shutil
+import sys
+import sysconfig
+import tempfile
+
+from pipless.index import normalize_name
+
+
+def abi_tag():
+    """Return a tag that identifies the ABI of the running interpreter
+    """
+    impl = "pp" if hasattr(sys, "pypy_version_info") else "cp"
+    soabi = sysconfig.get_config_var("SOABI")
+    if soabi is None:
+        # python 2 has no SOABI, narrow and wide unicode builds differ
+        soabi = "ucs4" if sys.maxunicode > 0xffff else "ucs2"
+    return "{}{}{}-{}-{}".format(
+        impl,
+        sys.version_info[0],
+        sys.version_info[1],
+        soabi,
+        distutils.util.get_platform()
+    ).replace(".", "_").replace("-", "_").lower()
+
+
+def _link_or_copy(src, dest):
+    """Hardlink ``src`` to ``dest`` (replacing ``dest``), falling back to a
+    copy if ``src`` and ``dest`` are on different filesystems.
+    """
+    dest_dir = os.path.dirname(dest)
+    if not os.path.exists(dest_dir):
+        os.makedirs(dest_dir)
+
+    tmp_dest = dest + ".pipless-tmp"
+    try:
+        os.link(src, tmp_dest)
+    except OSError:
+        shutil.copy2(src, tmp_dest)
+    os.rename(tmp_dest, dest)
+
+
+class PackageStore(object):
+    """Captures installed distributions and materializes them into
+    site-packages
+    """
+
+    def __init__(self, root, site_packages, scripts_dir, log=None):
+        """
+        :param str root: The root directory of the store
+        :param str site_packages: The site-packages directory of the current environment
+        :param str scripts_dir: The directory console scripts are installed into
+        :param log: A callable that accepts debug messages
+        """
+        self.root          = os.path.join(root, abi_tag())
+        self.site_packages = os.path.abspath(site_packages)
+        self.scripts_dir   = os.path.abspath(scripts_dir)
+        self.log           = log or (lambda msg: None)
+
+    def _entry_dir(self, name, version):
+        return os.path.join(self.root, normalize_name(name), version)
+
+    def _installed_files(self, dist):
+        """Return the absolute paths of the files that belong to ``dist``
+        """
+        metadata_dir = os.path.abspath(dist.egg_info)
+
+        paths = set()
+        if dist.has_metadata("RECORD"):
+            for line in dist.get_metadata_lines("RECORD"):
+                rel_path = line.rsplit(",", 2)[0]
+                paths.add(os.path.normpath(os.path.join(dist.location, rel_path)))
+        elif dist.has_metadata("installed-files.txt"):
+            for rel_path in dist.get_metadata_lines("installed-files.txt"):
+                paths.add(os.path.normpath(os.path.join(metadata_dir, rel_path)))
+        else:
+            return None
+
+        for root, dirnames, filenames in os.walk(metadata_dir):
+            paths.update(os.path.join(root, filename) for filename in filenames)
+
+        return [path for path in paths if os.path.isfile(path)]
+
+    def capture(self, dist):
+        """Save the installed distribution ``dist`` (a ``pkg_resources``
+        distribution) into the store and replace its files in site-packages
+        with hardlinks into the store.
+
+        :returns: ``True`` if the distribution is in the store afterwards
+        """
+        entry_dir = self._entry_dir(dist.project_name, dist.version)
+        if os.path.exists(entry_dir):
+            return True
+
+        if os.path.abspath(dist.location) != self.site_packages:
+            return False
+
+        files = self._installed_files(dist)
+        if files is None:
+            self.log("no file list for {}, not adding it to the package store".format(dist))
+            return False
+
+        manifest = dict(
+            name         = dist.project_name,
+            version      = dist.version,
+            metadata_dir = os.path.relpath(dist.egg_info, self.site_packages),
+            requires     = [str(req) for req in dist.requires()],
+            files        = [],
+            scripts      = [],
+        )
+
+        if not os.path.exists(os.path.dirname(entry_dir)):
+            os.makedirs(os.path.dirname(entry_dir))
+        tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(entry_dir), prefix=".tmp-")
+        try:
+            for path in files:
+                if path.startswith(self.site_packages + os.sep):
+                    rel_path = os.path.relpath(path, self.site_packages)
+                    manifest["files"].append(rel_path)
+                    dest = os.path.join(tmp_dir, "site-packages", rel_path)
+                elif path.startswith(self.scripts_dir + os.sep):
+                    rel_path = os.path.relpath(path, self.scripts_dir)
+                    manifest["scripts"].append(rel_path)
+                    dest = os.path.join(tmp_dir, "bin", rel_path)
+                else:
+                    # data files installed elsewhere are not shared
+                    continue
+
+                if not os.path.exists(os.path.dirname(dest)):
+                    os.makedirs(os.path.dirname(dest))
+                shutil.copy2(path, dest)
+
+            with open(os.path.join(tmp_dir, "manifest.json"), "w") as f:
+                json.dump(manifest, f)
+            os.rename(tmp_dir, entry_dir)
+        except (IOError, OSError) as e:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            # another process may have stored the same distribution first
+            if not os.path.exists(entry_dir):
+                self.log("could not add {} to the package store: {}".format(dist, e))
+                return False
+
+        self.log("added {} to the package store".format(dist))
+
+        # share the files with the store
+        for rel_path in manifest["files"]:
+            try:
+                _link_or_copy(
+                    os.path.join(entry_dir, "site-packages", rel_path),
+                    os.path.join(self.site_packages, rel_path)
+                )
+            except (IOError, OSError):
+                pass
+        return True
+
+    def find(self, requirement):
+        """Find the highest version in the store that satisfies ``requirement``
+
+        :param requirement: A ``pkg_resources.Requirement``
+        :returns: ``(name, version)`` or ``None``
+        """
+        from pip._vendor.pkg_resources import parse_version
+
+        name_dir = os.path.join(self.root, normalize_name(requirement.project_name))
+        if not os.path.isdir(name_dir):
+            return None
+
+        versions = [
+            version for version in os.listdir(name_dir)
+            if not version.startswith(".") and version in requirement
+        ]
+        if len(versions) == 0:
+            return None
+
+        return requirement.project_name, max(versions, key=parse_version)
+
+    def materialize(self, requirement, is_installed, _seen=None):
+        """Hardlink the best match for ``requirement`` (and its dependencies,
+        as far as they are in the store) into site-packages.
+
+        :param requirement: A ``pkg_resources.Requirement``
+        :param is_installed: A callable that returns ``True`` if a distribution
+            name is already installed
+        :returns: The list of ``name==version`` strings that were materialized
+        """
+        if _seen is None:
+            _seen = set()
+
+        key = normalize_name(requirement.project_name)
+        if key in _seen or is_installed(requirement.project_name):
+            return []
+        _seen.add(key)
+
+        found = self.find(requirement)
+        if found is None:
+            return []
+
+        entry_dir = self._entry_dir(*found)
+        try:
+            with open(os.path.join(entry_dir, "manifest.json"), "r") as f:
+                manifest = json.load(f)
+        except (IOError, OSError, ValueError):
+            return []
+
+        self.log("materializing {}=={} from the package store".format(*found))
+        for rel_path in manifest["files"]:
+            _link_or_copy(
+                os.path.join(entry_dir, "site-packages", rel_path),
+                os.path.join(self.site_packages, rel_path)
+            )
+        for rel_path in manifest["scripts"]:
+            self._install_script(os.path.join(entry_dir, "bin", rel_path), rel_path)
+
+        materialized = ["{}=={}".format(*found)]
+
+        from pip._vendor.pkg_resources import Requirement
+        for dep in manifest["requires"]:
+            materialized.extend(self.materialize(Requirement.parse(dep), is_installed, _seen))
+
+        return materialized
+
+    def _install_script(self, src, rel_path):
+        """Copy a console script into the scripts directory, pointing its
+        shebang line at the running interpreter
+        """
+        dest = os.path.join(self.scripts_dir, rel_path)
+        with open(src, "rb") as f:
+            data = f.read()
+
+        first_line, sep, rest = data.partition(b"\n")
+        if first_line.startswith(b"#!") and b"python" in first_line:
+            data = b"#!" + sys.executable.encode("utf-8") + sep + rest
+
+        if os.path.lexists(dest):
+            os.remove(dest)
+        with open(dest, "wb") as f:
+            f.write(data)
+        shutil.copymode(src, dest)
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Created by James "d0c_s4vage" Johnson
+# https://github.com/d0c-s4vage/pipless
+# MIT License
+
+
+"""
+Record wall-clock spans for each phase of a pipless run into a
+Chrome trace file (open it with ``chrome://tracing`` or Perfetto).
+
+When tracing is disabled :data:`NULL_TRACER` is used instead, whose
+methods do nothing and allocate nothing.
+"""
+
+
+import json
+import os
+import time
+
+
+# set in the environment of the re-exec'd pipless process so that it adds
+# its events to the trace file instead of starting a new one
+APPEND_ENV_VAR = "PIPLESS_TRACE_APPEND"
+
+
+def _now_us():
+    return int(time.time() * 1000000)
+
+
+class _Span(object):
+    """A context manager that records a complete ("X") event on exit
+    """
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name   = name
+        self.args   = args
+
+    def __enter__(self):
+        self.start = _now_us()
+        return self
+
+    def set(self, key, value):
+        """Record an extra detail with the span (e.g. its outcome)
+        """
+        self.args[key] = value
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.args["error"] = repr(exc_value)
+        self.tracer._add(dict(
+            ph   = "X",
+            name = self.name,
+            ts   = self.start,
+            dur  = _now_us() - self.start,
+            args = self.args,
+        ))
+        return False
+
+
+class Tracer(object):
+    """Collects trace events in memory and writes them to ``path`` when
+    :meth:`flush` is called.
+    """
+
+    def __init__(self, path, append=None):
+        """
+        :param str path: The path of the trace file
+        :param bool append: Add to the events already in ``path``. Defaults to ``True``
+            when running in the process that pipless re-exec'd itself into.
+        """
+        if append is None:
+            append = os.environ.pop(APPEND_ENV_VAR, None) == "1"
+
+        self.path   = os.path.abspath(path)
+        self.append = append
+        self.events = []
+        self.pid    = os.getpid()
+
+    def _add(self, event):
+        import threading
+        event["cat"] = "pipless"
+        event["pid"] = self.pid
+        event["tid"] = threading.current_thread().ident
+        self.events.append(event)
+
+    def span(self, name, **args):
+        """Return a context manager that records how long its body takes
+
+        :param str name: The name of the span
+        :param args: Extra details to record with the span
+        """
+        return _Span(self, name, args)
+
+    def instant(self, name, **args):
+        """Record an instantaneous event
+
+        :param str name: The name of the event
+        :param args: Extra details to record with the event
+        """
+        self._add(dict(ph="i", s="p", name=name, ts=_now_us(), args=args))
+
+    def flush(self):
+        """Write all recorded events to the trace file. Events from an
+        earlier process in the same pipless run are kept.
+        """
+        import tempfile
+
+        events = []
+        if self.append:
+            try:
+                with open(self.path, "r") as f:
+                    events = json.load(f).get("traceEvents", [])
+            except (IOError, OSError, ValueError):
+                events = []
+
+        events.extend(self.events)
+        self.events = []
+
+        trace_dir = os.path.dirname(self.path)
+        fd, tmp_path = tempfile.mkstemp(dir=trace_dir, prefix=".trace-")
+        with os.fdopen(fd, "w") as f:
+            json.dump(dict(traceEvents=events, displayTimeUnit="ms"), f)
+        os.rename(tmp_path, self.path)
+
+        # anything flushed after this (e.g. at exit) adds to what was just written
+        self.append = True
+
+
+class _NullSpan(object):
+    def __enter__(self):
+        return self
+
+    def set(self, key, value):
+        pass
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+class NullTracer(object):
+    """A tracer that records nothing
+    """
+
+    _span = _NullSpan()
+
+    def span(self, name, **args):
+        return self._span
+
+    def instant(self, name, **args):
+        pass
+
+    def flush(self):
+        pass
+
+
+NULL_TRACER = NullTracer()
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Created by James "d0c_s4vage" Johnson
+# https://github.com/d0c-s4vage/pipless
+# MIT License
+
+
+"""
+A cache of fully-provisioned virtual environments ("templates"), keyed by
+the base interpreter and the set of requirements that was installed into
+them.
+
+New virtual environments are materialized from a template by hardlinking
+its files (copying when hardlinks are not possible) and rewriting the few
+files that contain the template's own path, such as the shebang lines of
+the scripts in ``bin/``.
+"""
+
+
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from pipless.index import normalize_name
+
+
+# files outside of bin/ that may contain the absolute path of the venv
+_FIXUP_SUFFIXES = (".pth", ".egg-link", ".cfg")
+
+_REQUIREMENT_NAME = re.compile(r"^([A-Za-z0-9][A-Za-z0-9._-]*)(.*)$")
+_INCLUDE_OPTION = re.compile(r"^(?:-r|--requirement)(?:\s+|=)(\S+)$")
+
+_BASE_INTERPRETER_CODE = (
+    "import sys; "
+    "print(getattr(sys, 'real_prefix', getattr(sys, 'base_prefix', sys.prefix))); "
+    "print(sys.version)"
+)
+
+
+def interpreter_fingerprint(python=None):
+    """Return a string that identifies the base interpreter (not the
+    virtual environment) of ``python``.
+
+    :param str python: The python executable to fingerprint. ``None`` means the
+        running interpreter, which avoids starting a new process.
+    """
+    if python is None:
+        base_prefix = getattr(sys, "real_prefix", getattr(sys, "base_prefix", sys.prefix))
+        return "{}\n{}".format(base_prefix, sys.version)
+
+    proc = subprocess.Popen(
+        [python, "-c", _BASE_INTERPRETER_CODE],
+        stdout = subprocess.PIPE,
+        stderr = subprocess.STDOUT
+    )
+    output, _ = proc.communicate()
+    return output.strip()
+
+
+def _canonical_requirement(req):
+    match = _REQUIREMENT_NAME.match(req)
+    if match is None or "://" in req:
+        return re.sub(r"\s+", "", req)
+    return normalize_name(match.group(1)) + re.sub(r"\s+", "", match.group(2)).lower()
+
+
+def requirement_set(requirements_path, _seen=None):
+    """Return the sorted requirements and pip options of a requirements
+    file, with ``-r`` includes replaced by their own requirements. Comments,
+    blank lines, whitespace, ordering, duplicates and the spelling of
+    distribution names don't change the result.
+
+    :param str requirements_path: The path of the requirements file
+    """
+    from pipless.installer import read_requirements, requirements_options
+
+    seen = _seen if _seen is not None else set()
+    requirements_path = os.path.abspath(requirements_path)
+    if requirements_path in seen:
+        return []
+    seen.add(requirements_path)
+
+    entries = set(_canonical_requirement(req) for req in read_requirements(requirements_path))
+    for option in requirements_options(requirements_path):
+        match = _INCLUDE_OPTION.match(option)
+        if match is not None:
+            include_path = os.path.join(os.path.dirname(requirements_path), match.group(1))
+            entries.update(requirement_set(include_path, seen))
+        else:
+            entries.add(" ".join(option.split()))
+    return sorted(entries)
+
+
+def template_key(interpreter, requirements_path, system_site_packages=False):
+    """Return the cache key for a venv with ``requirements_path`` installed
+    into it. Only the set of requirements matters, see :func:`requirement_set`.
+
+    :param str interpreter: See :func:`interpreter_fingerprint`
+    :param str requirements_path: The path of the requirements file
+    :param bool system_site_packages: If the venv can see the global site-packages
+    """
+    hasher = hashlib.sha256()
+    hasher.update(interpreter)
+    hasher.update("\0{}\0".format(bool(system_site_packages)))
+    hasher.update("\n".join(requirement_set(requirements_path)).encode("utf-8"))
+    return hasher.hexdigest()
+
+
+def _needs_fixup(rel_path):
+    return rel_path.split(os.sep)[0] == "bin" or rel_path.endswith(_FIXUP_SUFFIXES)
+
+
+def _copy_tree(src_root, dest_root, link, final_root=None):
+    """Copy the venv at ``src_root`` to ``dest_root``, replacing every
+    occurrence of ``src_root`` in scripts and path files with ``final_root``.
+
+    :param bool link: Hardlink files that don't need their paths rewritten
+    :param str final_root: The path the copy will end up at, defaults to ``dest_root``
+    """
+    if final_root is None:
+        final_root = dest_root
+    src_bytes = src_root.encode("utf-8") if not isinstance(src_root, bytes) else src_root
+    dest_bytes = final_root.encode("utf-8") if not isinstance(final_root, bytes) else final_root
+
+    for root, dirnames, filenames in os.walk(src_root):
+        rel_root = os.path.relpath(root, src_root)
+        dest_dir = os.path.normpath(os.path.join(dest_root, rel_root))
+        if not os.path.exists(dest_dir):
+            os.makedirs(dest_dir)
+
+        # os.walk does not descend into symlinked directories, they are
+        # recreated below along with the symlinked files
+        for name in dirnames + filenames:
+            src_path = os.path.join(root, name)
+            dest_path = os.path.join(dest_dir, name)
+            rel_path = os.path.normpath(os.path.join(rel_root, name))
+
+            if os.path.islink(src_path):
+                target = os.readlink(src_path)
+                if target.startswith(src_root):
+                    target = final_root + target[len(src_root):]
+                os.symlink(target, dest_path)
+                continue
+
+            if os.path.isdir(src_path):
+                continue
+
+            if _needs_fixup(rel_path):
+                with open(src_path, "rb") as f:
+                    data = f.read()
+                if src_bytes in data:
+                    with open(dest_path, "wb") as f:
+                        f.write(data.replace(src_bytes, dest_bytes))
+                    shutil.copymode(src_path, dest_path)
+                    continue
+
+            if link:
+                try:
+                    os.link(src_path, dest_path)
+                    continue
+                except OSError:
+                    # e.g. the cache and the venv are on different filesystems
+                    pass
+            shutil.copy2(src_path, dest_path)
+
+
+class VenvTemplateCache(object):
+    """Saves and restores provisioned virtual environments
+    """
+
+    def __init__(self, cache_dir, log=None):
+        """
+        :param str cache_dir: The directory the templates are stored in
+        :param log: A callable that accepts debug messages
+        """
+        self.cache_dir = cache_dir
+        self.log       = log or (lambda msg: None)
+
+    def path_for(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def has(self, key):
+        return os.path.isdir(self.path_for(key))
+
+    def materialize(self, key, venv_home):
+        """Create a new venv at ``venv_home`` from the template ``key``
+
+        :returns: ``True`` if the template existed and the venv was created
+        """
+        template = self.path_for(key)
+        if not os.path.isdir(template):
+            return False
+
+        self.log("materializing venv template {} at {!r}".format(key, venv_home))
+        if os.path.exists(venv_home):
+            shutil.rmtree(venv_home)
+        try:
+            _copy_tree(template, venv_home, link=True)
+        except (IOError, OSError) as e:
+            self.log("could not materialize venv template: {}".format(e))
+            shutil.rmtree(venv_home, ignore_errors=True)
+            return False
+        return True
+
+    def save(self, key, venv_home):
+        """Save the venv at ``venv_home`` as the template for ``key``. Nothing
+        is done if the template already exists.
+        """
+        template = self.path_for(key)
+        if os.path.isdir(template):
+            return
+
+        self.log("saving {!r} as venv template {}".format(venv_home, key))
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+        # build the template off to the side and rename it into place, so
+        # a concurrent pipless process never sees a partial template
+        tmp_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix=".tmp-")
+        try:
+            tmp_template = os.path.join(tmp_dir, "venv")
+            _copy_tree(os.path.abspath(venv_home), tmp_template, link=False, final_root=template)
+            os.rename(tmp_template, template)
+        except (IOError, OSError) as e:
+            self.log("could not save venv template: {}".format(e))
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
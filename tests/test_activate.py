@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""
+Test activating a virtual environment inside the running interpreter
+"""
+
+
+import distutils.sysconfig
+import os
+import shutil
+import sys
+import sysconfig
+import tempfile
+import unittest
+
+# so we can import pipless
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import pipless
+
+
+class ExecCalled(Exception):
+    pass
+
+
+class TestActivateInProcess(unittest.TestCase):
+    """
+    Test that an in-process activation points the interpreter at the venv
+    without re-executing it
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.orig_cache_dir = pipless.CACHE_DIR
+        self.orig_environ = dict(os.environ)
+        os.environ["PIPLESS_CACHE_DIR"] = pipless.CACHE_DIR = os.path.join(self.tmpdir, "cache")
+
+        self.orig_sys = dict(
+            (attr, getattr(sys, attr))
+            for attr in ("prefix", "exec_prefix", "executable", "real_prefix")
+            if hasattr(sys, attr)
+        )
+        self.orig_path = list(sys.path)
+        self.orig_distutils = (
+            distutils.sysconfig.PREFIX,
+            distutils.sysconfig.EXEC_PREFIX,
+            distutils.sysconfig._config_vars,
+        )
+        self.orig_sysconfig = sysconfig._CONFIG_VARS
+        self.orig_activated = pipless.VENV_ACTIVATED
+
+        self.execs = []
+        self.orig_execve = os.execve
+        def execve(*args):
+            self.execs.append(args)
+            raise ExecCalled()
+        os.execve = execve
+
+        # a legacy virtualenv made from the running interpreter
+        self.venv_home = os.path.join(self.tmpdir, "venv")
+        lib_dir = os.path.join(self.venv_home, "lib", "python{}.{}".format(*sys.version_info[:2]))
+        self.site_packages = os.path.join(lib_dir, "site-packages")
+        self.pth_dir = os.path.join(self.tmpdir, "src")
+        os.makedirs(self.site_packages)
+        os.makedirs(os.path.join(self.venv_home, "bin"))
+        os.makedirs(self.pth_dir)
+        with open(os.path.join(self.site_packages, "project.pth"), "w") as f:
+            f.write(self.pth_dir + "\n")
+        with open(os.path.join(lib_dir, "orig-prefix.txt"), "w") as f:
+            f.write(getattr(sys, "real_prefix", getattr(sys, "base_prefix", sys.prefix)))
+
+    def tearDown(self):
+        os.execve = self.orig_execve
+        for attr in ("prefix", "exec_prefix", "executable", "real_prefix"):
+            if attr in self.orig_sys:
+                setattr(sys, attr, self.orig_sys[attr])
+            elif hasattr(sys, attr):
+                delattr(sys, attr)
+        sys.path[:] = self.orig_path
+        (
+            distutils.sysconfig.PREFIX,
+            distutils.sysconfig.EXEC_PREFIX,
+            distutils.sysconfig._config_vars,
+        ) = self.orig_distutils
+        sysconfig._CONFIG_VARS = self.orig_sysconfig
+        pipless.VENV_ACTIVATED = self.orig_activated
+        os.environ.clear()
+        os.environ.update(self.orig_environ)
+        pipless.CACHE_DIR = self.orig_cache_dir
+
+        from pip._vendor.pkg_resources import _initialize_master_working_set
+        _initialize_master_working_set()
+        shutil.rmtree(self.tmpdir)
+
+    def _hook(self, **venv_opts):
+        return pipless.PipLess(
+            venv_path    = self.venv_home,
+            in_process   = True,
+            requirements = False,
+            use_daemon   = False,
+            venv_opts    = venv_opts,
+            cache_opts   = dict(enabled=False),
+            index_opts   = dict(enabled=False),
+        )
+
+    # ---------------------
+
+    def test_activate(self):
+        system_site_dirs = [
+            entry for entry in sys.path
+            if os.path.normpath(os.path.abspath(entry)) in self._hook()._system_site_dirs()
+        ]
+
+        self._hook().activate()
+        self.assertEqual(self.execs, [])
+        self.assertTrue(pipless.VENV_ACTIVATED)
+
+        self.assertEqual(sys.prefix, self.venv_home)
+        self.assertEqual(sys.exec_prefix, self.venv_home)
+        self.assertEqual(sys.executable, os.path.join(self.venv_home, "bin", "python"))
+        self.assertEqual(distutils.sysconfig.get_python_lib(), self.site_packages)
+
+        self.assertTrue(self.site_packages in sys.path)
+        # .pth files in the venv are processed
+        self.assertTrue(self.pth_dir in sys.path)
+        for entry in system_site_dirs:
+            self.assertFalse(entry in sys.path, entry)
+
+        self.assertEqual(os.environ["VIRTUAL_ENV"], self.venv_home)
+        self.assertTrue(os.environ["PATH"].startswith(os.path.join(self.venv_home, "bin") + os.pathsep))
+
+    def test_system_site_packages(self):
+        system_site_dirs = [
+            entry for entry in sys.path
+            if os.path.normpath(os.path.abspath(entry)) in self._hook()._system_site_dirs()
+        ]
+        self._hook(system_site_packages=True).activate()
+        self.assertEqual(self.execs, [])
+        for entry in system_site_dirs:
+            self.assertTrue(entry in sys.path, entry)
+
+    def test_other_interpreter(self):
+        # venvs of other interpreters can only be used by re-executing
+        with self.assertRaises(ExecCalled):
+            self._hook(python="/usr/bin/python-other").activate()
+        self.assertEqual(len(self.execs), 1)
+        self.assertEqual(self.execs[0][0], os.path.join(self.venv_home, "bin", "python"))
+        self.assertEqual(sys.prefix, self.orig_sys["prefix"])
+        self.assertFalse(pipless.VENV_ACTIVATED)
+
+
+if __name__ == "__main__":
+    unittest.main()
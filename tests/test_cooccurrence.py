@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""
+Test learning which missing imports follow each other
+"""
+
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+# so we can import pipless
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from pipless.cooccurrence import CooccurrenceModel, model_path_for
+
+
+class TestCooccurrenceModel(unittest.TestCase):
+    """
+    Test the model across several simulated runs
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = model_path_for(self.tmpdir, "/some/project")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _run(self, *names):
+        model = CooccurrenceModel(self.path)
+        for name in names:
+            model.observe(name, name.capitalize())
+        model.save()
+
+    # ---------------------
+
+    def test_no_history(self):
+        model = CooccurrenceModel(self.path)
+        self.assertEqual(model.followers("pandas"), [])
+
+    def test_followers(self):
+        self._run("pandas", "numpy", "sqlalchemy")
+        self._run("pandas", "numpy")
+        self._run("requests", "sqlalchemy")
+
+        model = CooccurrenceModel(self.path)
+        self.assertEqual(model.followers("pandas"), [("numpy", "Numpy"), ("sqlalchemy", "Sqlalchemy")])
+        # only names that followed it, not the ones before it
+        self.assertEqual(model.followers("numpy"), [("sqlalchemy", "Sqlalchemy")])
+
+        model.threshold = 0.75
+        self.assertEqual(model.followers("pandas"), [("numpy", "Numpy")])
+
+    def test_skips_observed(self):
+        self._run("pandas", "numpy")
+
+        model = CooccurrenceModel(self.path)
+        model.observe("numpy", "Numpy")
+        self.assertEqual(model.followers("pandas"), [])
+
+    def test_hit_rate(self):
+        self._run("pandas", "numpy", "sqlalchemy")
+
+        model = CooccurrenceModel(self.path)
+        model.observe("pandas", "Pandas")
+        model.speculate(model.followers("pandas"))
+        self.assertTrue(model.record_hit("numpy"))
+        self.assertFalse(model.record_hit("numpy"))
+        self.assertFalse(model.record_hit("requests"))
+
+        self.assertEqual(model.unused(), ["Sqlalchemy"])
+        self.assertEqual(model.stats(), dict(speculated=2, hits=1, hit_rate=0.5))
+        model.save()
+
+        model = CooccurrenceModel(self.path)
+        self.assertEqual(model.stats(), dict(speculated=2, hits=1, hit_rate=0.5))
+        # the hit counts as having followed pandas
+        self.assertEqual(model.model["pairs"]["pandas"]["numpy"], 2)
+
+    def test_unused_shared_distro(self):
+        model = CooccurrenceModel(self.path)
+        model.speculate([("yaml", "PyYAML"), ("_yaml", "PyYAML"), ("numpy", "Numpy")])
+        model.record_hit("yaml")
+        # PyYAML was used through one of its import names
+        self.assertEqual(model.unused(), ["Numpy"])
+
+
+if __name__ == "__main__":
+    unittest.main()
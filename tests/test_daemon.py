@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""
+Test the pipless daemon and its client
+"""
+
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+# so we can import pipless
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import pipless
+from pipless.daemon import DaemonClient, PiplessDaemon
+
+
+class TestDaemon(unittest.TestCase):
+    """
+    Test requests to a daemon running in a background thread
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.orig_cache_dir = pipless.CACHE_DIR
+        self.orig_cache_env = os.environ.get("PIPLESS_CACHE_DIR", None)
+        os.environ["PIPLESS_CACHE_DIR"] = pipless.CACHE_DIR = os.path.join(self.tmpdir, "cache")
+        self.socket_path = os.path.join(self.tmpdir, "daemon.sock")
+
+        self.daemon = PiplessDaemon(self.socket_path)
+        self.thread = threading.Thread(target=self.daemon.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+        for _ in range(100):
+            if os.path.exists(self.socket_path):
+                break
+            time.sleep(0.01)
+
+        self.client = DaemonClient(self.socket_path, timeout=10)
+
+    def tearDown(self):
+        self.client.close()
+        self.daemon.shutdown()
+        self.thread.join()
+        pipless.CACHE_DIR = self.orig_cache_dir
+        if self.orig_cache_env is None:
+            os.environ.pop("PIPLESS_CACHE_DIR", None)
+        else:
+            os.environ["PIPLESS_CACHE_DIR"] = self.orig_cache_env
+        shutil.rmtree(self.tmpdir)
+
+    # ---------------------
+
+    def test_ping(self):
+        self.assertTrue(self.client.ping())
+
+    def test_lookup_mapping(self):
+        self.assertEqual(self.client.lookup("yaml")["distro"], "PyYAML")
+
+    def test_pip(self):
+        # as for a venv of another interpreter, pip runs in a subprocess
+        self.daemon._uses_daemon_interpreter = lambda venv_home: False
+        response = self.client.pip(sys.executable, self.tmpdir, ["--version"])
+        self.assertEqual(response["status"], 0)
+        self.assertTrue("pip" in response["output"])
+
+    def test_pip_in_process_exit(self):
+        self.daemon._uses_daemon_interpreter = lambda venv_home: True
+        self.daemon.hook._activate_in_process = lambda: None
+
+        def main(args):
+            print("pip " + " ".join(args))
+            sys.exit(int(args[0]))
+
+        pip = self.daemon.hook._pip
+        orig_main = pip.main
+        pip.main = main
+        try:
+            response = self.client.pip(sys.executable, self.tmpdir, ["0"])
+            self.assertEqual(response["status"], 0)
+            self.assertEqual(response["output"], "pip 0\n")
+            response = self.client.pip(sys.executable, self.tmpdir, ["2"])
+            self.assertEqual(response["status"], 2)
+        finally:
+            pip.main = orig_main
+
+    def test_pip_in_process(self):
+        # a legacy virtualenv made from the running interpreter
+        venv_home = os.path.join(self.tmpdir, "venv")
+        lib_dir = os.path.join(venv_home, "lib", "python{}.{}".format(*sys.version_info[:2]))
+        os.makedirs(os.path.join(lib_dir, "site-packages"))
+        with open(os.path.join(lib_dir, "orig-prefix.txt"), "w") as f:
+            f.write(getattr(sys, "real_prefix", getattr(sys, "base_prefix", sys.prefix)))
+        open(os.path.join(lib_dir, "no-global-site-packages.txt"), "w").close()
+
+        runs = []
+        def main(args):
+            runs.append((args, sys.prefix, os.getcwd(), list(sys.path)))
+            print("pip ran with " + " ".join(args))
+            return 3
+
+        pip = self.daemon.hook._pip
+        orig_main = pip.main
+        orig_prefix, orig_path, orig_cwd = sys.prefix, list(sys.path), os.getcwd()
+        pip.main = main
+        try:
+            response = self.client.pip(
+                os.path.join(venv_home, "bin", "python"), self.tmpdir, ["install", "six"]
+            )
+        finally:
+            pip.main = orig_main
+
+        self.assertEqual(response["status"], 3)
+        self.assertEqual(response["output"], "pip ran with install six\n")
+
+        self.assertEqual(len(runs), 1)
+        args, prefix, cwd, path = runs[0]
+        self.assertEqual(args, ["install", "six"])
+        self.assertEqual(prefix, venv_home)
+        self.assertEqual(os.path.realpath(cwd), os.path.realpath(self.tmpdir))
+        self.assertTrue(os.path.join(lib_dir, "site-packages") in path)
+
+        # the daemon's own environment is restored
+        self.assertEqual(sys.prefix, orig_prefix)
+        self.assertEqual(sys.path, orig_path)
+        self.assertEqual(os.getcwd(), orig_cwd)
+        self.assertFalse("VIRTUAL_ENV" in os.environ and os.environ["VIRTUAL_ENV"] == venv_home)
+
+    def test_default_timeout(self):
+        client = DaemonClient(self.socket_path)
+        self.assertTrue(client.timeout is not None)
+        self.assertTrue(client.pip_timeout is not None)
+
+    def test_timeout(self):
+        orig_lookup = self.daemon.lookup
+        def slow_lookup(name):
+            time.sleep(1)
+            return orig_lookup(name)
+        self.daemon.lookup = slow_lookup
+
+        client = DaemonClient(self.socket_path, timeout=0.1)
+        start = time.time()
+        self.assertEqual(client.lookup("yaml"), None)
+        self.assertTrue(time.time() - start < 1)
+        # the client gives up on the daemon, callers resolve locally
+        self.assertFalse(client.available)
+        self.assertEqual(client.ping(), False)
+        client.close()
+
+    def test_unavailable(self):
+        client = DaemonClient(os.path.join(self.tmpdir, "missing.sock"))
+        self.assertFalse(client.available)
+        self.assertEqual(client.lookup("yaml"), None)
+
+
+if __name__ == "__main__":
+    unittest.main()
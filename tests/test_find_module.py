@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""
+Test the import hook's find_module
+"""
+
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+# so we can import pipless
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import pipless
+from pipless.tracing import NULL_TRACER, Tracer
+
+
+class HookTestCase(unittest.TestCase):
+    """
+    Sets up a hook that never installs anything and records PyPI searches
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.orig_cache_dir = pipless.CACHE_DIR
+        self.orig_cache_env = os.environ.get("PIPLESS_CACHE_DIR", None)
+        os.environ["PIPLESS_CACHE_DIR"] = pipless.CACHE_DIR = self.tmpdir
+
+        self.hook = pipless.PipLess(
+            no_venv      = True,
+            requirements = False,
+            use_daemon   = False,
+            cache_opts   = dict(enabled=False),
+            index_opts   = dict(enabled=False),
+        )
+        self.searches = []
+        self.hook._search_pypi = self._fake_search
+
+    def tearDown(self):
+        pipless.CACHE_DIR = self.orig_cache_dir
+        if self.orig_cache_env is None:
+            os.environ.pop("PIPLESS_CACHE_DIR", None)
+        else:
+            os.environ["PIPLESS_CACHE_DIR"] = self.orig_cache_env
+        shutil.rmtree(self.tmpdir)
+
+    def _fake_search(self, fullname):
+        self.searches.append(fullname)
+        return None
+
+
+class TestFindModuleTracing(HookTestCase):
+    """
+    Test find_module with the real tracer and with the null tracer
+    """
+
+    def test_null_tracer(self):
+        self.assertTrue(self.hook._tracer is NULL_TRACER)
+        self.assertEqual(self.hook.find_module("some_missing_module"), None)
+        self.assertEqual(self.searches, ["some_missing_module"])
+        self.assertTrue("some_missing_module" in self.hook._decided_names)
+
+    def test_tracer(self):
+        trace_path = os.path.join(self.tmpdir, "trace.json")
+        self.hook._tracer = Tracer(trace_path, append=False)
+
+        self.assertEqual(self.hook.find_module("some_missing_module"), None)
+        self.assertEqual(self.searches, ["some_missing_module"])
+
+        self.hook._tracer.flush()
+        with open(trace_path, "r") as f:
+            events = dict((event["name"], event) for event in json.load(f)["traceEvents"])
+        self.assertEqual(events["find_module"]["args"]["module"], "some_missing_module")
+        self.assertEqual(events["find_module"]["args"]["decision"], "not on pypi")
+        self.assertEqual(events["pypi_search"]["args"]["module"], "some_missing_module")
+        self.assertEqual(events["pypi_search"]["args"]["distro_name"], None)
+
+
+class TestStdlibNames(HookTestCase):
+    """
+    Test that standard library names never cause a PyPI lookup
+    """
+
+    def test_stdlib_names(self):
+        # even a stdlib module that isn't importable here isn't searched for
+        self.hook._is_importable = lambda fullname: False
+        for fullname in ["os", "sys", "json", "xml", "sqlite3", "__future__"]:
+            self.assertTrue(fullname in self.hook._decided_names, fullname)
+            self.assertEqual(self.hook.find_module(fullname), None)
+        self.assertEqual(self.searches, [])
+
+    def test_other_names(self):
+        self.assertFalse("some_missing_module" in self.hook._decided_names)
+        self.assertEqual(self.hook.find_module("some_missing_module"), None)
+        self.assertEqual(self.searches, ["some_missing_module"])
+
+        # decided names are only looked up once
+        self.assertEqual(self.hook.find_module("some_missing_module"), None)
+        self.assertEqual(self.searches, ["some_missing_module"])
+
+    def test_no_install(self):
+        hook = pipless.PipLess(
+            no_venv      = True,
+            no_install   = True,
+            requirements = False,
+            use_daemon   = False,
+            cache_opts   = dict(enabled=False),
+            index_opts   = dict(enabled=False),
+        )
+        self.assertFalse("json" in hook._decided_names)
+
+
+class RecordingPrefetcher(object):
+    def __init__(self):
+        self.resolves = []
+
+    def prefetch(self, resolve):
+        self.resolves.append(resolve)
+
+
+class TestSiblingPrefetch(HookTestCase):
+    """
+    Test that the other imports of the importing file are resolved before
+    the prefetch thread starts
+    """
+
+    def test_siblings(self):
+        self.hook._configured_index_urls = lambda: ["https://pypi.org/simple"]
+        mappings_path = os.path.join(self.tmpdir, "mappings.txt")
+        with open(mappings_path, "w") as f:
+            f.write("some_mapped_module some-distro\n")
+        self.hook._mapping.load(mappings_path)
+
+        script_path = os.path.join(self.tmpdir, "script.py")
+        with open(script_path, "w") as f:
+            f.write("import os\nimport some_mapped_module\nimport some_unknown_module\nimport tabulate\n")
+        namespace = {"sys": sys}
+        exec(compile("frame = sys._getframe(0)", script_path, "exec"), namespace)
+
+        prefetcher = RecordingPrefetcher()
+        self.hook._get_prefetcher = lambda: prefetcher
+        self.hook._start_prefetch("tabulate", namespace["frame"])
+
+        # the dependencies of tabulate, then the siblings
+        self.assertEqual(len(prefetcher.resolves), 2)
+        self.assertEqual(prefetcher.resolves[1](), ["some-distro"])
+        # some_unknown_module would need a PyPI search
+        self.assertEqual(self.searches, [])
+
+    def test_private_index(self):
+        self.hook._configured_index_urls = lambda: ["https://example.com/simple"]
+        prefetcher = RecordingPrefetcher()
+        self.hook._get_prefetcher = lambda: prefetcher
+        self.hook._start_prefetch("private-distro", None)
+
+        # the dependencies of private-distro are not looked up on PyPI
+        self.assertEqual(prefetcher.resolves, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
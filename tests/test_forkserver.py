@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""
+Test running scripts in forks of the fork server
+"""
+
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+# so we can import pipless
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from pipless import forkserver
+
+
+_SCRIPT = """
+import os, sys
+with open(os.path.join(os.getcwd(), "out.txt"), "w") as f:
+    f.write(" ".join(sys.argv[1:]) + "\\n" + os.environ.get("FORKSERVER_TEST", ""))
+sys.exit(3)
+"""
+
+
+class TestForkServer(unittest.TestCase):
+    """
+    Test a fork server running in a separate process
+    """
+
+    def setUp(self):
+        self.tmpdir = os.path.realpath(tempfile.mkdtemp())
+        self.socket_path = os.path.join(self.tmpdir, "fork.sock")
+        self.script = os.path.join(self.tmpdir, "script.py")
+        with open(self.script, "w") as f:
+            f.write(_SCRIPT)
+
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join([os.path.join(os.path.dirname(__file__), "..")] + sys.path)
+        self.server = subprocess.Popen([
+            sys.executable, "-c",
+            "from pipless.forkserver import ForkServer; ForkServer({!r}).serve_forever()".format(
+                self.socket_path
+            )
+        ], env=env)
+
+        for _ in range(500):
+            if os.path.exists(self.socket_path):
+                break
+            time.sleep(0.01)
+
+    def tearDown(self):
+        self.server.kill()
+        self.server.wait()
+        shutil.rmtree(self.tmpdir)
+
+    # ---------------------
+
+    def test_run_script(self):
+        env = dict(os.environ)
+        env["FORKSERVER_TEST"] = "from the client"
+
+        status = forkserver.run_script(
+            self.socket_path,
+            [self.script, "a", "b"],
+            cwd = self.tmpdir,
+            env = env
+        )
+        self.assertEqual(status, 3)
+
+        with open(os.path.join(self.tmpdir, "out.txt"), "r") as f:
+            self.assertEqual(f.read(), "a b\nfrom the client")
+
+    def test_no_server(self):
+        status = forkserver.run_script(os.path.join(self.tmpdir, "missing.sock"), [self.script])
+        self.assertEqual(status, None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""
+Test learning mappings from distribution metadata
+"""
+
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import zipfile
+
+# so we can import pipless
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from pipless import harvest
+
+
+class TestHarvest(unittest.TestCase):
+    """
+    Test harvesting installed distributions, wheels and the learned mappings file
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.venv = os.path.join(self.tmpdir, "venv")
+        self.site_packages = os.path.join(self.venv, "lib", "python2.7", "site-packages")
+
+        self._write(
+            os.path.join(self.site_packages, "opencv_python-4.1.0.dist-info"),
+            METADATA  = "Metadata-Version: 2.1\nName: opencv-python\nVersion: 4.1.0\n\nName: not this one\n",
+            RECORD    = "cv2/__init__.py,sha256=x,10\ncv2/data/x.xml,,\nopencv_python-4.1.0.dist-info/METADATA,,\n",
+        )
+        self._write(
+            os.path.join(self.site_packages, "python_dateutil-2.8.0.dist-info"),
+            METADATA  = "Name: python-dateutil\n",
+            **{"top_level.txt": "dateutil\n"}
+        )
+        self._write(
+            os.path.join(self.site_packages, "PyYAML-5.1-py2.7.egg-info"),
+            **{"PKG-INFO": "Name: PyYAML\n", "top_level.txt": "_yaml\nyaml\ntests\n"}
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, metadata_dir, **files):
+        os.makedirs(metadata_dir)
+        for name, data in files.items():
+            with open(os.path.join(metadata_dir, name), "w") as f:
+                f.write(data)
+
+    # ---------------------
+
+    def test_venv(self):
+        self.assertEqual(sorted(harvest.harvest_path(self.venv)), [
+            ("cv2", "opencv-python"),
+            ("dateutil", "python-dateutil"),
+            ("yaml", "PyYAML"),
+        ])
+
+    def test_wheel(self):
+        wheel_dir = os.path.join(self.tmpdir, "wheelhouse", "cp27")
+        os.makedirs(wheel_dir)
+        wheel_path = os.path.join(wheel_dir, "scikit_learn-0.20.0-cp27-cp27mu-linux_x86_64.whl")
+        with zipfile.ZipFile(wheel_path, "w") as wheel:
+            wheel.writestr("scikit_learn-0.20.0.dist-info/METADATA", "Name: scikit-learn\n")
+            wheel.writestr("scikit_learn-0.20.0.dist-info/top_level.txt", "sklearn\n")
+            wheel.writestr("sklearn/__init__.py", "")
+
+        self.assertEqual(
+            harvest.harvest_path(os.path.join(self.tmpdir, "wheelhouse")),
+            [("sklearn", "scikit-learn")]
+        )
+
+    def test_learned_mappings(self):
+        path = os.path.join(self.tmpdir, "cache", "learned-mappings.txt")
+        learned = harvest.LearnedMappings(path)
+        self.assertEqual(learned.add(harvest.harvest_path(self.venv)), 3)
+        learned.save()
+
+        learned = harvest.LearnedMappings(path)
+        self.assertEqual(learned.mappings["cv2"], "opencv-python")
+        # the first distribution seen for a name is kept
+        self.assertEqual(learned.add([("cv2", "opencv-contrib-python"), ("bs4", "beautifulsoup4")]), 1)
+        self.assertEqual(learned.mappings["cv2"], "opencv-python")
+
+    def test_loaded_as_mapping(self):
+        import pipless
+
+        path = os.path.join(self.tmpdir, "learned-mappings.txt")
+        learned = harvest.LearnedMappings(path)
+        learned.add(harvest.harvest_path(self.venv))
+        learned.save()
+
+        mapping = pipless.PipLessMapping(os.path.join(self.tmpdir, "compiled"))
+        mapping.load(path)
+        self.assertEqual(mapping.get("dateutil"), "python-dateutil")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""
+Test profiling imports
+"""
+
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from six.moves import builtins
+
+# so we can import pipless
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import pipless.importprof
+from pipless.importprof import ImportProfiler
+
+
+class FakeAtexit(object):
+    def __init__(self):
+        self.funcs = []
+
+    def register(self, func):
+        self.funcs.append(func)
+
+
+class TestImportProfiler(unittest.TestCase):
+    """
+    Test the ``__import__`` wrapper and the tree of timed imports
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        with open(os.path.join(self.tmpdir, "pipless_prof_outer.py"), "w") as f:
+            f.write("import pipless_prof_inner\n")
+        with open(os.path.join(self.tmpdir, "pipless_prof_inner.py"), "w") as f:
+            f.write("import time\ntime.sleep(0.05)\n")
+        sys.path.insert(0, self.tmpdir)
+
+        # the profile is saved by the tests, not when the test run exits
+        self.orig_atexit = pipless.importprof.atexit
+        pipless.importprof.atexit = self.atexit = FakeAtexit()
+
+        self.orig_import = builtins.__import__
+        self.profiler = ImportProfiler(os.path.join(self.tmpdir, "imports.json"))
+
+    def tearDown(self):
+        self.profiler.stop()
+        builtins.__import__ = self.orig_import
+        pipless.importprof.atexit = self.orig_atexit
+        sys.path.remove(self.tmpdir)
+        for name in ["pipless_prof_outer", "pipless_prof_inner"]:
+            sys.modules.pop(name, None)
+        shutil.rmtree(self.tmpdir)
+
+    # ---------------------
+
+    def test_start_stop(self):
+        self.profiler.start()
+        self.assertTrue(builtins.__import__ == self.profiler._import)
+        self.assertEqual(self.atexit.funcs, [self.profiler.save])
+
+        # starting twice doesn't wrap the wrapper
+        self.profiler.start()
+        self.profiler.stop()
+        self.assertTrue(builtins.__import__ is self.orig_import)
+
+        # stopping twice doesn't clobber __import__
+        self.profiler.stop()
+        self.assertTrue(builtins.__import__ is self.orig_import)
+
+    def test_nested_imports(self):
+        self.profiler.start()
+        import pipless_prof_outer
+        self.profiler.stop()
+
+        self.assertEqual(len(self.profiler.roots), 1)
+        outer = self.profiler.roots[0]
+        self.assertEqual(outer.name, "pipless_prof_outer")
+        self.assertTrue(outer.importer.startswith(os.path.splitext(__file__)[0]))
+
+        self.assertEqual([child.name for child in outer.children], ["pipless_prof_inner"])
+        inner = outer.children[0]
+        self.assertTrue(inner.importer.startswith(os.path.join(self.tmpdir, "pipless_prof_outer.py")))
+        self.assertTrue(inner.total >= 0.05)
+        self.assertTrue(outer.total >= inner.total)
+        self.assertTrue(outer.self_time < inner.total)
+
+    def test_save(self):
+        self.profiler.start()
+        import pipless_prof_outer
+        self.profiler.record_install("some-distro", 0.5)
+        self.profiler.save()
+        self.assertTrue(builtins.__import__ is self.orig_import)
+
+        with open(self.profiler.path, "r") as f:
+            roots = json.load(f)
+        names = [root["name"] for root in roots]
+        self.assertEqual(names, ["[install some-distro]", "pipless_prof_outer"])
+        self.assertEqual(roots[0]["install_us"], 500000)
+        self.assertEqual(roots[1]["children"][0]["name"], "pipless_prof_inner")
+        self.assertTrue(roots[1]["total_us"] >= roots[1]["children"][0]["total_us"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""
+Test the offline PyPI name index
+"""
+
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+# so we can import pipless
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from pipless import index
+
+
+class TestIndex(unittest.TestCase):
+    """
+    Test building and querying the memory-mapped name index
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.index_path = os.path.join(self.tmpdir, "pypi-names.idx")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    # ---------------------
+
+    def test_build_from_simple_index_page(self):
+        page = os.path.join(self.tmpdir, "simple.html")
+        with open(page, "wb") as f:
+            f.write("\n".join([
+                "<html><body>",
+                '<a href="/simple/tabulate/">tabulate</a>',
+                '<a href="/simple/python-dateutil/">python-dateutil</a>',
+                '<a href="/simple/pyyaml/">PyYAML</a>',
+                "</body></html>",
+            ]))
+
+        count = index.build_pypi_index(self.index_path, page)
+        self.assertEqual(3, count)
+
+        name_index = index.PyPINameIndex(self.index_path)
+        self.assertEqual("tabulate", name_index.get("tabulate"))
+        self.assertEqual("python-dateutil", name_index.get("python_dateutil"))
+        self.assertEqual("PyYAML", name_index.get("pyyaml"))
+        self.assertEqual(None, name_index.get("not_a_real_package"))
+
+    def test_build_from_name_list(self):
+        names = os.path.join(self.tmpdir, "names.txt")
+        with open(names, "wb") as f:
+            f.write("\n".join(["# a comment", "b", "a", "c", ""]))
+
+        self.assertEqual(3, index.build_pypi_index(self.index_path, names))
+        name_index = index.PyPINameIndex(self.index_path)
+        for name in ["a", "b", "c"]:
+            self.assertEqual(name, name_index.get(name))
+        self.assertEqual(None, name_index.get("d"))
+
+    def test_empty_table(self):
+        index.write_table(self.index_path, [])
+        table = index.SortedTable(self.index_path)
+        self.assertEqual(0, len(table))
+        self.assertEqual(None, table.get("anything"))
+
+
+if __name__ == "__main__":
+    unittest.main()
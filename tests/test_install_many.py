@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""
+Test how the hook runs pip for one and for several requirements
+"""
+
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+# so we can import pipless
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import pipless
+import pipless.installer
+from pipless.installer import Wheelhouse
+
+
+class FakeParallelInstaller(object):
+    builds = []
+
+    def __init__(self, jobs=None, python=None, log=None, tracker=None):
+        pass
+
+    def build(self, reqs, wheel_dir):
+        FakeParallelInstaller.builds.append(list(reqs))
+        for req in reqs:
+            open(os.path.join(wheel_dir, "{}-1.0-py2.py3-none-any.whl".format(req)), "w").close()
+        return []
+
+
+class TestInstallMany(unittest.TestCase):
+    """
+    Test that wheels are only built up front for multi-requirement installs
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.orig_cache_dir = pipless.CACHE_DIR
+        self.orig_cache_env = os.environ.get("PIPLESS_CACHE_DIR", None)
+        os.environ["PIPLESS_CACHE_DIR"] = pipless.CACHE_DIR = self.tmpdir
+        self.wheelhouse = Wheelhouse(os.path.join(self.tmpdir, "wheelhouse"))
+
+        self.hook = pipless.PipLess(
+            no_venv      = True,
+            requirements = False,
+            use_daemon   = False,
+            prefetch     = False,
+            cache_opts   = dict(enabled=False),
+            index_opts   = dict(enabled=False),
+        )
+        self.pip_calls = []
+        self.hook._pip_main = lambda *args: self.pip_calls.append(list(args)) or 0
+        self.hook._check_installed = lambda reqs: []
+
+        FakeParallelInstaller.builds = []
+        self.orig_installer = pipless.installer.ParallelInstaller
+        pipless.installer.ParallelInstaller = FakeParallelInstaller
+
+    def tearDown(self):
+        pipless.installer.ParallelInstaller = self.orig_installer
+        pipless.CACHE_DIR = self.orig_cache_dir
+        if self.orig_cache_env is None:
+            os.environ.pop("PIPLESS_CACHE_DIR", None)
+        else:
+            os.environ["PIPLESS_CACHE_DIR"] = self.orig_cache_env
+        shutil.rmtree(self.tmpdir)
+
+    # ---------------------
+
+    def test_single(self):
+        self.hook._install_many(["six"], "six")
+        self.assertEqual(FakeParallelInstaller.builds, [])
+        self.assertEqual(self.pip_calls, [["install", "six"]])
+
+    def test_single_with_wheelhouse(self):
+        self.wheelhouse.ensure_exists()
+        self.hook._install_many(["six"], "six")
+        self.assertEqual(FakeParallelInstaller.builds, [])
+        self.assertEqual(self.pip_calls, [["install", "--find-links", self.wheelhouse.path, "six"]])
+
+    def test_several(self):
+        self.hook._install_many(["six", "tabulate"], "six", "tabulate")
+        self.assertEqual(FakeParallelInstaller.builds, [["six", "tabulate"]])
+        self.assertEqual(self.pip_calls, [
+            ["install", "--no-index", "--find-links", self.wheelhouse.path, "six", "tabulate"],
+        ])
+
+    def test_offline(self):
+        self.hook.offline = True
+        self.hook._install_many(["six"], "six")
+        self.assertEqual(self.pip_calls, [
+            ["install", "--no-index", "--find-links", self.wheelhouse.path, "six"],
+        ])
+
+
+if __name__ == "__main__":
+    unittest.main()
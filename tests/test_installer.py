@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""
+Test building wheels in parallel and reading requirements files
+"""
+
+
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+# so we can import pipless
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from pipless.installer import ParallelInstaller, default_jobs, read_requirements, requirements_options
+
+
+# stands in for "python -m pip wheel --quiet --wheel-dir DIR --find-links DIR REQ"
+FAKE_PYTHON = """#!/bin/sh
+case "$9" in
+    broken*)
+        echo "error: could not build $9"
+        exit 1
+        ;;
+esac
+touch "$6/$9-1.0-py2.py3-none-any.whl"
+"""
+
+
+class TestParallelInstaller(unittest.TestCase):
+    """
+    Test building wheels with a fake pip
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.wheel_dir = os.path.join(self.tmpdir, "wheels")
+        os.makedirs(self.wheel_dir)
+
+        self.python = os.path.join(self.tmpdir, "python")
+        with open(self.python, "w") as f:
+            f.write(FAKE_PYTHON)
+        os.chmod(self.python, stat.S_IRWXU)
+
+        self.messages = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    # ---------------------
+
+    def test_default_jobs(self):
+        self.assertTrue(default_jobs() >= 1)
+        self.assertEqual(ParallelInstaller(jobs=0).jobs, 1)
+
+    def test_build(self):
+        installer = ParallelInstaller(jobs=2, python=self.python, log=self.messages.append)
+        self.assertEqual(installer.build(["six", "tabulate"], self.wheel_dir), [])
+        self.assertEqual(sorted(os.listdir(self.wheel_dir)), [
+            "six-1.0-py2.py3-none-any.whl",
+            "tabulate-1.0-py2.py3-none-any.whl",
+        ])
+
+    def test_build_failure(self):
+        installer = ParallelInstaller(jobs=2, python=self.python, log=self.messages.append)
+        failed = installer.build(["six", "broken_dist"], self.wheel_dir)
+        self.assertEqual(failed, ["broken_dist"])
+        self.assertEqual(os.listdir(self.wheel_dir), ["six-1.0-py2.py3-none-any.whl"])
+        # pip's output is reported with the failure
+        self.assertTrue(any(
+            "broken_dist" in msg and "error: could not build broken_dist" in msg
+            for msg in self.messages
+        ))
+
+    def test_nothing_to_build(self):
+        installer = ParallelInstaller(jobs=2, python=self.python, log=self.messages.append)
+        self.assertEqual(installer.build([], self.wheel_dir), [])
+        self.assertEqual(self.messages, [])
+
+    def test_tracker(self):
+        class Tracker(object):
+            def __init__(self):
+                self.calls = []
+
+            def claim(self, req):
+                self.calls.append(("claim", req))
+                return req != "tabulate"
+
+            def started(self, req):
+                self.calls.append(("started", req))
+
+            def finished(self, req):
+                self.calls.append(("finished", req))
+
+        tracker = Tracker()
+        installer = ParallelInstaller(jobs=1, python=self.python, log=self.messages.append, tracker=tracker)
+        self.assertEqual(installer.build(["six", "tabulate", "broken_dist"], self.wheel_dir), ["broken_dist"])
+        # requirements the tracker doesn't let go of are someone else's
+        self.assertEqual(os.listdir(self.wheel_dir), ["six-1.0-py2.py3-none-any.whl"])
+        self.assertEqual(tracker.calls, [
+            ("claim", "six"), ("started", "six"), ("finished", "six"),
+            ("claim", "tabulate"),
+            ("claim", "broken_dist"), ("started", "broken_dist"), ("finished", "broken_dist"),
+        ])
+
+    def test_job_limit(self):
+        lock = threading.Lock()
+        running = [0]
+        most_running = [0]
+
+        def build_one(args):
+            with lock:
+                running[0] += 1
+                most_running[0] = max(most_running[0], running[0])
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+            return args[0], True, ""
+
+        installer = ParallelInstaller(jobs=2)
+        installer._build_one = build_one
+        reqs = ["dist{}".format(i) for i in range(6)]
+        self.assertEqual(installer.build(reqs, self.wheel_dir), [])
+        self.assertEqual(most_running[0], 2)
+
+
+class TestRequirementsFile(unittest.TestCase):
+    """
+    Test splitting a requirements file into requirements and pip options
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "requirements.txt")
+        with open(self.path, "w") as f:
+            f.write("\n".join([
+                "# pinned",
+                "six==1.10.0",
+                "",
+                "  requests[security] >= 2.0  # inline comment",
+                "pywin32 ; sys_platform == 'win32'",
+                "https://example.com/dist-1.0-py2.py3-none-any.whl#sha256=abc",
+                "--index-url https://example.com/simple",
+                "-r other-requirements.txt",
+                "-e git+https://example.com/project.git#egg=project",
+            ]))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    # ---------------------
+
+    def test_read_requirements(self):
+        self.assertEqual(read_requirements(self.path), [
+            "six==1.10.0",
+            "requests[security] >= 2.0",
+            "pywin32 ; sys_platform == 'win32'",
+            "https://example.com/dist-1.0-py2.py3-none-any.whl#sha256=abc",
+        ])
+
+    def test_requirements_options(self):
+        self.assertEqual(requirements_options(self.path), [
+            "--index-url https://example.com/simple",
+            "-r other-requirements.txt",
+            "-e git+https://example.com/project.git#egg=project",
+        ])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""
+Test the cross-process virtual environment lock
+"""
+
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+# so we can import pipless
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import pipless
+from pipless.lock import VenvLock, lock_path_for
+
+
+class TestVenvLock(unittest.TestCase):
+    """
+    Test the venv lock within a process and between processes
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.orig_cache_dir = pipless.CACHE_DIR
+        self.orig_cache_env = os.environ.get("PIPLESS_CACHE_DIR", None)
+        os.environ["PIPLESS_CACHE_DIR"] = pipless.CACHE_DIR = os.path.join(self.tmpdir, "cache")
+        self.venv_path = os.path.join(self.tmpdir, "project", "venv")
+        self.lock_path = lock_path_for(self.venv_path)
+
+    def tearDown(self):
+        pipless.CACHE_DIR = self.orig_cache_dir
+        if self.orig_cache_env is None:
+            os.environ.pop("PIPLESS_CACHE_DIR", None)
+        else:
+            os.environ["PIPLESS_CACHE_DIR"] = self.orig_cache_env
+        shutil.rmtree(self.tmpdir)
+
+    # ---------------------
+
+    def test_lock_path_in_cache_dir(self):
+        # neither in the venv nor in the project
+        self.assertEqual(os.path.dirname(self.lock_path), os.path.join(pipless.CACHE_DIR, "locks"))
+        self.assertEqual(lock_path_for(self.venv_path + "/"), self.lock_path)
+        self.assertNotEqual(lock_path_for(os.path.join(self.tmpdir, "other", "venv")), self.lock_path)
+
+        with VenvLock(self.lock_path):
+            self.assertTrue(os.path.exists(self.lock_path))
+
+    def test_reentrant(self):
+        lock = VenvLock(self.lock_path)
+        with lock:
+            with lock:
+                pass
+            self.assertEqual(lock._depth, 1)
+        self.assertEqual(lock._fd, None)
+
+    def test_wait_for_other_process(self):
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join([os.path.join(os.path.dirname(__file__), "..")] + sys.path)
+        holder = subprocess.Popen([
+            sys.executable, "-c",
+            "import sys, time\n"
+            "from pipless.lock import VenvLock\n"
+            "with VenvLock({!r}):\n"
+            "    sys.stdout.write('locked\\n')\n"
+            "    sys.stdout.flush()\n"
+            "    time.sleep(0.5)\n".format(self.lock_path)
+        ], env=env, stdout=subprocess.PIPE)
+        self.assertEqual(holder.stdout.readline().strip(), b"locked")
+
+        waits = []
+        lock = VenvLock(self.lock_path, on_wait=waits.append)
+        with lock:
+            pass
+        holder.wait()
+
+        self.assertTrue(lock.last_wait > 0.1)
+        self.assertEqual(waits, [lock.last_wait])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""
+Test the on-disk PyPI lookup cache
+"""
+
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+# so we can import pipless
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import pipless
+
+
+class TestLookupCache(unittest.TestCase):
+    """
+    Test the PipLessLookupCache class
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.tmpdir, "cache", "lookups.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    # ---------------------
+
+    def test_positive_and_negative_entries(self):
+        cache = pipless.PipLessLookupCache(self.cache_path)
+        self.assertEqual((False, None), cache.get("tabulate"))
+
+        cache.set("tabulate", "tabulate")
+        cache.set("not_a_real_package", None)
+
+        # a new instance (e.g. another process) should see both entries
+        other = pipless.PipLessLookupCache(self.cache_path)
+        self.assertEqual((True, "tabulate"), other.get("tabulate"))
+        self.assertEqual((True, None), other.get("not_a_real_package"))
+
+    def test_expired_entries(self):
+        cache = pipless.PipLessLookupCache(self.cache_path, negative_ttl=0)
+        cache.set("not_a_real_package", None)
+        self.assertEqual((False, None), cache.get("not_a_real_package"))
+
+    def test_eviction(self):
+        cache = pipless.PipLessLookupCache(self.cache_path, max_entries=2)
+        for name in ["a", "b", "c"]:
+            cache.set(name, name)
+            time.sleep(0.01)
+
+        other = pipless.PipLessLookupCache(self.cache_path)
+        self.assertEqual((False, None), other.get("a"))
+        self.assertEqual((True, "b"), other.get("b"))
+        self.assertEqual((True, "c"), other.get("c"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""
+Test loading mapping files, parsed and compiled
+"""
+
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+# so we can import pipless
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import pipless
+
+
+class TestMapping(unittest.TestCase):
+    """
+    Test that compiled mappings behave like parsed ones
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.compiled_dir = os.path.join(self.tmpdir, "compiled")
+        self.global_path = self._write("global.txt", "# comment\nyaml PyYAML\nflask  Flask # trailing\n-pkg_resources\n")
+        self.project_path = self._write("project.txt", "flask MyFlask\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, name, data):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, "w") as f:
+            f.write(data)
+        return path
+
+    def _load(self, compiled_dir):
+        mapping = pipless.PipLessMapping(compiled_dir)
+        mapping.load(self.global_path)
+        mapping.load(self.project_path)
+        mapping.load(os.path.join(self.tmpdir, "missing.txt"))
+        return mapping
+
+    # ---------------------
+
+    def test_parsed_and_compiled(self):
+        for compiled_dir in (None, self.compiled_dir):
+            mapping = self._load(compiled_dir)
+            self.assertEqual(mapping.get("yaml"), "PyYAML")
+            # loaded last, wins
+            self.assertEqual(mapping.get("flask"), "MyFlask")
+            self.assertEqual(mapping.get("requests"), None)
+            self.assertRaises(pipless.IgnoreMissingImport, mapping.get, "pkg_resources")
+
+    def test_compiled_once(self):
+        self._load(self.compiled_dir)
+        compiled = sorted(os.listdir(self.compiled_dir))
+        self.assertEqual(len(compiled), 2)
+
+        os.utime(os.path.join(self.compiled_dir, compiled[0]), (0, 0))
+        self._load(self.compiled_dir)
+        self.assertEqual(os.stat(os.path.join(self.compiled_dir, compiled[0])).st_mtime, 0)
+
+    def test_recompiled_on_change(self):
+        self.assertEqual(self._load(self.compiled_dir).get("yaml"), "PyYAML")
+
+        self._write("global.txt", "yaml pyyaml-fork\n")
+        os.utime(self.global_path, (1, 1))
+        mapping = self._load(self.compiled_dir)
+        self.assertEqual(mapping.get("yaml"), "pyyaml-fork")
+        self.assertEqual(mapping.get("pkg_resources"), None)
+
+    def test_learned_mappings_loaded_first(self):
+        orig_cache_dir = pipless.CACHE_DIR
+        pipless.CACHE_DIR = self.tmpdir
+        try:
+            self._write("learned-mappings.txt", "yaml yaml-learned\nflask Flask-Learned\ncv2 opencv-python\n")
+            hook = pipless.PipLess(
+                no_venv       = True,
+                requirements  = False,
+                use_daemon    = False,
+                mappings_path = self.project_path,
+            )
+        finally:
+            pipless.CACHE_DIR = orig_cache_dir
+
+        # pipless' own and the project's mappings override learned ones
+        self.assertEqual(hook._mapping.get("yaml"), "PyYAML")
+        self.assertEqual(hook._mapping.get("flask"), "MyFlask")
+        self.assertEqual(hook._mapping.get("cv2"), "opencv-python")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""
+Test the cache of sys.path directory listings
+"""
+
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+# so we can import pipless
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import pipless
+
+
+class TestPathCache(unittest.TestCase):
+    """
+    Test finding top-level modules through cached directory listings
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self._touch("some_module.py")
+        self._touch("some_package", "__init__.py")
+        os.makedirs(os.path.join(self.tmpdir, "not_a_package"))
+        # directory listings are only revalidated against the mtime
+        os.utime(self.tmpdir, (1000, 1000))
+
+        self.cache = pipless.PipLessPathCache()
+        self.listdirs = []
+        self.orig_listdir = os.listdir
+        def listdir(path):
+            self.listdirs.append(path)
+            return self.orig_listdir(path)
+        os.listdir = listdir
+
+    def tearDown(self):
+        os.listdir = self.orig_listdir
+        shutil.rmtree(self.tmpdir)
+
+    def _touch(self, *parts):
+        path = os.path.join(self.tmpdir, *parts)
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        open(path, "w").close()
+
+    def _contains(self, name):
+        return self.cache.contains(name, [self.tmpdir])
+
+    # ---------------------
+
+    def test_contains(self):
+        self.assertTrue(self._contains("some_module"))
+        self.assertTrue(self._contains("some_package"))
+        self.assertFalse(self._contains("not_a_package"))
+        self.assertFalse(self._contains("missing_module"))
+        self.assertTrue(self._contains("sys"))
+        self.assertEqual(
+            self.cache.module_names(self.tmpdir),
+            set(["some_module", "some_package"])
+        )
+
+    def test_cache_hit(self):
+        self.assertFalse(self._contains("missing_module"))
+        self.assertTrue(self._contains("some_module"))
+        self.assertFalse(self._contains("missing_module"))
+        self.assertEqual(self.listdirs, [self.tmpdir])
+
+    def test_invalidate_after_install(self):
+        self.assertFalse(self._contains("new_module"))
+
+        # an install that leaves the directory's mtime as it was
+        self._touch("new_module.py")
+        os.utime(self.tmpdir, (1000, 1000))
+        self.assertFalse(self._contains("new_module"))
+
+        self.cache.invalidate(self.tmpdir)
+        self.assertTrue(self._contains("new_module"))
+        self.assertEqual(len(self.listdirs), 2)
+
+    def test_invalidate_all(self):
+        self.assertFalse(self._contains("new_module"))
+        self._touch("new_module.py")
+        os.utime(self.tmpdir, (1000, 1000))
+
+        self.cache.invalidate()
+        self.assertTrue(self._contains("new_module"))
+
+    def test_mtime_change(self):
+        self.assertFalse(self._contains("new_module"))
+
+        self._touch("new_module.py")
+        os.utime(self.tmpdir, (2000, 2000))
+        self.assertTrue(self._contains("new_module"))
+        self.assertEqual(len(self.listdirs), 2)
+
+    def test_missing_directory(self):
+        missing = os.path.join(self.tmpdir, "missing")
+        self.assertFalse(self.cache.contains("some_module", [missing]))
+        self.assertTrue(self.cache.contains("some_module", [missing, self.tmpdir]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""
+Test prefetching wheels into the wheelhouse in the background
+"""
+
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+# so we can import pipless
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from pipless.installer import Wheelhouse
+from pipless.prefetch import (
+    BUILDING, DONE, PYPI_JSON_URL, QUEUED, STARTING, Prefetcher, importer_file, pypi_json_url
+)
+
+
+class FakeInstaller(object):
+    """Builds fake wheels once released, telling the tracker like the
+    ParallelInstaller does
+    """
+
+    def __init__(self, tracker):
+        self.tracker = tracker
+        self.built = []
+        self.building = threading.Event()
+        self.release = threading.Event()
+
+    def build(self, reqs, wheel_dir):
+        claimed = [req for req in reqs if self.tracker.claim(req)]
+        for req in claimed:
+            self.tracker.started(req)
+        self.building.set()
+        self.release.wait(10)
+        for req in claimed:
+            self.built.append(req)
+            open(os.path.join(wheel_dir, "{}-1.0-py2.py3-none-any.whl".format(req)), "w").close()
+            self.tracker.finished(req)
+        return []
+
+
+class TestPrefetcher(unittest.TestCase):
+    """
+    Test the prefetcher with a fake wheel builder
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.wheelhouse = Wheelhouse(self.tmpdir)
+        self.prefetcher = Prefetcher(self.wheelhouse)
+        self.installer = FakeInstaller(self.prefetcher)
+        self.prefetcher._installer = self.installer
+
+    def tearDown(self):
+        self.installer.release.set()
+        self.prefetcher.wait()
+        shutil.rmtree(self.tmpdir)
+
+    # ---------------------
+
+    def test_prefetch_once(self):
+        self.installer.release.set()
+        self.prefetcher.prefetch(lambda: ["six", "tabulate"])
+        self.prefetcher.wait()
+        self.prefetcher.prefetch(lambda: ["six"])
+        self.prefetcher.wait()
+
+        self.assertEqual(sorted(self.installer.built), ["six", "tabulate"])
+        self.assertEqual(self.wheelhouse.missing(["six", "tabulate"]), [])
+
+    def test_skips_wheelhouse(self):
+        self.wheelhouse.ensure_exists()
+        open(os.path.join(self.wheelhouse.path, "six-1.10.0-py2.py3-none-any.whl"), "w").close()
+
+        self.installer.release.set()
+        self.prefetcher.prefetch(lambda: ["six", "tabulate"])
+        self.prefetcher.wait()
+        self.assertEqual(self.installer.built, ["tabulate"])
+
+    def test_daemon_threads(self):
+        self.prefetcher.prefetch(lambda: ["six"])
+        self.assertTrue(all(thread.daemon for thread in self.prefetcher._threads))
+
+    def test_take_waits_for_building(self):
+        self.prefetcher.prefetch(lambda: ["six"])
+        self.assertTrue(self.installer.building.wait(10))
+        self.assertEqual(self.prefetcher._states["six"], BUILDING)
+
+        # even with the import lock held, the running build is waited for
+        waiter = threading.Thread(target=self.prefetcher.take, args=(["six"], False))
+        waiter.start()
+        waiter.join(0.2)
+        self.assertTrue(waiter.is_alive())
+
+        self.installer.release.set()
+        waiter.join(10)
+        self.assertFalse(waiter.is_alive())
+        self.assertEqual(self.wheelhouse.missing(["six"]), [])
+
+    def test_take_before_start(self):
+        self.prefetcher.take(["Six"])
+        self.installer.release.set()
+        self.prefetcher.prefetch(lambda: ["six", "tabulate"])
+        self.prefetcher.wait()
+        # the foreground install builds six itself
+        self.assertEqual(self.installer.built, ["tabulate"])
+
+    def test_take_specifier(self):
+        self.prefetcher.take(["six==1.10.0"])
+        self.installer.release.set()
+        self.prefetcher.prefetch(lambda: ["six", "Tabulate>=0.7"])
+        self.prefetcher.wait()
+        # keyed by project name, not by the whole specifier
+        self.assertEqual(self.installer.built, ["Tabulate>=0.7"])
+        self.assertEqual(self.prefetcher._states["tabulate"], DONE)
+
+    def test_take_starting(self):
+        self.prefetcher._states["six"] = STARTING
+
+        # the build may be waiting for the import lock that the caller holds
+        start = time.time()
+        self.prefetcher.take(["six"], wait_for_starting=False)
+        self.assertTrue(time.time() - start < 0.1)
+
+        start = time.time()
+        self.prefetcher.take(["six"], wait_for_starting=True, timeout=0.2)
+        self.assertTrue(time.time() - start >= 0.2)
+
+        self.prefetcher.started("six")
+        self.prefetcher.finished("six")
+        self.prefetcher.take(["six"])
+        self.assertEqual(self.prefetcher._states["six"], DONE)
+
+    def test_abandon(self):
+        self.prefetcher.abandon()
+        self.installer.release.set()
+        self.prefetcher.prefetch(lambda: ["six"])
+        self.prefetcher.wait()
+        self.assertEqual(self.prefetcher._threads, [])
+        self.assertEqual(self.installer.built, [])
+
+        # builds that were queued before are not started either
+        self.prefetcher._states["tabulate"] = QUEUED
+        self.assertFalse(self.prefetcher.claim("tabulate"))
+
+    def test_failed_resolve(self):
+        def resolve():
+            raise ValueError("no network")
+        self.prefetcher.prefetch(resolve)
+        self.prefetcher.wait()
+        self.assertEqual(self.installer.built, [])
+
+
+class TestPypiJsonUrl(unittest.TestCase):
+    """
+    Test that dependencies are only read from PyPI if pip only uses PyPI
+    """
+
+    def test_pypi(self):
+        self.assertEqual(pypi_json_url(["https://pypi.org/simple"]), PYPI_JSON_URL)
+        self.assertEqual(pypi_json_url(["https://pypi.python.org/simple/"]), PYPI_JSON_URL)
+
+    def test_other_index(self):
+        self.assertEqual(pypi_json_url(["https://example.com/simple"]), None)
+        self.assertEqual(pypi_json_url(["https://pypi.org/simple", "https://example.com/simple"]), None)
+
+
+class TestImporterFile(unittest.TestCase):
+    """
+    Test finding the file that runs an import
+    """
+
+    def test_this_file(self):
+        filename = importer_file(sys._getframe(0))
+        self.assertEqual(
+            os.path.splitext(os.path.abspath(filename))[0],
+            os.path.splitext(os.path.abspath(__file__))[0]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""
+Test finding (and caching) the files of a project
+"""
+
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+# so we can import pipless
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from pipless.project import ProjectFinder
+
+
+class TestProjectFinder(unittest.TestCase):
+    """
+    Test the single upward scan for project files and its cache
+    """
+
+    def setUp(self):
+        self.tmpdir = os.path.realpath(tempfile.mkdtemp())
+        self.cache_path = os.path.join(self.tmpdir, "cache", "project-roots.json")
+        self.project = os.path.join(self.tmpdir, "project")
+        self.start_dir = os.path.join(self.project, "a", "b")
+        os.makedirs(self.start_dir)
+        os.makedirs(os.path.join(self.project, "venv"))
+        open(os.path.join(self.project, "requirements.txt"), "w").close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    # ---------------------
+
+    def test_nearest_markers(self):
+        open(os.path.join(self.start_dir, "pipless-mappings.txt"), "w").close()
+
+        finder = ProjectFinder(self.cache_path)
+        found = finder.find(self.start_dir)
+        self.assertEqual(found["venv"], os.path.join(self.project, "venv"))
+        self.assertEqual(found["requirements.txt"], os.path.join(self.project, "requirements.txt"))
+        self.assertEqual(found["pipless-mappings.txt"], os.path.join(self.start_dir, "pipless-mappings.txt"))
+
+    def test_stops_at_project_root(self):
+        # above the nearest directory with a venv or requirements file
+        open(os.path.join(self.tmpdir, "pipless-mappings.txt"), "w").close()
+
+        finder = ProjectFinder(self.cache_path)
+        found = finder.find(self.start_dir)
+        self.assertFalse("pipless-mappings.txt" in found)
+
+        # and only the scanned directories are validated on cache hits
+        stats = []
+        orig_stat = os.stat
+        def stat(path):
+            stats.append(path)
+            return orig_stat(path)
+        os.stat = stat
+        try:
+            self.assertEqual(finder.find(self.start_dir), found)
+        finally:
+            os.stat = orig_stat
+        self.assertEqual(sorted(stats), [self.project, os.path.join(self.project, "a"), self.start_dir])
+
+    def test_nested_project_root(self):
+        nested_req = os.path.join(self.project, "a", "requirements.txt")
+        open(nested_req, "w").close()
+        found = ProjectFinder(self.cache_path).find(self.start_dir)
+        self.assertEqual(found, {"requirements.txt": nested_req})
+
+    def test_cached(self):
+        ProjectFinder(self.cache_path).find(self.start_dir)
+        self.assertTrue(os.path.exists(self.cache_path))
+
+        # served from the cache this time
+        found = ProjectFinder(self.cache_path).find(self.start_dir)
+        self.assertEqual(found["venv"], os.path.join(self.project, "venv"))
+
+    def test_invalidated_by_new_marker(self):
+        finder = ProjectFinder(self.cache_path)
+        finder.find(self.start_dir)
+
+        new_req = os.path.join(self.start_dir, "requirements.txt")
+        open(new_req, "w").close()
+        # make sure the mtime changes even on filesystems with coarse timestamps
+        os.utime(self.start_dir, (0, 0))
+
+        self.assertEqual(finder.find(self.start_dir)["requirements.txt"], new_req)
+
+    def test_invalidated_by_removed_marker(self):
+        finder = ProjectFinder(self.cache_path)
+        finder.find(self.start_dir)
+
+        os.rmdir(os.path.join(self.project, "venv"))
+        os.utime(self.project, (0, 0))
+
+        self.assertFalse("venv" in finder.find(self.start_dir))
+
+
+if __name__ == "__main__":
+    unittest.main()
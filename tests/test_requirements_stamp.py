@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""
+Test the stamp that lets pipless skip installing unchanged requirements
+"""
+
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+# so we can import pipless
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import pipless
+from pipless.installer import requirements_stamp
+
+
+class TestRequirementsStamp(unittest.TestCase):
+    """
+    Test what does and does not change the requirements stamp
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.req_path = os.path.join(self.tmpdir, "requirements.txt")
+        self.site_packages = os.path.join(self.tmpdir, "site-packages")
+        os.makedirs(os.path.join(self.site_packages, "six-1.10.0.dist-info"))
+        with open(self.req_path, "w") as f:
+            f.write("six==1.10.0\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _stamp(self):
+        return requirements_stamp(self.req_path, [self.site_packages])
+
+    # ---------------------
+
+    def test_unchanged(self):
+        stamp = self._stamp()
+        # module files don't matter, only distribution metadata
+        open(os.path.join(self.site_packages, "six.py"), "w").close()
+        self.assertEqual(self._stamp(), stamp)
+
+    def test_requirements_changed(self):
+        stamp = self._stamp()
+        with open(self.req_path, "w") as f:
+            f.write("six==1.11.0\n")
+        self.assertNotEqual(self._stamp(), stamp)
+
+    def test_distribution_changed(self):
+        stamp = self._stamp()
+        os.rename(
+            os.path.join(self.site_packages, "six-1.10.0.dist-info"),
+            os.path.join(self.site_packages, "six-1.11.0.dist-info")
+        )
+        self.assertNotEqual(self._stamp(), stamp)
+
+
+class TestWriteRequirementsStamp(unittest.TestCase):
+    """
+    Test saving the stamp next to the venv
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.stamp_path = os.path.join(self.tmpdir, pipless.REQUIREMENTS_STAMP)
+        self.hook = pipless.PipLess(
+            no_venv      = True,
+            requirements = False,
+            use_daemon   = False,
+            cache_opts   = dict(enabled=False),
+            index_opts   = dict(enabled=False),
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    # ---------------------
+
+    def test_mode(self):
+        orig_umask = os.umask(0o022)
+        try:
+            self.hook._write_requirements_stamp(self.stamp_path, "abc")
+        finally:
+            os.umask(orig_umask)
+        self.assertEqual(os.stat(self.stamp_path).st_mode & 0o777, 0o644)
+
+        os.chmod(self.stamp_path, 0o664)
+        self.hook._write_requirements_stamp(self.stamp_path, "def")
+        self.assertEqual(os.stat(self.stamp_path).st_mode & 0o777, 0o664)
+        with open(self.stamp_path, "r") as f:
+            self.assertEqual(f.read(), "def\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""
+Test pinning newly installed distributions in an existing requirements file
+"""
+
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+# so we can import pipless
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import pipless
+
+
+class TestUpdateRequirements(unittest.TestCase):
+    """
+    Test the incremental update of requirements.txt at exit
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.orig_cache_dir = pipless.CACHE_DIR
+        self.orig_cache_env = os.environ.get("PIPLESS_CACHE_DIR", None)
+        os.environ["PIPLESS_CACHE_DIR"] = pipless.CACHE_DIR = self.tmpdir
+
+        self.hook = pipless.PipLess(
+            no_venv      = True,
+            requirements = False,
+            use_daemon   = False,
+            cache_opts   = dict(enabled=False),
+            index_opts   = dict(enabled=False),
+        )
+        self.hook.venv_parent_dir = self.tmpdir
+        self.req_path = os.path.join(self.tmpdir, "requirements.txt")
+
+        self.frozen = []
+        self.hook._freeze_requirements = lambda req_path, exclude=(): self.frozen.append(req_path)
+
+    def tearDown(self):
+        pipless.CACHE_DIR = self.orig_cache_dir
+        if self.orig_cache_env is None:
+            os.environ.pop("PIPLESS_CACHE_DIR", None)
+        else:
+            os.environ["PIPLESS_CACHE_DIR"] = self.orig_cache_env
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, lines):
+        with open(self.req_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def _read(self):
+        with open(self.req_path, "r") as f:
+            return f.read().split("\n")[:-1]
+
+    # ---------------------
+
+    def test_replace_and_append(self):
+        self._write([
+            "# pinned by hand",
+            "six>=1.0",
+            "Requests[security] >= 2.0, < 3",
+            "--index-url https://example.com/simple",
+            "tabulate==0.7.5",
+        ])
+        self.hook._update_requirements(self.req_path, {
+            "six":      "1.11.0",
+            "requests": "2.18.4",
+            "idna":     "2.6",
+        })
+        self.assertEqual(self._read(), [
+            "# pinned by hand",
+            "six==1.11.0",
+            "Requests[security]==2.18.4",
+            "--index-url https://example.com/simple",
+            "tabulate==0.7.5",
+            "idna==2.6",
+        ])
+
+    def test_markers_and_comments(self):
+        self._write([
+            "pywin32 ; sys_platform == 'win32'",
+            "six>=1.0 ; python_version < '3'  # for python 2",
+            "  tabulate  # tables",
+            "futures;python_version<'3'",
+        ])
+        self.hook._update_requirements(self.req_path, {
+            "pywin32":  "223",
+            "six":      "1.11.0",
+            "tabulate": "0.8.2",
+            "futures":  "3.2.0",
+        })
+        self.assertEqual(self._read(), [
+            "pywin32==223 ; sys_platform == 'win32'",
+            "six==1.11.0 ; python_version < '3'  # for python 2",
+            "  tabulate==0.8.2  # tables",
+            "futures==3.2.0 ;python_version<'3'",
+        ])
+
+    def test_unparsable_lines(self):
+        lines = [
+            "-e git+https://example.com/six.git#egg=six",
+            "https://example.com/six-1.0-py2.py3-none-any.whl",
+        ]
+        self._write(lines)
+        self.hook._update_requirements(self.req_path, {"six": "1.11.0"})
+        self.assertEqual(self._read(), lines + ["six==1.11.0"])
+
+    def test_already_pinned(self):
+        self._write(["six==1.11.0  # latest"])
+        os.utime(self.req_path, (1000, 1000))
+        self.hook._update_requirements(self.req_path, {"six": "1.11.0"})
+        self.assertEqual(os.path.getmtime(self.req_path), 1000)
+        self.assertEqual(self._read(), ["six==1.11.0  # latest"])
+
+    def test_keeps_mode(self):
+        self._write(["six>=1.0"])
+        os.chmod(self.req_path, 0o664)
+        self.hook._update_requirements(self.req_path, {"six": "1.11.0"})
+        self.assertEqual(self._read(), ["six==1.11.0"])
+        self.assertEqual(os.stat(self.req_path).st_mode & 0o777, 0o664)
+
+    def test_new_file_mode(self):
+        tmp_path = os.path.join(self.tmpdir, ".requirements-tmp")
+        open(tmp_path, "w").close()
+        os.chmod(tmp_path, 0o600)
+        orig_umask = os.umask(0o022)
+        try:
+            pipless._replace_file(tmp_path, self.req_path)
+        finally:
+            os.umask(orig_umask)
+        self.assertEqual(os.stat(self.req_path).st_mode & 0o777, 0o644)
+
+    def test_on_exit_updates(self):
+        self._write(["six==1.10.0 ; python_version < '3'"])
+        self.hook._changed_distros = {"six": "1.11.0"}
+        self.hook._on_exit()
+        self.assertEqual(self._read(), ["six==1.11.0 ; python_version < '3'"])
+        self.assertEqual(self.frozen, [])
+
+    def test_on_exit_nothing_changed(self):
+        self._write(["six==1.10.0"])
+        os.utime(self.req_path, (1000, 1000))
+
+        updates = []
+        self.hook._update_requirements = lambda *args: updates.append(args)
+        self.hook._changed_distros = {}
+        self.hook._on_exit()
+
+        self.assertEqual(updates, [])
+        self.assertEqual(self.frozen, [])
+        self.assertEqual(os.path.getmtime(self.req_path), 1000)
+
+    def test_on_exit_freezes(self):
+        self.hook._changed_distros = {}
+        self.hook._on_exit()
+        self.assertEqual(self.frozen, [self.req_path])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""
+Test the static import scanner
+"""
+
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+# so we can import pipless
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from pipless import scan
+
+
+class TestScan(unittest.TestCase):
+    """
+    Test finding the imports of a script before it is run
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, path, *lines):
+        path = os.path.join(self.tmpdir, path)
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, "wb") as f:
+            f.write("\n".join(lines) + "\n")
+        return path
+
+    # ---------------------
+
+    def test_follows_local_modules(self):
+        script = self._write("test.py",
+            "import sys",
+            "import tabulate",
+            "import helper",
+            "from pkg import thing",
+        )
+        self._write("helper.py", "import requests.adapters")
+        self._write("pkg/__init__.py", "from .sub import thing")
+        self._write("pkg/sub.py", "import yaml")
+
+        imports, local_names = scan.scan_imports(script)
+        self.assertEqual(set(["sys", "tabulate", "requests", "yaml"]), imports)
+        self.assertEqual(set(["helper", "pkg"]), local_names)
+
+    def test_skips_function_bodies(self):
+        script = self._write("test.py",
+            "try:",
+            "    import simplejson as json",
+            "except ImportError:",
+            "    import json",
+            "def later():",
+            "    import tabulate",
+        )
+
+        imports, _ = scan.scan_imports(script)
+        self.assertEqual(set(["simplejson", "json"]), imports)
+
+    def test_syntax_error(self):
+        script = self._write("test.py", "import tabulate", "def broken(:")
+        self.assertEqual((set(), set()), scan.scan_imports(script))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""
+Test speculative installs and what they leave in the requirements file
+"""
+
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+# so we can import pipless
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import pipless
+from pipless.cooccurrence import CooccurrenceModel
+from pipless.installer import Wheelhouse
+
+
+# name -> dependencies of the fake installed distributions
+FAKE_DISTS = {
+    "spec-a":     ["dep-shared", "dep-a"],
+    "spec-b":     ["dep-b"],
+    "fg":         ["dep-shared"],
+    "dep-shared": [],
+    "dep-a":      [],
+    "dep-b":      [],
+}
+
+
+class FakeThread(object):
+    started = []
+
+    def __init__(self, target, args):
+        self.target = target
+        self.args = args
+        self.daemon = False
+
+    def start(self):
+        FakeThread.started.append(self)
+
+
+class FakeThreading(object):
+    Thread = FakeThread
+
+    def __getattr__(self, name):
+        import threading
+        return getattr(threading, name)
+
+
+class TestSpeculation(unittest.TestCase):
+    """
+    Test speculative installs with fake installed distributions
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.orig_cache_dir = pipless.CACHE_DIR
+        self.orig_cache_env = os.environ.get("PIPLESS_CACHE_DIR", None)
+        os.environ["PIPLESS_CACHE_DIR"] = pipless.CACHE_DIR = os.path.join(self.tmpdir, "cache")
+
+        self.site_dir = os.path.join(self.tmpdir, "site-packages")
+        for name, requires in FAKE_DISTS.items():
+            dist_info = os.path.join(self.site_dir, "{}-1.0.dist-info".format(name.replace("-", "_")))
+            os.makedirs(dist_info)
+            with open(os.path.join(dist_info, "METADATA"), "w") as f:
+                f.write("Metadata-Version: 2.1\nName: {}\nVersion: 1.0\n".format(name))
+                for dep in requires:
+                    f.write("Requires-Dist: {}\n".format(dep))
+        sys.path.append(self.site_dir)
+
+        self.hook = pipless.PipLess(
+            no_venv      = True,
+            requirements = False,
+            use_daemon   = False,
+            cache_opts   = dict(enabled=False),
+            index_opts   = dict(enabled=False),
+        )
+        self.hook.venv_home = os.path.join(self.tmpdir, "venv")
+        self.hook._is_importable = lambda fullname: False
+        self.hook._known_versions = {}
+        self.cooccurrence = CooccurrenceModel(os.path.join(self.tmpdir, "model.json"))
+        self.hook._cooccurrence = self.cooccurrence
+
+        FakeThread.started = []
+        self.hook._threading = FakeThreading()
+
+    def tearDown(self):
+        sys.path.remove(self.site_dir)
+        self.hook._refresh_pip()
+        pipless.CACHE_DIR = self.orig_cache_dir
+        if self.orig_cache_env is None:
+            os.environ.pop("PIPLESS_CACHE_DIR", None)
+        else:
+            os.environ["PIPLESS_CACHE_DIR"] = self.orig_cache_env
+        shutil.rmtree(self.tmpdir)
+
+    def _speculated(self, *names):
+        self.cooccurrence.speculate([(name.replace("-", "_"), name) for name in names])
+        self.hook._speculated_distros.update(names)
+
+    # ---------------------
+
+    def test_unused_speculation(self):
+        self._speculated("spec-a", "spec-b")
+        self.cooccurrence.record_hit("spec_b")
+        self.hook._note_requested(["fg>=1.0"])
+
+        # dep-shared stays, the foreground install needs it too
+        self.assertEqual(self.hook._unused_speculation(), set(["spec-a", "dep-a"]))
+
+    def test_all_speculation_used(self):
+        self._speculated("spec-a")
+        self.cooccurrence.record_hit("spec_a")
+        self.assertEqual(self.hook._unused_speculation(), set())
+
+    def test_on_exit_freezes_without_unused(self):
+        self._speculated("spec-a")
+        self.hook._changed_distros = {"spec-a": "1.0", "dep-a": "1.0", "fg": "1.0"}
+        self.hook._note_requested(["fg"])
+        self.hook.venv_parent_dir = self.tmpdir
+
+        frozen = []
+        self.hook._freeze_requirements = lambda req_path, exclude=(): frozen.append(sorted(exclude))
+        self.hook._on_exit()
+        self.assertEqual(self.hook._changed_distros, {"fg": "1.0"})
+        self.assertEqual(frozen, [["dep-a", "spec-a"]])
+
+    def test_speculate(self):
+        self.cooccurrence.model["runs"]["fg"] = 1
+        self.cooccurrence.model["pairs"]["fg"] = {"spec_a": 1}
+        self.cooccurrence.model["distros"]["spec_a"] = "spec-a"
+        self.hook._speculate(self.cooccurrence, "fg")
+
+        self.assertEqual(len(FakeThread.started), 1)
+        thread = FakeThread.started[0]
+        # the script's exit doesn't wait for speculative installs
+        self.assertTrue(thread.daemon)
+
+        build, install_cmds, site_packages_dirs, _, _ = thread.args
+        wheelhouse = Wheelhouse(os.path.join(pipless.CACHE_DIR, "wheelhouse")).path
+        build_cmd, build_dir, wheel_dir = build
+        self.assertEqual(build_cmd[1:5], ["-m", "pip", "wheel", "--quiet"])
+        self.assertEqual(build_cmd[-3:], ["--find-links", wheelhouse, "spec-a"])
+        self.assertEqual(wheel_dir, wheelhouse)
+        self.assertEqual(install_cmds[0][-4:], ["--no-index", "--find-links", wheelhouse, "spec-a"])
+        self.assertEqual(install_cmds[1][-3:], ["--find-links", wheelhouse, "spec-a"])
+        self.assertEqual(self.hook._speculated_distros, set(["spec-a"]))
+        shutil.rmtree(build_dir)
+
+    def test_speculate_from_wheelhouse(self):
+        self.hook.offline = True
+        self.cooccurrence.model["runs"]["fg"] = 1
+        self.cooccurrence.model["pairs"]["fg"] = {"spec_a": 1}
+        self.cooccurrence.model["distros"]["spec_a"] = "spec-a"
+        self.hook._speculate(self.cooccurrence, "fg")
+
+        build, install_cmds, _, _, _ = FakeThread.started[0].args
+        self.assertEqual(build, None)
+        self.assertEqual(len(install_cmds), 1)
+        self.assertTrue("--no-index" in install_cmds[0])
+
+    def test_track_speculative_installs(self):
+        stored = []
+        learned = []
+        self.hook._add_to_store = stored.append
+        self.hook._learn_mappings = learned.append
+        self.hook._known_versions = self.hook._installed_versions()
+        del self.hook._known_versions["spec-a"]
+
+        # nothing happens until a speculative install has finished
+        self.hook._track_speculative_installs()
+        self.assertEqual(stored, [])
+
+        self.hook._speculation_finished = True
+        self.hook._track_speculative_installs()
+        self.hook._track_speculative_installs()
+        self.assertEqual(stored, [["spec-a"]])
+        self.assertEqual(learned, [["spec-a"]])
+        self.assertEqual(self.hook._changed_distros, {"spec-a": "1.0"})
+
+
+if __name__ == "__main__":
+    unittest.main()
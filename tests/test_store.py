@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""
+Test the shared package store
+"""
+
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+# so we can import pipless
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from pip._vendor import pkg_resources
+from pipless.store import PackageStore
+
+
+class TestPackageStore(unittest.TestCase):
+    """
+    Test capturing distributions into the store and materializing them
+    into other environments
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.store_dir = os.path.join(self.tmpdir, "store")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _make_env(self, name):
+        site_packages = os.path.join(self.tmpdir, name, "lib", "site-packages")
+        bin_dir = os.path.join(self.tmpdir, name, "bin")
+        os.makedirs(site_packages)
+        os.makedirs(bin_dir)
+        return site_packages, bin_dir
+
+    def _write(self, path, data):
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, "w") as f:
+            f.write(data)
+
+    def _install_fake(self, site_packages, bin_dir, version, requires=()):
+        dist_info = os.path.join(site_packages, "foo-{}.dist-info".format(version))
+        self._write(os.path.join(site_packages, "foo", "__init__.py"), "VERSION = {!r}\n".format(version))
+        self._write(os.path.join(bin_dir, "foo"), "#!/somewhere/else/python\nimport foo\n")
+        self._write(os.path.join(dist_info, "METADATA"), "".join(
+            ["Metadata-Version: 2.0\nName: foo\nVersion: {}\n".format(version)] +
+            ["Requires-Dist: {}\n".format(req) for req in requires]
+        ))
+        self._write(os.path.join(dist_info, "RECORD"), "\n".join([
+            "foo/__init__.py,,",
+            "../../bin/foo,,",
+            "foo-{}.dist-info/METADATA,,".format(version),
+            "foo-{}.dist-info/RECORD,,".format(version),
+        ]) + "\n")
+        return list(pkg_resources.find_distributions(site_packages))[0]
+
+    # ---------------------
+
+    def test_capture_and_materialize(self):
+        site_packages, bin_dir = self._make_env("env1")
+        dist = self._install_fake(site_packages, bin_dir, "1.0")
+
+        store = PackageStore(self.store_dir, site_packages, bin_dir)
+        self.assertTrue(store.capture(dist))
+
+        site_packages2, bin_dir2 = self._make_env("env2")
+        store2 = PackageStore(self.store_dir, site_packages2, bin_dir2)
+        materialized = store2.materialize(pkg_resources.Requirement.parse("foo"), lambda name: False)
+        self.assertEqual(materialized, ["foo==1.0"])
+
+        init1 = os.path.join(site_packages, "foo", "__init__.py")
+        init2 = os.path.join(site_packages2, "foo", "__init__.py")
+        self.assertEqual(os.stat(init1).st_ino, os.stat(init2).st_ino)
+        self.assertTrue(os.path.exists(os.path.join(site_packages2, "foo-1.0.dist-info", "METADATA")))
+
+        with open(os.path.join(bin_dir2, "foo"), "r") as f:
+            self.assertEqual(f.readline().strip(), "#!" + sys.executable)
+
+    def test_find_version(self):
+        for version in ["1.0", "2.0"]:
+            site_packages, bin_dir = self._make_env("env-" + version)
+            dist = self._install_fake(site_packages, bin_dir, version)
+            PackageStore(self.store_dir, site_packages, bin_dir).capture(dist)
+
+        store = PackageStore(self.store_dir, site_packages, bin_dir)
+        parse = pkg_resources.Requirement.parse
+        self.assertEqual(store.find(parse("foo")), ("foo", "2.0"))
+        self.assertEqual(store.find(parse("foo<2")), ("foo", "1.0"))
+        self.assertEqual(store.find(parse("foo>2")), None)
+        self.assertEqual(store.find(parse("bar")), None)
+
+    def test_skip_installed(self):
+        site_packages, bin_dir = self._make_env("env1")
+        dist = self._install_fake(site_packages, bin_dir, "1.0")
+        store = PackageStore(self.store_dir, site_packages, bin_dir)
+        store.capture(dist)
+
+        materialized = store.materialize(pkg_resources.Requirement.parse("foo"), lambda name: True)
+        self.assertEqual(materialized, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
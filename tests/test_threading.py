@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""
+Test the import hook being entered from several threads at once
+"""
+
+
+import imp
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+# so we can import pipless
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import pipless
+
+
+class TestConcurrentFindModule(unittest.TestCase):
+    """
+    Test that concurrent imports of a name wait on a single install
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.orig_cache_dir = pipless.CACHE_DIR
+        self.orig_cache_env = os.environ.get("PIPLESS_CACHE_DIR", None)
+        os.environ["PIPLESS_CACHE_DIR"] = pipless.CACHE_DIR = self.tmpdir
+
+        self.hook = pipless.PipLess(
+            no_venv      = True,
+            requirements = False,
+            use_daemon   = False,
+        )
+        # as on python 3.3+, where imports of different modules don't share
+        # a lock. find_module is called from the threads directly
+        self.hook._concurrent_imports = True
+        self.calls = []
+        self.calls_lock = threading.Lock()
+        self.hook._install_if_missing = self._fake_install
+
+    def tearDown(self):
+        pipless.CACHE_DIR = self.orig_cache_dir
+        if self.orig_cache_env is None:
+            os.environ.pop("PIPLESS_CACHE_DIR", None)
+        else:
+            os.environ["PIPLESS_CACHE_DIR"] = self.orig_cache_env
+        shutil.rmtree(self.tmpdir)
+
+    def _fake_install(self, fullname):
+        with self.calls_lock:
+            self.calls.append(fullname)
+        time.sleep(0.2)
+        return "installed"
+
+    def _import_concurrently(self, names):
+        threads = [
+            threading.Thread(target=self.hook.find_module, args=(name,))
+            for name in names
+        ]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.time() - start
+
+    # ---------------------
+
+    def test_same_name_installed_once(self):
+        self._import_concurrently(["some_missing_module"] * 8)
+        self.assertEqual(self.calls, ["some_missing_module"])
+        self.assertTrue("some_missing_module" in self.hook._decided_names)
+        self.assertEqual(self.hook._in_flight, {})
+
+    def test_different_names_in_parallel(self):
+        names = ["some_missing_module_{}".format(i) for i in range(4)]
+        elapsed = self._import_concurrently(names)
+        self.assertEqual(sorted(self.calls), names)
+        # four sequential installs would take at least 0.8 seconds
+        self.assertTrue(elapsed < 0.6)
+
+    def test_reentrant(self):
+        def install_and_reimport(fullname):
+            self.calls.append(fullname)
+            # pip importing the name again while it is being resolved
+            self.hook.find_module(fullname)
+            return "installed"
+        self.hook._install_if_missing = install_and_reimport
+
+        self.hook.find_module("some_missing_module")
+        self.assertEqual(self.calls, ["some_missing_module"])
+
+
+class TestSerializedFindModule(unittest.TestCase):
+    """
+    Test the hook behind python 2's global import lock
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.orig_cache_dir = pipless.CACHE_DIR
+        self.orig_cache_env = os.environ.get("PIPLESS_CACHE_DIR", None)
+        os.environ["PIPLESS_CACHE_DIR"] = pipless.CACHE_DIR = self.tmpdir
+
+        self.hook = pipless.PipLess(
+            no_venv      = True,
+            requirements = False,
+            use_daemon   = False,
+        )
+        self.hook._concurrent_imports = False
+        self.calls = []
+
+    def tearDown(self):
+        if self.hook in sys.meta_path:
+            sys.meta_path.remove(self.hook)
+        pipless.CACHE_DIR = self.orig_cache_dir
+        if self.orig_cache_env is None:
+            os.environ.pop("PIPLESS_CACHE_DIR", None)
+        else:
+            os.environ["PIPLESS_CACHE_DIR"] = self.orig_cache_env
+        shutil.rmtree(self.tmpdir)
+
+    # ---------------------
+
+    def test_default(self):
+        self.assertEqual(
+            pipless.PipLess(no_venv=True, requirements=False, use_daemon=False)._concurrent_imports,
+            sys.version_info >= (3, 3)
+        )
+
+    @unittest.skipIf(sys.version_info >= (3, 3), "python 3.3+ has per-module import locks")
+    def test_imports_are_serialized(self):
+        running = []
+        def fake_install(fullname):
+            self.calls.append((fullname, imp.lock_held(), len(running)))
+            running.append(fullname)
+            time.sleep(0.05)
+            running.remove(fullname)
+            return "not on pypi"
+        self.hook._install_if_missing = fake_install
+        sys.meta_path.append(self.hook)
+
+        def import_missing(fullname):
+            try:
+                __import__(fullname)
+            except ImportError:
+                pass
+        names = ["some_missing_module_{}".format(i) for i in range(4)] * 2
+        threads = [threading.Thread(target=import_missing, args=(name,)) for name in names]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # each name once, never two at a time, and with the import lock held
+        self.assertEqual(sorted(call[0] for call in self.calls), sorted(set(names)))
+        self.assertTrue(all(held and others == 0 for _, held, others in self.calls))
+        self.assertEqual(self.hook._in_flight, {})
+
+    def test_reentrant(self):
+        def install_and_reimport(fullname):
+            self.calls.append(fullname)
+            # pip importing the name again while it is being resolved
+            self.hook.find_module(fullname)
+            return "installed"
+        self.hook._install_if_missing = install_and_reimport
+
+        self.hook.find_module("some_missing_module")
+        self.assertEqual(self.calls, ["some_missing_module"])
+        self.assertTrue("some_missing_module" in self.hook._decided_names)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""
+Test the cache of provisioned virtual environments
+"""
+
+
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import unittest
+
+# so we can import pipless
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from pipless.venv_cache import _copy_tree, requirement_set, template_key
+
+
+class TestTemplateKey(unittest.TestCase):
+    """
+    Test that the key only depends on the set of requirements
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, name, lines):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        return path
+
+    def _key(self, name, lines):
+        return template_key("interpreter", self._write(name, lines))
+
+    # ---------------------
+
+    def test_formatting_ignored(self):
+        key = self._key("a.txt", [
+            "six==1.10.0",
+            "requests[security]>=2.0,<3",
+            "--index-url https://example.com/simple",
+        ])
+        self.assertEqual(key, self._key("b.txt", [
+            "# the same requirements, reformatted",
+            "--index-url   https://example.com/simple",
+            "",
+            "Requests[security] >= 2.0, < 3  # http",
+            "six == 1.10.0",
+            "six==1.10.0",
+        ]))
+
+    def test_requirements_changed(self):
+        key = self._key("a.txt", ["six==1.10.0"])
+        self.assertNotEqual(key, self._key("b.txt", ["six==1.11.0"]))
+        self.assertNotEqual(key, self._key("c.txt", ["six==1.10.0", "tabulate"]))
+
+    def test_interpreter_and_site_packages(self):
+        path = self._write("a.txt", ["six==1.10.0"])
+        key = template_key("interpreter", path)
+        self.assertNotEqual(key, template_key("other interpreter", path))
+        self.assertNotEqual(key, template_key("interpreter", path, system_site_packages=True))
+
+    def test_includes(self):
+        self._write("base.txt", ["six==1.10.0", "-r requirements.txt"])
+        path = self._write("requirements.txt", ["-r base.txt", "tabulate==0.7.5"])
+        self.assertEqual(requirement_set(path), ["six==1.10.0", "tabulate==0.7.5"])
+
+        key = template_key("interpreter", path)
+        self._write("base.txt", ["six==1.11.0", "-r requirements.txt"])
+        self.assertNotEqual(key, template_key("interpreter", path))
+
+
+class TestCopyTree(unittest.TestCase):
+    """
+    Test copying a venv and rewriting the files that contain its path
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.src = os.path.join(self.tmpdir, "template")
+        self.dest = os.path.join(self.tmpdir, "copy")
+        self.final = os.path.join(self.tmpdir, "venv")
+        self.site_packages = os.path.join("lib", "python2.7", "site-packages")
+
+        self._write("bin/pip", "#!{}/bin/python\nimport pip\n".format(self.src), mode=0o755)
+        self._write("bin/activate", 'VIRTUAL_ENV="{}"\n'.format(self.src))
+        self._write("pyvenv.cfg", "home = /usr/bin\n")
+        self._write(self.site_packages + "/project.pth", "{}/src/project\n".format(self.src))
+        self._write(self.site_packages + "/project.egg-link", "{}/src/project\n.".format(self.src))
+        self._write(self.site_packages + "/setup.cfg", "[install]\nprefix={}\n".format(self.src))
+        self._write(self.site_packages + "/six.py", "# {}\n".format(self.src))
+        os.symlink(os.path.join(self.src, "lib"), os.path.join(self.src, "lib64"))
+        os.symlink("/usr/bin/python2.7", os.path.join(self.src, "bin", "python"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, rel_path, data, mode=None):
+        path = os.path.join(self.src, *rel_path.split("/"))
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, "w") as f:
+            f.write(data)
+        if mode is not None:
+            os.chmod(path, mode)
+
+    def _read(self, rel_path):
+        with open(os.path.join(self.dest, *rel_path.split("/")), "r") as f:
+            return f.read()
+
+    def _same_file(self, rel_path):
+        src_stat = os.stat(os.path.join(self.src, *rel_path.split("/")))
+        dest_stat = os.stat(os.path.join(self.dest, *rel_path.split("/")))
+        return (src_stat.st_dev, src_stat.st_ino) == (dest_stat.st_dev, dest_stat.st_ino)
+
+    # ---------------------
+
+    def test_scripts(self):
+        _copy_tree(self.src, self.dest, link=True, final_root=self.final)
+        self.assertEqual(self._read("bin/pip"), "#!{}/bin/python\nimport pip\n".format(self.final))
+        self.assertEqual(self._read("bin/activate"), 'VIRTUAL_ENV="{}"\n'.format(self.final))
+        mode = stat.S_IMODE(os.stat(os.path.join(self.dest, "bin", "pip")).st_mode)
+        self.assertEqual(mode, 0o755)
+        self.assertFalse(self._same_file("bin/pip"))
+
+    def test_path_files(self):
+        _copy_tree(self.src, self.dest, link=True, final_root=self.final)
+        sp = self.site_packages + "/"
+        self.assertEqual(self._read(sp + "project.pth"), "{}/src/project\n".format(self.final))
+        self.assertEqual(self._read(sp + "project.egg-link"), "{}/src/project\n.".format(self.final))
+        self.assertEqual(self._read(sp + "setup.cfg"), "[install]\nprefix={}\n".format(self.final))
+
+    def test_other_files_linked(self):
+        _copy_tree(self.src, self.dest, link=True, final_root=self.final)
+        # only scripts and path files are rewritten
+        sp = self.site_packages + "/"
+        self.assertEqual(self._read(sp + "six.py"), "# {}\n".format(self.src))
+        self.assertTrue(self._same_file(sp + "six.py"))
+        # path files that don't contain the path need no rewrite either
+        self.assertTrue(self._same_file("pyvenv.cfg"))
+
+    def test_copy(self):
+        _copy_tree(self.src, self.dest, link=False)
+        self.assertFalse(self._same_file(self.site_packages + "/six.py"))
+        self.assertEqual(self._read("bin/pip"), "#!{}/bin/python\nimport pip\n".format(self.dest))
+
+    def test_symlinks(self):
+        _copy_tree(self.src, self.dest, link=True, final_root=self.final)
+        self.assertEqual(os.readlink(os.path.join(self.dest, "lib64")), os.path.join(self.final, "lib"))
+        self.assertEqual(os.readlink(os.path.join(self.dest, "bin", "python")), "/usr/bin/python2.7")
+
+
+if __name__ == "__main__":
+    unittest.main()
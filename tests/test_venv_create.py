@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""
+Test creating a virtual environment that can run pipless
+"""
+
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+# so we can import pipless
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import pipless
+
+
+def _can_create_venvs():
+    try:
+        import venv
+        return True
+    except ImportError:
+        pass
+    try:
+        import virtualenv
+    except ImportError:
+        return False
+    return hasattr(virtualenv, "create_environment")
+
+
+@unittest.skipIf(not _can_create_venvs(), "neither venv nor virtualenv is available")
+class TestCreateVenv(unittest.TestCase):
+    """
+    Test creating a venv in process and importing pipless from its interpreter
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.orig_cache_dir = pipless.CACHE_DIR
+        self.orig_cache_env = os.environ.get("PIPLESS_CACHE_DIR", None)
+        os.environ["PIPLESS_CACHE_DIR"] = pipless.CACHE_DIR = os.path.join(self.tmpdir, "cache")
+
+        self.venv_home = os.path.join(self.tmpdir, "venv")
+        self.hook = pipless.PipLess(
+            venv_path    = self.venv_home,
+            no_venv      = True,
+            requirements = False,
+            use_daemon   = False,
+            venv_opts    = dict(templates=False, without_pip=True),
+            cache_opts   = dict(enabled=False),
+            index_opts   = dict(enabled=False),
+        )
+
+    def tearDown(self):
+        pipless.CACHE_DIR = self.orig_cache_dir
+        if self.orig_cache_env is None:
+            os.environ.pop("PIPLESS_CACHE_DIR", None)
+        else:
+            os.environ["PIPLESS_CACHE_DIR"] = self.orig_cache_env
+        shutil.rmtree(self.tmpdir)
+
+    def _venv_python(self):
+        if os.name == "nt":
+            return os.path.join(self.venv_home, "Scripts", "python.exe")
+        return os.path.join(self.venv_home, "bin", "python")
+
+    # ---------------------
+
+    def test_create(self):
+        self.hook._create_virtual_env()
+        self.assertTrue(os.path.exists(self._venv_python()))
+
+        # only the linked copy of pipless (and six) can be imported, the
+        # source tree isn't on the venv's path
+        proc = subprocess.Popen(
+            [
+                self._venv_python(), "-c",
+                "import os, sys, pipless; print(os.path.realpath(sys.prefix)); "
+                "print(os.path.dirname(os.path.realpath(pipless.__file__)))"
+            ],
+            cwd    = self.tmpdir,
+            stdout = subprocess.PIPE,
+            stderr = subprocess.STDOUT
+        )
+        output, _ = proc.communicate()
+        output = output.decode("utf-8")
+        self.assertEqual(proc.returncode, 0, output)
+
+        prefix, pipless_dir = output.strip().splitlines()[-2:]
+        self.assertEqual(prefix, os.path.realpath(self.venv_home))
+        self.assertEqual(pipless_dir, os.path.dirname(os.path.realpath(pipless.__file__)))
+
+    def test_existing(self):
+        self.hook._create_virtual_env()
+        marker = os.path.join(self.venv_home, "marker")
+        open(marker, "w").close()
+
+        # without --clear an existing venv is left alone
+        self.hook._create_virtual_env()
+        self.assertTrue(os.path.exists(marker))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""
+Test finding wheels in the local wheelhouse
+"""
+
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+# so we can import pipless
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from pipless.installer import Wheelhouse, wheel_name_version
+
+
+class TestWheelhouse(unittest.TestCase):
+    """
+    Test matching requirements against the wheels in a wheelhouse
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.wheelhouse = Wheelhouse(self.tmpdir)
+        self.wheelhouse.ensure_exists()
+        for filename in [
+                "six-1.10.0-py2.py3-none-any.whl",
+                "six-1.11.0-py2.py3-none-any.whl",
+                "python_dateutil-2.6.1-1-py2.py3-none-any.whl",
+                "notawheel-1.0.tar.gz"]:
+            open(os.path.join(self.wheelhouse.path, filename), "w").close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    # ---------------------
+
+    def test_wheel_name_version(self):
+        self.assertEqual(wheel_name_version("six-1.10.0-py2.py3-none-any.whl"), ("six", "1.10.0"))
+        self.assertEqual(wheel_name_version("six-1.10.0.tar.gz"), None)
+
+    def test_find(self):
+        self.assertEqual(self.wheelhouse.find("six"), "1.11.0")
+        self.assertEqual(self.wheelhouse.find("six<1.11"), "1.10.0")
+        self.assertEqual(self.wheelhouse.find("six>2"), None)
+        self.assertEqual(self.wheelhouse.find("python-dateutil"), "2.6.1")
+        self.assertEqual(self.wheelhouse.find("notawheel"), None)
+
+    def test_missing(self):
+        self.assertEqual(
+            self.wheelhouse.missing(["six==1.10.0", "tabulate", "git+https://example.com/x.git"]),
+            ["tabulate", "git+https://example.com/x.git"]
+        )
+
+    def test_find_project(self):
+        self.assertEqual(self.wheelhouse.find_project("python_dateutil"), "python-dateutil")
+        self.assertEqual(self.wheelhouse.find_project("tabulate"), None)
+
+
+if __name__ == "__main__":
+    unittest.main()